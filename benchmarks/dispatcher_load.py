@@ -0,0 +1,318 @@
+"""
+Нагрузочный тест конвейера dispatcher -> middleware -> хендлеры без сети.
+
+Синтетические Update подаются прямо в Dispatcher из bot/main.py
+(create_dispatcher), Bot API заменён сессией-заглушкой, БД — временный
+SQLite (или DATABASE_URL, если задан). Для каждого сценария: пропускная
+способность, p50/p99 задержки апдейта и память на апдейт.
+
+    python -m benchmarks.dispatcher_load --updates 2000 --concurrency 50
+    python -m benchmarks.dispatcher_load --save benchmarks/dispatcher_baseline.json
+    python -m benchmarks.dispatcher_load --baseline benchmarks/dispatcher_baseline.json --tolerance 0.5
+
+Рядом с каждым сценарием в том же прогоне меряется "голый" Dispatcher
+(без middleware, хендлер только отвечает через ту же заглушку Bot API).
+overhead — во сколько раз конвейер медленнее голого диспетчера: скорость
+машины сокращается, поэтому число сравнимо между ноутбуком и CI-раннером.
+С --baseline код возврата 1, если overhead вырос больше чем на --tolerance
+(доля) — так тест работает в CI. Абсолютные updates/s и p99 только выводятся.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import sys
+import tempfile
+import tracemalloc
+from dataclasses import asdict, dataclass
+from itertools import count
+from statistics import median, quantiles
+from time import perf_counter
+from typing import Any, Callable, Dict, List
+
+SCENARIOS = ("start", "profile", "info", "callback", "text")
+BASE_USER_ID = 500_000_000
+
+
+def _configure_env(db_dir: str) -> None:
+    # До импорта bot.*: модули читают окружение при импорте
+    os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{os.path.join(db_dir, 'bench.db')}")
+    os.environ.setdefault("BOT_TOKEN", "42:BENCHMARK")
+    os.environ.setdefault("CHANNEL_ID", "@armtemiy")
+    os.environ.setdefault("FSM_STORAGE", "memory")
+    os.environ.setdefault("RATE_LIMIT_BACKEND", "memory")
+    # Лимит заведомо выше нагрузки теста: меряем обработку, а не отказы
+    os.environ.setdefault("RATE_LIMIT_DEFAULT", "1000000/60")
+    os.environ.setdefault("METRICS_PORT", "0")
+    os.environ.setdefault("USER_CACHE_FEED", "off")
+    os.environ["LOG_FILE"] = ""
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+
+def _mocked_session(api_latency: float):
+    from aiogram.client.session.base import BaseSession
+    from aiogram.methods import GetChatMember, SendMessage
+    from aiogram.types import Chat, ChatMemberMember, Message, User
+
+    class MockedSession(BaseSession):
+        """Отвечает на вызовы Bot API без сети; api_latency — имитация RTT"""
+
+        def __init__(self) -> None:
+            super().__init__()
+            self.calls: Dict[str, int] = {}
+            self._message_ids = count(1)
+
+        async def make_request(self, bot, method, timeout=None):
+            name = type(method).__name__
+            self.calls[name] = self.calls.get(name, 0) + 1
+            if api_latency:
+                await asyncio.sleep(api_latency)
+            if isinstance(method, SendMessage):
+                return Message(
+                    message_id=next(self._message_ids),
+                    date=1700000000,
+                    chat=Chat(id=method.chat_id, type="private"),
+                    text=method.text,
+                )
+            if isinstance(method, GetChatMember):
+                return ChatMemberMember(user=User(id=method.user_id, is_bot=False, first_name="Bench"))
+            return True
+
+        async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+            yield b""
+
+        async def close(self) -> None:
+            pass
+
+    return MockedSession()
+
+
+def _message(update_id: int, user_id: int, text: str) -> dict:
+    return {
+        "message_id": update_id,
+        "date": 1700000000,
+        "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": "Bench", "username": f"bench{user_id}"},
+        "text": text,
+    }
+
+
+def build_update(scenario: str, update_id: int, user_id: int) -> dict:
+    if scenario == "callback":
+        return {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "chat_instance": "bench",
+                "from": {"id": user_id, "is_bot": False, "first_name": "Bench"},
+                "message": _message(update_id, user_id, "👋 Привет!"),
+                "data": "check_subscription",
+            },
+        }
+    text = {"start": "/start", "profile": "/profile", "info": "ℹ️ Инфо", "text": "просто сообщение"}[scenario]
+    message = _message(update_id, user_id, text)
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text)}]
+    return {"update_id": update_id, "message": message}
+
+
+@dataclass
+class ScenarioResult:
+    scenario: str
+    updates: int
+    throughput: float  # апдейтов в секунду
+    p50_ms: float
+    p99_ms: float
+    peak_kib: float  # пик выделенной памяти на 1000 апдейтов
+    retained_kib: float  # осталось после 1000 апдейтов (кэши, хранилища)
+    bare_throughput: float = 0.0  # голый Dispatcher в том же прогоне
+    bare_p99_ms: float = 0.0
+
+    @property
+    def overhead(self) -> float:
+        """Во сколько раз конвейер медленнее голого диспетчера"""
+        return self.bare_throughput / self.throughput if self.throughput else 0.0
+
+
+async def _feed(dp, bot, updates: List[Any], concurrency: int) -> List[float]:
+    durations: List[float] = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def feed(update) -> None:
+        async with semaphore:
+            started = perf_counter()
+            await dp.feed_update(bot, update)
+            durations.append(perf_counter() - started)
+
+    await asyncio.gather(*(feed(update) for update in updates))
+    return durations
+
+
+def bare_dispatcher():
+    """Эталон для сравнения: без middleware и сервисов, ответ через ту же заглушку Bot API"""
+    from aiogram import Dispatcher, Router
+
+    router = Router(name="bare")
+
+    @router.message()
+    async def reply(message) -> None:
+        await message.answer("ok")
+
+    @router.callback_query()
+    async def answer(callback) -> None:
+        await callback.answer()
+
+    dp = Dispatcher()
+    dp.include_router(router)
+    return dp
+
+
+async def _timed(dp, bot, updates: List[Any], concurrency: int) -> tuple:
+    started = perf_counter()
+    durations = await _feed(dp, bot, updates, concurrency)
+    return durations, perf_counter() - started
+
+
+async def run_scenario(
+    dp, bare, bot, scenario: str, updates: int, users: int, concurrency: int, ids: Callable[[], int],
+    rounds: int = 1,
+) -> ScenarioResult:
+    from aiogram.types import Update
+
+    def batch(size: int) -> List[Update]:
+        # context={"bot": ...} — как при polling/webhook, иначе feed_update валидирует апдейт повторно
+        return [
+            Update.model_validate(build_update(scenario, ids(), BASE_USER_ID + index % users), context={"bot": bot})
+            for index in range(size)
+        ]
+
+    # Прогрев (кэши, ленивые импорты), затем замер времени без трассировки памяти.
+    # Голый диспетчер и конвейер чередуются раундами — в одних и тех же условиях машины,
+    # в зачёт идёт медиана раундов
+    await _feed(dp, bot, batch(min(users, updates)), concurrency)
+    await _feed(bare, bot, batch(min(users, updates)), concurrency)
+    durations: List[float] = []
+    bare_durations: List[float] = []
+    rates: List[float] = []
+    bare_rates: List[float] = []
+    for _ in range(rounds):
+        round_durations, bare_elapsed = await _timed(bare, bot, batch(updates), concurrency)
+        bare_durations.extend(round_durations)
+        bare_rates.append(updates / bare_elapsed)
+        round_durations, elapsed = await _timed(dp, bot, batch(updates), concurrency)
+        durations.extend(round_durations)
+        rates.append(updates / elapsed)
+
+    # Память — отдельным прогоном: tracemalloc заметно замедляет выполнение
+    memory_updates = min(updates, 1000)
+    memory_batch = batch(memory_updates)
+    gc.collect()
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    await _feed(dp, bot, memory_batch, concurrency)
+    del memory_batch
+    # Колбэки завершения задач ещё держат апдейты до следующей итерации цикла
+    await asyncio.sleep(0)
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    cuts = quantiles(durations, n=100)
+    return ScenarioResult(
+        scenario=scenario,
+        updates=updates,
+        throughput=median(rates),
+        p50_ms=cuts[49] * 1000,
+        p99_ms=cuts[98] * 1000,
+        peak_kib=(peak - baseline) / 1024 * 1000 / memory_updates,
+        retained_kib=(retained - baseline) / 1024 * 1000 / memory_updates,
+        bare_throughput=median(bare_rates),
+        bare_p99_ms=quantiles(bare_durations, n=100)[98] * 1000,
+    )
+
+
+async def run(args) -> List[ScenarioResult]:
+    from aiogram import Bot
+
+    from bot.db.database import engine, init_db
+    from bot.main import create_dispatcher
+    from bot.middlewares.metrics import setup_bot_metrics
+    from bot.utils.logs import stop_logging
+
+    if not await init_db():
+        raise SystemExit("database init failed")
+    bot = Bot(token=os.environ["BOT_TOKEN"], session=_mocked_session(args.api_latency_ms / 1000))
+    setup_bot_metrics(bot)
+    dp = create_dispatcher(resume_broadcasts=False, metrics_port=0)
+    bare = bare_dispatcher()
+    ids = count(1).__next__
+    results = []
+    try:
+        # start идёт первым: регистрирует пользователей для profile/callback
+        for scenario in args.scenarios:
+            results.append(await run_scenario(
+                dp, bare, bot, scenario, args.updates, args.users, args.concurrency, ids, args.rounds,
+            ))
+    finally:
+        await dp.storage.close()
+        await engine.dispose()
+        stop_logging()
+    return results
+
+
+def compare(results: List[ScenarioResult], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    """Сравнивает overhead относительно голого диспетчера, а не абсолютные числа конкретной машины"""
+    regressions = []
+    for result in results:
+        reference = baseline.get(result.scenario)
+        if not reference or not reference.get("overhead"):
+            continue
+        if result.overhead > reference["overhead"] * (1 + tolerance):
+            regressions.append(
+                f"{result.scenario}: overhead x{result.overhead:.1f} > baseline x{reference['overhead']:.1f}"
+            )
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=2000, help="апдейтов на сценарий")
+    parser.add_argument("--users", type=int, default=500, help="разных пользователей")
+    parser.add_argument("--concurrency", type=int, default=50, help="апдейтов в обработке одновременно")
+    parser.add_argument("--rounds", type=int, default=5, help="раундов голый диспетчер / конвейер (медиана)")
+    parser.add_argument("--api-latency-ms", type=float, default=0.0, help="задержка ответа Bot API")
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=SCENARIOS)
+    parser.add_argument("--save", help="записать результаты в JSON (baseline)")
+    parser.add_argument("--baseline", help="сравнить с сохранёнными результатами")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="допустимая деградация (доля)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as db_dir:
+        _configure_env(db_dir)
+        results = asyncio.run(run(args))
+
+    print(f"{args.updates} updates/scenario, {args.users} users, concurrency {args.concurrency}, "
+          f"api latency {args.api_latency_ms} ms")
+    print(f"{'scenario':<10} {'updates/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'bare/s':>8} {'overhead':>9} "
+          f"{'peak KiB/1k':>12} {'retained KiB/1k':>16}")
+    for r in results:
+        print(f"{r.scenario:<10} {r.throughput:>10.0f} {r.p50_ms:>8.2f} {r.p99_ms:>8.2f} {r.bare_throughput:>8.0f} "
+              f"{'x' + format(r.overhead, '.1f'):>9} {r.peak_kib:>12.0f} {r.retained_kib:>16.0f}")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as file:
+            json.dump({r.scenario: {**asdict(r), "overhead": r.overhead} for r in results}, file, indent=2)
+            file.write("\n")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Стоимость логирования на один апдейт для event loop: старая схема
+(синхронные синки, f-строки) против очереди с JSON и семплированием.
+
+    python -m benchmarks.logging_overhead --updates 20000
+
+Пишем в настоящие файлы во временной папке, stdout заменён на /dev/null.
+--slow-io-ms добавляет задержку на каждую запись в stdout — так ведёт себя
+забитый pipe у docker/journald. "caller" — время в потоке event loop,
+"total" — вместе с дописыванием очереди.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+from time import perf_counter, sleep
+
+from loguru import logger
+
+from bot.utils import logs
+
+OLD_FORMAT = logs.TEXT_FORMAT
+
+
+class SlowStream:
+    def __init__(self, stream, delay: float) -> None:
+        self._stream = stream
+        self._delay = delay
+
+    def write(self, text: str) -> int:
+        if self._delay:
+            sleep(self._delay)
+        return self._stream.write(text)
+
+    def flush(self) -> None:
+        self._stream.flush()
+
+    def isatty(self) -> bool:
+        return False
+
+
+def _setup_before(log_dir: str, stdout) -> None:
+    # Как было в bot/main.py до очереди
+    logger.remove()
+    logger.add(stdout, format=OLD_FORMAT, level="INFO", colorize=True)
+    logger.add(os.path.join(log_dir, "before.log"), rotation="10 MB", level="DEBUG")
+
+
+def _setup_after(log_dir: str, stdout, sample_rates: str, fmt: str) -> None:
+    logs.setup_logging(
+        stream=stdout,
+        log_file=os.path.join(log_dir, "after.log"),
+        fmt=fmt,
+        sample_rates=sample_rates,
+    )
+
+
+def _update_before(update_id: int, user_id: int, username: str) -> None:
+    logging.getLogger("aiogram.event").info("Update id=%s is handled. Duration 3 ms by bot id=1", update_id)
+    logger.info(f"User {user_id} (@{username}) started bot")
+    logger.debug(f"cache hit for {user_id}")
+
+
+def _update_after(update_id: int, user_id: int, username: str) -> None:
+    logging.getLogger("aiogram.event").info("Update id=%s is handled. Duration 3 ms by bot id=1", update_id)
+    logs.hot_logger.info("User {} (@{}) started bot", user_id, username)
+    logs.hot_logger.debug("cache hit for {}", user_id)
+
+
+async def _run(update, updates: int) -> tuple[float, float]:
+    started = perf_counter()
+    for update_id in range(updates):
+        update(update_id, 100000 + update_id % 500, "tester")
+    caller = perf_counter() - started
+    await logs.flush_logs()
+    return caller, perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=20000)
+    parser.add_argument("--sample-rates", default=logs.LOG_SAMPLE_RATES)
+    parser.add_argument("--format", default=logs.LOG_FORMAT, choices=("text", "json"))
+    parser.add_argument("--slow-io-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    root_handlers = logging.root.handlers[:]
+    results = []
+    with tempfile.TemporaryDirectory() as log_dir, open(os.devnull, "w") as devnull:
+        stdout = SlowStream(devnull, args.slow_io_ms / 1000)
+        _setup_before(log_dir, stdout)
+        results.append(("before: sync sinks", *asyncio.run(_run(_update_before, args.updates))))
+
+        _setup_after(log_dir, stdout, args.sample_rates, args.format)
+        name = f"after: queue, {args.format} ({args.sample_rates})"
+        results.append((name, *asyncio.run(_run(_update_after, args.updates))))
+
+        logs.stop_logging()
+        logging.root.handlers = root_handlers
+
+    logger.add(sys.stderr)
+    print(f"{args.updates} updates, 3 log calls each, stdout delay {args.slow_io_ms} ms/write")
+    print(f"{'mode':<45} {'caller us/update':>17} {'total us/update':>16}")
+    for name, caller, total in results:
+        print(f"{name:<45} {caller / args.updates * 1e6:>17.1f} {total / args.updates * 1e6:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Подбор партнёров на синтетических профилях: векторный проход ProfileMatrix
+против попарного расчёта в Python, попадание в кэш и сброс кэша при
+изменении одного профиля.
+
+    python -m benchmarks.matching --sizes 10000 30000 100000 --queries 200
+
+Профили разбросаны вокруг нескольких городов, чтобы в радиусе MATCH_MAX_KM
+были тысячи кандидатов, как в плотном городе.
+"""
+import argparse
+import asyncio
+import random
+from dataclasses import replace
+from statistics import mean, quantiles
+from time import perf_counter
+from typing import List
+
+from bot.services.matching import MATCH_MAX_KM, MatchingService, ProfileMatrix, pair_penalty
+from bot.services.nearby import PartnerLocation
+
+CITIES = ((55.75, 37.62), (59.94, 30.31), (56.84, 60.61), (55.03, 82.92), (43.24, 76.89))
+
+
+def synthetic_profiles(count: int, seed: int = 1) -> List[PartnerLocation]:
+    rng = random.Random(seed)
+    profiles = []
+    for telegram_id in range(1, count + 1):
+        lat, lon = rng.choice(CITIES)
+        profiles.append(PartnerLocation(
+            telegram_id=telegram_id,
+            first_name=f"P{telegram_id}",
+            latitude=lat + rng.gauss(0, 0.3),
+            longitude=lon + rng.gauss(0, 0.5),
+            hand=rng.choice(("left", "right", "right", "both")),
+            style=rng.choice(("outside", "inside", "both")),
+            weight_kg=rng.choice((None, rng.randint(55, 130))),
+            experience_years=rng.choice((None, rng.randint(0, 15))),
+        ))
+    return profiles
+
+
+def _python_top_k(profiles: List[PartnerLocation], me: PartnerLocation, limit: int, max_km: float) -> list:
+    scored = [
+        (penalty, other.telegram_id)
+        for other in profiles
+        if other.telegram_id != me.telegram_id and (penalty := pair_penalty(me, other, max_km)) != float("inf")
+    ]
+    return sorted(scored)[:limit]
+
+
+def _ms(samples: List[float]) -> str:
+    p99 = quantiles(samples, n=100)[98] if len(samples) >= 2 else samples[0]
+    return f"{mean(samples) * 1000:8.2f} {p99 * 1000:8.2f}"
+
+
+def run(size: int, queries: int, python_queries: int, limit: int, cached_users: int) -> None:
+    profiles = synthetic_profiles(size)
+    rng = random.Random(2)
+
+    started = perf_counter()
+    matrix = ProfileMatrix()
+    for profile in profiles:
+        matrix.upsert(profile)
+    build = perf_counter() - started
+
+    users = [rng.choice(profiles) for _ in range(queries)]
+    vectorized = []
+    for me in users:
+        started = perf_counter()
+        matrix.top_k(me, limit, MATCH_MAX_KM)
+        vectorized.append(perf_counter() - started)
+
+    python = []
+    for me in users[:python_queries]:
+        started = perf_counter()
+        _python_top_k(profiles, me, limit, MATCH_MAX_KM)
+        python.append(perf_counter() - started)
+
+    # Сервис поверх готовой матрицы (без БД): кэш и точечный сброс
+    service = MatchingService(limit=limit, refresh_interval=float("inf"), cache_size=cached_users * 2)
+    service.index = matrix
+    service._refreshed_at = 0.0
+
+    async def cache_scenario():
+        warm = [profile.telegram_id for profile in profiles[:cached_users]]
+        for telegram_id in warm:
+            await service.matches(telegram_id)
+        hits = []
+        for telegram_id in warm[:queries]:
+            started = perf_counter()
+            await service.matches(telegram_id)
+            hits.append(perf_counter() - started)
+        moved = replace(profiles[-1], latitude=profiles[0].latitude, longitude=profiles[0].longitude)
+        service.index.upsert(moved)
+        before = len(service._cache)
+        started = perf_counter()
+        service._on_changed([moved.telegram_id])
+        return hits, perf_counter() - started, before - len(service._cache)
+
+    hits, invalidation, dropped = asyncio.run(cache_scenario())
+
+    print(f"\n{size} profiles: build {build * 1000:.0f} ms")
+    print(f"{'':<28} {'mean ms':>8} {'p99 ms':>8}")
+    print(f"{'vectorized top-' + str(limit):<28} {_ms(vectorized)}")
+    print(f"{'python pairwise':<28} {_ms(python)}  (x{mean(python) / mean(vectorized):.0f})")
+    print(f"{'cached result':<28} {_ms(hits)}")
+    print(f"{'invalidate on 1 change':<28} {invalidation * 1000:8.2f}  ({dropped} of {cached_users} cached dropped)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 30_000, 100_000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--python-queries", type=int, default=5, help="попарный расчёт медленный — меньше запросов")
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--cached-users", type=int, default=1000)
+    args = parser.parse_args()
+    for size in args.sizes:
+        run(size, args.queries, args.python_queries, args.limit, args.cached_users)
+
+
+if __name__ == "__main__":
+    main()
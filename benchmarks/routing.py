@@ -0,0 +1,103 @@
+"""
+Стоимость маршрутизации одного сообщения при большом числе роутеров:
+обычная цепочка фильтров против хеш-таблицы точных маршрутов
+(bot/middlewares/routing.py). Хендлеры пустые, Bot API не вызывается —
+меряется только путь Dispatcher -> роутеры -> хендлер.
+
+    python -m benchmarks.routing --routers 4 50 200 --updates 5000
+
+Кнопка, на которую жмут, зарегистрирована в последнем роутере — худший
+случай для цепочки (как "⚙️ Админка" после start, menu и nearby).
+"""
+import argparse
+import asyncio
+from statistics import mean, quantiles
+from time import perf_counter
+from typing import List
+
+from aiogram import Bot, Dispatcher, Router
+from aiogram.filters import Command
+from aiogram.types import Update
+from loguru import logger
+
+from bot.middlewares.routing import setup_exact_routing
+from bot.utils.routing import ExactText
+
+HANDLERS_PER_ROUTER = 3
+TARGET_TEXTS = ("⚙️ Админка", "/admin", "/admin arg")
+
+
+def _build(routers: int, exact: bool) -> Dispatcher:
+    dp = Dispatcher()
+
+    async def noop(message) -> None:
+        return None
+
+    for index in range(routers):
+        router = Router(name=f"r{index}")
+        for handler in range(HANDLERS_PER_ROUTER):
+            router.message(Command(f"cmd{index}_{handler}"))(noop)
+            router.message(ExactText(f"button {index}/{handler}"))(noop)
+        if index == routers - 1:
+            router.message(Command("admin"))(noop)
+            router.message(ExactText("⚙️ Админка"))(noop)
+        dp.include_router(router)
+    if exact:
+        setup_exact_routing(dp)
+    return dp
+
+
+def _updates(bot: Bot, count: int) -> List[Update]:
+    return [
+        Update.model_validate({
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": 1700000000,
+                "chat": {"id": 1, "type": "private"},
+                "from": {"id": 1, "is_bot": False, "first_name": "Bench"},
+                "text": TARGET_TEXTS[update_id % len(TARGET_TEXTS)],
+            },
+        }, context={"bot": bot})
+        for update_id in range(count)
+    ]
+
+
+async def _measure(dp: Dispatcher, bot: Bot, updates: List[Update]) -> List[float]:
+    for update in updates[:200]:  # Прогрев
+        await dp.feed_update(bot, update)
+    samples = []
+    for update in updates:
+        started = perf_counter()
+        await dp.feed_update(bot, update)
+        samples.append(perf_counter() - started)
+    return samples
+
+
+def _us(samples: List[float]) -> str:
+    return f"{mean(samples) * 1e6:9.1f} {quantiles(samples, n=100)[98] * 1e6:9.1f}"
+
+
+async def run(router_counts: List[int], updates_count: int) -> None:
+    bot = Bot(token="42:BENCHMARK")
+    updates = _updates(bot, updates_count)
+    print(f"{'routers':>8} {'handlers':>9} {'chain us':>9} {'p99':>9} {'exact us':>9} {'p99':>9}")
+    for routers in router_counts:
+        chain = await _measure(_build(routers, exact=False), bot, updates)
+        exact = await _measure(_build(routers, exact=True), bot, updates)
+        handlers = routers * HANDLERS_PER_ROUTER * 2 + 2
+        print(f"{routers:>8} {handlers:>9} {_us(chain)} {_us(exact)}  (x{mean(chain) / mean(exact):.1f})")
+    await bot.session.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--routers", type=int, nargs="+", default=[4, 50, 200])
+    parser.add_argument("--updates", type=int, default=5000)
+    args = parser.parse_args()
+    logger.disable("bot")
+    asyncio.run(run(args.routers, args.updates))
+
+
+if __name__ == "__main__":
+    main()
@@ -8,6 +8,8 @@ WEBAPP_URL = os.getenv("WEBAPP_URL", "https://armtemiy.github.io/armtemiy-lab/")
 CHANNEL_ID = os.getenv("CHANNEL_ID", "@armtemiy")
 CHANNEL_URL = os.getenv("CHANNEL_URL", "https://t.me/armtemiy")
 DATABASE_URL = os.getenv("DATABASE_URL")
+# Способ получения апдейтов: polling | webhook (настройки вебхука — в bot/webhook.py)
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
 
 # Поддержка списка админов через запятую "123,456"
 admin_ids_str = os.getenv("ADMIN_IDS", os.getenv("ADMIN_ID", "0"))
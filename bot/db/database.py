@@ -1,11 +1,28 @@
+import asyncio
+import hashlib
 import os
+import re
 import ssl
+from dataclasses import dataclass
+from functools import lru_cache
+from time import monotonic, perf_counter
+from typing import List
+from uuid import uuid4
 
 from loguru import logger
+from sqlalchemy import delete, event, insert, inspect, select, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
-from sqlalchemy.pool import NullPool
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
+from sqlalchemy.util import greenlet_spawn
+from sqlalchemy.util.queue import Empty
 
-from bot.db.models import Base
+from bot.db.health import CircuitBreaker, DatabaseHealthCheck, is_outage_error
+from bot.db.models import Base, SchemaVersion
+from bot.utils.deadline import remaining
+from bot.utils.metrics import DB_QUERY_LATENCY
 
 # Получаем URL БД из переменных окружения
 DATABASE_URL = os.getenv("DATABASE_URL")
@@ -14,30 +31,326 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if DATABASE_URL and "?" in DATABASE_URL:
     DATABASE_URL = DATABASE_URL.split("?")[0]
 
+# Режим пула: "queue" — держим соединения открытыми (без TLS-рукопожатия на каждый запрос),
+# "null" — каждый раз новое соединение, пулом целиком управляет Supabase Pooler
+DB_POOL_MODE = os.getenv("DB_POOL_MODE", "queue").lower()
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Пулер Supabase рвёт простаивающие соединения — пересоздаём их раньше
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "300"))
+# Закрывать соединения, простоявшие в пуле дольше (секунды; 0 — не закрывать). pool_recycle
+# проверяется только при выдаче, а при LIFO нижние соединения не выдаются вовсе
+DB_POOL_IDLE = float(os.getenv("DB_POOL_IDLE", "300"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+# pgbouncer / Supabase transaction pooler (порт 6543) не поддерживает prepared statements между транзакциями
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "auto").lower()
+# Сколько ждать БД на старте: дольше — стартуем без неё, а не висим на таймауте коннекта
+DB_INIT_TIMEOUT = float(os.getenv("DB_INIT_TIMEOUT", "10"))
+# Таймауты asyncpg: подключение и выполнение одного запроса. Дольше ждать нет смысла —
+# после нескольких таких ошибок предохранитель (health.py) всё равно отключит БД
+DB_CONNECT_TIMEOUT = float(os.getenv("DB_CONNECT_TIMEOUT", "10"))
+DB_COMMAND_TIMEOUT = float(os.getenv("DB_COMMAND_TIMEOUT", "30"))
+# statement_timeout транзакции по остатку бюджета апдейта (utils/deadline.py), только Postgres.
+# Стоит одного SET LOCAL на транзакцию; 0 — полагаться только на DB_COMMAND_TIMEOUT
+DB_DEADLINE_STATEMENT_TIMEOUT = os.getenv("DB_DEADLINE_STATEMENT_TIMEOUT", "1") == "1"
+
 # Настройка SSL для asyncpg (по умолчанию с валидацией сертификата)
 ca_path = os.getenv("DB_SSL_CA_PATH", "")
 ssl_context = ssl.create_default_context(cafile=ca_path or None)
 
+
+def _uses_pgbouncer(url: str | None) -> bool:
+    if DB_PGBOUNCER in ("1", "true", "yes"):
+        return True
+    if DB_PGBOUNCER in ("0", "false", "no"):
+        return False
+    return bool(url and ":6543/" in url)
+
+
 # Определяем connect_args в зависимости от типа БД
 if DATABASE_URL and "postgresql" in DATABASE_URL:
     connect_args = {
         "ssl": ssl_context,
-        "timeout": 60,  # Увеличенный таймаут
-        "command_timeout": 60,
+        "timeout": DB_CONNECT_TIMEOUT,
+        "command_timeout": DB_COMMAND_TIMEOUT,
     }
+    if _uses_pgbouncer(DATABASE_URL):
+        # Отключаем кэш prepared statements в asyncpg и SQLAlchemy, имена делаем уникальными
+        connect_args.update({
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+        })
 else:
     connect_args = {}
 
-# Используем NullPool для Supabase Pooler - он сам управляет пулом
-# Это решает проблему "connection was closed in the middle of operation"
+
+@dataclass
+class PoolStats:
+    """Счётчики пула соединений (для админки и метрик)"""
+    mode: str
+    connects: int = 0  # Новые физические соединения (TCP + TLS)
+    connect_seconds: float = 0.0
+    acquires: int = 0  # Выдачи соединения из пула
+    acquire_seconds: float = 0.0
+    acquire_max_seconds: float = 0.0
+    checked_out: int = 0
+    invalidations: int = 0
+    idle_closed: int = 0  # Закрыто за простой (DB_POOL_IDLE)
+
+    @property
+    def avg_connect_ms(self) -> float:
+        return self.connect_seconds / self.connects * 1000 if self.connects else 0.0
+
+    @property
+    def avg_acquire_ms(self) -> float:
+        return self.acquire_seconds / self.acquires * 1000 if self.acquires else 0.0
+
+    @property
+    def reuse_ratio(self) -> float:
+        """Доля выдач без нового физического соединения"""
+        if not self.acquires:
+            return 0.0
+        return max(0.0, 1 - self.connects / self.acquires)
+
+
+pool_stats = PoolStats(mode=DB_POOL_MODE)
+
+# Опция выполнения для служебных запросов, которые предохранитель не учитывает как успех
+SKIP_BREAKER_OPTION = "skip_breaker"
+
+# Общий для процесса предохранитель: при недоступной БД соединение не выдаётся вовсе
+db_breaker = CircuitBreaker()
+
+
+class _AcquireTimingMixin:
+    """
+    Замеряет время получения соединения из пула (включая ожидание и коннект).
+    Сюда приходит любое обращение к БД, поэтому здесь же проверяется предохранитель.
+    """
+
+    def _do_get(self):
+        db_breaker.check()
+        started = perf_counter()
+        try:
+            return super()._do_get()
+        except Exception as exc:
+            # Ошибки DBAPI при коннекте придут в handle_error; здесь — таймауты и сеть
+            if not isinstance(exc, self._dialect.loaded_dbapi.Error) and is_outage_error(exc):
+                db_breaker.record_failure(exc)
+            raise
+        finally:
+            elapsed = perf_counter() - started
+            pool_stats.acquires += 1
+            pool_stats.acquire_seconds += elapsed
+            pool_stats.acquire_max_seconds = max(pool_stats.acquire_max_seconds, elapsed)
+
+
+class TimedQueuePool(_AcquireTimingMixin, AsyncAdaptedQueuePool):
+    def _do_return_conn(self, record) -> None:
+        record.info["idle_since"] = monotonic()
+        super()._do_return_conn(record)
+
+    def close_idle(self, max_idle: float) -> int:
+        """
+        Закрывает соединения, простоявшие в пуле дольше max_idle секунд.
+        Вызывать в greenlet (greenlet_spawn): закрытие asyncpg асинхронное.
+        """
+        now = monotonic()
+        kept, expired = [], []
+        while True:
+            try:
+                record = self._pool.get(False)
+            except Empty:
+                break
+            idle = now - record.info.get("idle_since", now)
+            (expired if idle > max_idle else kept).append(record)
+        # LIFO отдаёт свежие первыми — возвращаем в обратном порядке до того, как
+        # закрытие отдаст управление event loop'у
+        for record in reversed(kept):
+            self._pool.put(record, False)
+        for record in expired:
+            self._dec_overflow()
+            record.close()
+        pool_stats.idle_closed += len(expired)
+        return len(expired)
+
+
+class TimedNullPool(_AcquireTimingMixin, NullPool):
+    pass
+
+
+def _pool_options() -> dict:
+    if DB_POOL_MODE == "null":
+        # Пулом целиком управляет Supabase Pooler.
+        # Это решает проблему "connection was closed in the middle of operation"
+        return {"poolclass": TimedNullPool, "pool_pre_ping": True}
+
+    if DB_POOL_MODE != "queue":
+        logger.warning("Unknown DB_POOL_MODE={}, falling back to queue", DB_POOL_MODE)
+        pool_stats.mode = "queue"
+
+    return {
+        "poolclass": TimedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        # LIFO: под малой нагрузкой работают одни и те же соединения,
+        # лишние простаивают и закрываются IdleConnectionReaper по DB_POOL_IDLE
+        "pool_use_lifo": True,
+    }
+
+
 engine = create_async_engine(
     DATABASE_URL if DATABASE_URL else "sqlite+aiosqlite:///bot.db",
     echo=False,
     connect_args=connect_args,
-    poolclass=NullPool,  # Отключаем пул SQLAlchemy, используем пул Supabase
-    pool_pre_ping=True,  # Проверяем соединение перед использованием (SELECT 1)
+    **_pool_options(),
 )
 
+
+@event.listens_for(engine.sync_engine, "do_connect")
+def _timed_connect(dialect, conn_rec, cargs, cparams):
+    started = perf_counter()
+    connection = dialect.connect(*cargs, **cparams)
+    pool_stats.connects += 1
+    pool_stats.connect_seconds += perf_counter() - started
+    return connection
+
+
+@event.listens_for(engine.sync_engine, "checkout")
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    pool_stats.checked_out += 1
+
+
+@event.listens_for(engine.sync_engine, "checkin")
+def _on_checkin(dbapi_connection, connection_record):
+    pool_stats.checked_out = max(0, pool_stats.checked_out - 1)
+
+
+@event.listens_for(engine.sync_engine, "invalidate")
+def _on_invalidate(dbapi_connection, connection_record, exception):
+    pool_stats.invalidations += 1
+
+
+_TABLE_RE = re.compile(r"\b(?:FROM|INTO|UPDATE)\s+\"?(\w+)", re.IGNORECASE)
+
+
+@lru_cache(maxsize=512)
+def statement_label(statement: str) -> str:
+    """Метка для метрик: "SELECT users", "INSERT sparring_profiles" (без параметров)"""
+    verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "?"
+    match = _TABLE_RE.search(statement)
+    return f"{verb} {match.group(1)}" if match else verb
+
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(perf_counter())
+
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    DB_QUERY_LATENCY.observe(perf_counter() - started, statement=statement_label(statement))
+    # Служебный SET перед запросом — не свидетельство, что БД отвечает на настоящие запросы
+    if context is None or not context.execution_options.get(SKIP_BREAKER_OPTION):
+        db_breaker.record_success()
+
+
+@event.listens_for(engine.sync_engine, "handle_error")
+def _on_execute_error(exception_context):
+    # after_cursor_execute не вызывается при ошибке — снимаем отметку сами
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("query_started"):
+        connection.info["query_started"].pop()
+    # Обрыв, найденный pre_ping, пул лечит переподключением — это ещё не ошибка
+    if exception_context.is_pre_ping:
+        return
+    if exception_context.is_disconnect or is_outage_error(exception_context.original_exception):
+        db_breaker.record_failure(exception_context.original_exception)
+
+
+def statement_timeout_ms() -> int | None:
+    """statement_timeout по остатку бюджета апдейта; None — дедлайна нет"""
+    left = remaining()
+    if left is None:
+        return None
+    return max(1, int(left * 1000))
+
+
+@event.listens_for(engine.sync_engine, "begin")
+def _apply_deadline(conn):
+    # Запрос, переживший бюджет апдейта, сервер отменит сам, а не будет работать впустую
+    if not DB_DEADLINE_STATEMENT_TIMEOUT or conn.dialect.name != "postgresql":
+        return
+    timeout_ms = statement_timeout_ms()
+    if timeout_ms is not None:
+        conn.exec_driver_sql(
+            f"SET LOCAL statement_timeout = {timeout_ms}", execution_options={SKIP_BREAKER_OPTION: True},
+        )
+
+
+def get_pool_stats() -> PoolStats:
+    return pool_stats
+
+
+async def ping() -> None:
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+
+db_health = DatabaseHealthCheck(db_breaker, ping)
+
+
+class IdleConnectionReaper:
+    """Фоновая задача: раз в половину DB_POOL_IDLE закрывает простаивающие соединения пула"""
+
+    def __init__(self, max_idle: float = DB_POOL_IDLE) -> None:
+        self.max_idle = max_idle
+        self._task: asyncio.Task | None = None
+
+    async def reap_once(self) -> int:
+        pool = engine.sync_engine.pool
+        if not isinstance(pool, TimedQueuePool) or self.max_idle <= 0:
+            return 0
+        closed = await greenlet_spawn(pool.close_idle, self.max_idle)
+        if closed:
+            logger.debug("Closed {} idle DB connections", closed)
+        return closed
+
+    async def start(self) -> None:
+        if self.max_idle > 0 and isinstance(engine.sync_engine.pool, TimedQueuePool):
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(max(1.0, self.max_idle / 2))
+            try:
+                await self.reap_once()
+            except Exception as exc:
+                logger.warning("idle connection reaper error: {}", type(exc).__name__)
+
+
+pool_reaper = IdleConnectionReaper()
+
+
+def dialect_insert(session: AsyncSession, table):
+    """INSERT с поддержкой ON CONFLICT для диалекта сессии (Postgres / SQLite)"""
+    if session.get_bind().dialect.name == "postgresql":
+        return pg_insert(table)
+    return sqlite_insert(table)
+
+
 AsyncSessionLocal = async_sessionmaker(
     bind=engine,
     class_=AsyncSession,
@@ -45,12 +358,70 @@ AsyncSessionLocal = async_sessionmaker(
     autoflush=False
 )
 
-async def init_db():
-    """Создает таблицы, если их нет"""
+def schema_fingerprint(metadata=Base.metadata) -> str:
+    """Отпечаток моделей: таблицы, колонки, типы и индексы (меняется с любой правкой models.py)"""
+    parts = []
+    for table in sorted(metadata.tables.values(), key=lambda t: t.name):
+        columns = ",".join(
+            f"{column.name}:{type(column.type).__name__}:{int(column.nullable)}:{int(column.primary_key)}"
+            for column in table.columns
+        )
+        indexes = ",".join(sorted(index.name or "" for index in table.indexes))
+        parts.append(f"{table.name}({columns})[{indexes}]")
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()[:16]
+
+
+async def _stored_schema_version() -> str | None:
     try:
-        async with engine.begin() as conn:
-            await conn.run_sync(Base.metadata.create_all)
+        async with engine.connect() as conn:
+            return await conn.scalar(select(SchemaVersion.version).where(SchemaVersion.id == 1))
+    except DBAPIError:
+        return None  # Таблицы ещё нет — первая установка или версия до schema_version
+
+
+def _missing_columns(sync_conn) -> List[str]:
+    """Колонки моделей, которых нет в существующих таблицах (create_all их не добавляет)"""
+    inspector = inspect(sync_conn)
+    missing = []
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        missing.extend(f"{table.name}.{column.name}" for column in table.columns if column.name not in existing)
+    return missing
+
+
+async def _ensure_schema() -> bool:
+    version = schema_fingerprint()
+    stored = await _stored_schema_version()
+    if stored == version:
+        logger.info("Database schema is up to date ({})", version)
         return True
+
+    # create_all проверяет каждую таблицу через каталог — только когда схема изменилась.
+    # Он создаёт недостающие таблицы, но не меняет существующие: новые колонки
+    # добавляют миграции из supabase/migrations
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        missing = await conn.run_sync(_missing_columns)
+        if missing:
+            # Версию не записываем: на следующем старте проверим снова
+            logger.error(
+                "Database schema is behind the models, apply supabase/migrations: missing {}", ", ".join(missing),
+            )
+            return True
+        await conn.execute(delete(SchemaVersion))
+        await conn.execute(insert(SchemaVersion).values(id=1, version=version))
+    logger.info("Database schema checked: {} -> {} (missing tables created)", stored or "none", version)
+    return True
+
+
+async def init_db(timeout: float = DB_INIT_TIMEOUT) -> bool:
+    """
+    Создаёт недостающие таблицы, если схема изменилась. Обычный старт — один
+    SELECT строки schema_version вместо create_all по всем таблицам. Колонки
+    существующих таблиц не меняет: если их не хватает, пишет ошибку и версию не обновляет.
+    """
+    try:
+        return await asyncio.wait_for(_ensure_schema(), timeout)
     except Exception as exc:
         logger.warning("Database init error: {}", type(exc).__name__)
         return False
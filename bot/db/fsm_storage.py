@@ -0,0 +1,85 @@
+import os
+from typing import Any, Dict, Mapping
+
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from loguru import logger
+from sqlalchemy import delete, select
+
+from bot.config import BOT_MODE
+from bot.db.database import AsyncSessionLocal, dialect_insert
+from bot.db.models import FsmRecord
+
+# Где хранить состояния FSM: memory | redis | db.
+# В памяти — только для одного процесса; для BOT_MODE=supervisor по умолчанию db.
+FSM_STORAGE = os.getenv("FSM_STORAGE", "db" if BOT_MODE == "supervisor" else "memory").lower()
+FSM_REDIS_URL = os.getenv("FSM_REDIS_URL", os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+
+
+class DatabaseStorage(BaseStorage):
+    """
+    FSM в таблице fsm_states: одна строка на (chat, user), состояние и данные вместе.
+    Состояний мало (админские сценарии), поэтому без кэша — каждый вызов идёт в БД.
+    """
+
+    def __init__(self, key_builder: KeyBuilder | None = None) -> None:
+        self.key_builder = key_builder or DefaultKeyBuilder()
+
+    def _key(self, key: StorageKey) -> str:
+        return self.key_builder.build(key)
+
+    async def _load(self, key: StorageKey) -> FsmRecord | None:
+        async with AsyncSessionLocal() as session:
+            return await session.scalar(select(FsmRecord).where(FsmRecord.key == self._key(key)))
+
+    async def _save(self, key: StorageKey, values: Dict[str, Any]) -> None:
+        async with AsyncSessionLocal() as session:
+            stmt = dialect_insert(session, FsmRecord.__table__).values(key=self._key(key), **values)
+            stmt = stmt.on_conflict_do_update(index_elements=[FsmRecord.key], set_=values)
+            await session.execute(stmt)
+            # Пустые записи не копим
+            await session.execute(
+                delete(FsmRecord).where(
+                    FsmRecord.key == self._key(key),
+                    FsmRecord.state.is_(None),
+                    FsmRecord.data.is_(None),
+                )
+            )
+            await session.commit()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self._save(key, {"state": state.state if isinstance(state, State) else state})
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        record = await self._load(key)
+        return record.state if record else None
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise DataNotDictLikeError(f"Data must be a dict or dict-like object, got {type(data).__name__}")
+        await self._save(key, {"data": dict(data) or None})
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        record = await self._load(key)
+        return dict(record.data) if record and record.data else {}
+
+    async def close(self) -> None:
+        pass
+
+
+def create_fsm_storage(backend: str = FSM_STORAGE, mode: str = BOT_MODE) -> BaseStorage:
+    if backend == "redis":
+        # redis нужен только этому бэкенду — не тянем его на старте по умолчанию
+        from aiogram.fsm.storage.redis import RedisStorage
+
+        return RedisStorage.from_url(FSM_REDIS_URL)
+    if backend == "db":
+        return DatabaseStorage()
+    if backend != "memory":
+        logger.warning("Unknown FSM_STORAGE={}, falling back to memory", backend)
+    if mode == "supervisor":
+        # Состояние живёт в одном воркере и теряется при его перезапуске
+        logger.warning("FSM_STORAGE=memory in supervisor mode: FSM state is per worker, use db or redis")
+    return MemoryStorage()
@@ -0,0 +1,238 @@
+import asyncio
+import os
+from collections import deque
+from dataclasses import dataclass
+from time import monotonic
+from typing import Awaitable, Callable, Deque, Tuple
+
+from loguru import logger
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
+
+# Доля ошибок считается по последним DB_BREAKER_WINDOW обращениям не старше DB_BREAKER_WINDOW_SECONDS
+DB_BREAKER_WINDOW = int(os.getenv("DB_BREAKER_WINDOW", "20"))
+DB_BREAKER_WINDOW_SECONDS = float(os.getenv("DB_BREAKER_WINDOW_SECONDS", "30"))
+# Меньше обращений в окне — не размыкаем (одна ошибка из одной ещё не авария)
+DB_BREAKER_MIN_CALLS = int(os.getenv("DB_BREAKER_MIN_CALLS", "5"))
+DB_BREAKER_FAILURE_RATE = float(os.getenv("DB_BREAKER_FAILURE_RATE", "0.5"))
+# Сколько не ходить в БД после размыкания; неудачная проба удваивает паузу до DB_BREAKER_MAX_OPEN_SECONDS
+DB_BREAKER_OPEN_SECONDS = float(os.getenv("DB_BREAKER_OPEN_SECONDS", "15"))
+DB_BREAKER_MAX_OPEN_SECONDS = float(os.getenv("DB_BREAKER_MAX_OPEN_SECONDS", "120"))
+# Фоновая проверка SELECT 1: интервал и сколько ждать ответа
+DB_HEALTH_INTERVAL = float(os.getenv("DB_HEALTH_INTERVAL", "10"))
+DB_HEALTH_TIMEOUT = float(os.getenv("DB_HEALTH_TIMEOUT", "3"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Классы SQLSTATE, означающие проблему с сервером, а не с запросом:
+# 08 — соединение, 53 — нехватка ресурсов (too many connections), 57 — отмена / остановка сервера
+_OUTAGE_SQLSTATE_CLASSES = ("08", "53", "57")
+# 57014 query_canceled — сработал statement_timeout по бюджету апдейта: запрос не уложился, БД жива
+_QUERY_CANCELED = "57014"
+
+
+class DatabaseUnavailable(OperationalError):
+    """Предохранитель разомкнут: запрос в БД не отправлялся"""
+
+    def __init__(self, retry_in: float) -> None:
+        super().__init__(None, None, ConnectionError(f"database circuit is open, retry in {retry_in:.0f}s"))
+        self.retry_in = retry_in
+
+
+def is_outage_error(exc: BaseException) -> bool:
+    """Ошибка говорит о недоступности БД (сеть, таймаут, перегрузка), а не о неверном запросе"""
+    if isinstance(exc, (OSError, asyncio.TimeoutError, PoolTimeoutError)):
+        return True
+    code = getattr(exc, "sqlstate", None) or getattr(exc, "pgcode", None)
+    return isinstance(code, str) and code[:2] in _OUTAGE_SQLSTATE_CLASSES and code != _QUERY_CANCELED
+
+
+@dataclass
+class BreakerStats:
+    """Состояние предохранителя для админки и метрик"""
+    state: str = CLOSED
+    trips: int = 0  # Сколько раз размыкался
+    rejected: int = 0  # Запросов, отклонённых без похода в БД
+    failures: int = 0
+    last_error: str | None = None
+    retry_in: float = 0.0  # Через сколько секунд будет пробный запрос
+
+
+class CircuitBreaker:
+    """
+    Предохранитель БД. closed — запросы идут как обычно, ошибки недоступности
+    копятся в скользящем окне; когда их доля превышает порог, переходит в open
+    и все обращения к БД сразу получают DatabaseUnavailable вместо минутного
+    таймаута asyncpg. По истечении паузы — half_open: пропускается один пробный
+    запрос (обычно фоновый SELECT 1), успех замыкает, ошибка размыкает снова.
+    """
+
+    def __init__(
+        self,
+        window: int = DB_BREAKER_WINDOW,
+        window_seconds: float = DB_BREAKER_WINDOW_SECONDS,
+        min_calls: int = DB_BREAKER_MIN_CALLS,
+        failure_rate: float = DB_BREAKER_FAILURE_RATE,
+        open_seconds: float = DB_BREAKER_OPEN_SECONDS,
+        max_open_seconds: float = DB_BREAKER_MAX_OPEN_SECONDS,
+        probe_timeout: float = DB_HEALTH_TIMEOUT,
+        clock: Callable[[], float] = monotonic,
+    ) -> None:
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.probe_timeout = probe_timeout
+        self._clock = clock
+        self._outcomes: Deque[Tuple[float, bool]] = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._open_for = open_seconds
+        self._probe_started: float | None = None
+        self._stats = BreakerStats()
+
+    @property
+    def state(self) -> str:
+        return self._stats.state
+
+    @property
+    def is_closed(self) -> bool:
+        return self._stats.state == CLOSED
+
+    @property
+    def retry_in(self) -> float:
+        if self._stats.state != OPEN:
+            return 0.0
+        return max(0.0, self._opened_at + self._open_for - self._clock())
+
+    @property
+    def stats(self) -> BreakerStats:
+        self._stats.retry_in = self.retry_in
+        return self._stats
+
+    def allow(self) -> bool:
+        """Можно ли идти в БД. В half_open пропускает один пробный запрос за раз"""
+        if self._stats.state == CLOSED:
+            return True
+        now = self._clock()
+        if self._stats.state == OPEN:
+            if now - self._opened_at < self._open_for:
+                self._stats.rejected += 1
+                return False
+            self._stats.state = HALF_OPEN
+            self._probe_started = None
+        # Проба, которая не вернулась за probe_timeout, не должна блокировать следующую
+        if self._probe_started is not None and now - self._probe_started < self.probe_timeout:
+            self._stats.rejected += 1
+            return False
+        self._probe_started = now
+        return True
+
+    def check(self) -> None:
+        if not self.allow():
+            raise DatabaseUnavailable(self.retry_in)
+
+    def record_success(self) -> None:
+        state = self._stats.state
+        if state == CLOSED:
+            self._outcomes.append((self._clock(), True))
+        elif state == HALF_OPEN:
+            logger.info("Database is reachable again, circuit closed")
+            self._stats.state = CLOSED
+            self._outcomes.clear()
+            self._open_for = self.open_seconds
+            self._probe_started = None
+        # В open успех запроса, начатого до размыкания, ничего не меняет — ждём пробу
+
+    def record_failure(self, exc: BaseException | None = None) -> None:
+        self._stats.failures += 1
+        if exc is not None:
+            self._stats.last_error = type(exc).__name__
+        state = self._stats.state
+        if state == HALF_OPEN:
+            self._open(min(self._open_for * 2, self.max_open_seconds))
+            return
+        if state == OPEN:
+            return
+
+        now = self._clock()
+        self._outcomes.append((now, False))
+        while self._outcomes and now - self._outcomes[0][0] > self.window_seconds:
+            self._outcomes.popleft()
+        failures = sum(1 for _, ok in self._outcomes if not ok)
+        if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_rate:
+            self._open(self.open_seconds)
+
+    def trip(self, exc: BaseException | None = None) -> None:
+        """Разомкнуть сразу, без набора статистики (например, БД не ответила на старте)"""
+        if exc is not None:
+            self._stats.failures += 1
+            self._stats.last_error = type(exc).__name__
+        if self._stats.state != OPEN:
+            self._open(self.open_seconds)
+
+    def _open(self, open_for: float) -> None:
+        self._stats.state = OPEN
+        self._stats.trips += 1
+        self._opened_at = self._clock()
+        self._open_for = open_for
+        self._probe_started = None
+        self._outcomes.clear()
+        logger.warning(
+            "Database circuit opened for {:.0f}s (last error: {})", open_for, self._stats.last_error or "-",
+        )
+
+
+class DatabaseHealthCheck:
+    """
+    Фоновая проверка БД: раз в DB_HEALTH_INTERVAL выполняет probe (SELECT 1).
+    Пока предохранитель замкнут — раньше пользователей замечает, что БД
+    перестала отвечать; когда разомкнут — служит пробным запросом half_open,
+    чтобы бот вернулся к БД, не дожидаясь трафика.
+    """
+
+    def __init__(
+        self,
+        breaker: CircuitBreaker,
+        probe: Callable[[], Awaitable[object]],
+        interval: float = DB_HEALTH_INTERVAL,
+        timeout: float = DB_HEALTH_TIMEOUT,
+    ) -> None:
+        self.breaker = breaker
+        self.probe = probe
+        self.interval = interval
+        self.timeout = timeout
+        self._task: asyncio.Task | None = None
+
+    async def check_once(self) -> bool:
+        if self.breaker.retry_in > 0:
+            return False  # Пауза после размыкания ещё не прошла
+        try:
+            await asyncio.wait_for(self.probe(), self.timeout)
+        except DatabaseUnavailable:
+            return False
+        except asyncio.TimeoutError as exc:
+            # Отмена по wait_for не доходит до handle_error движка — учитываем сами
+            self.breaker.record_failure(exc)
+            return False
+        except Exception as exc:
+            # Ошибки подключения и выполнения предохранитель уже учёл через события движка
+            logger.debug("database health check failed: {}", type(exc).__name__)
+            return False
+        return True
+
+    async def start(self) -> None:
+        if self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.check_once()
@@ -1,8 +1,11 @@
-from datetime import datetime
-from sqlalchemy import String, Integer, DateTime, ForeignKey, Text, BigInteger
+from datetime import date, datetime
+from sqlalchemy import String, Integer, Date, DateTime, ForeignKey, Text, BigInteger, JSON, Float
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 from sqlalchemy.ext.asyncio import AsyncAttrs
 
+# BIGINT в Postgres, но INTEGER в SQLite — иначе там не работает автоинкремент
+BigIntPK = BigInteger().with_variant(Integer, "sqlite")
+
 class Base(AsyncAttrs, DeclarativeBase):
     """Базовый класс для всех моделей с поддержкой асинхронности"""
     pass
@@ -11,20 +14,23 @@ class User(Base):
     """Модель пользователя"""
     __tablename__ = "users"
 
-    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    id: Mapped[int] = mapped_column(BigIntPK, primary_key=True, autoincrement=True)
     telegram_id: Mapped[int] = mapped_column(BigInteger, unique=True, nullable=False, index=True)
     username: Mapped[str | None] = mapped_column(String(255), nullable=True)
     first_name: Mapped[str | None] = mapped_column(String(255), nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     subscription_status: Mapped[bool] = mapped_column(default=False)  # Статус подписки
+    is_blocked: Mapped[bool] = mapped_column(default=False)  # Заблокировал бота / удалён, пропускаем в рассылках
 
-class RateLimitEntry(Base):
-    """Модель для отслеживания rate limit"""
-    __tablename__ = "rate_limit_entries"
+class RateLimitBucket(Base):
+    """Агрегированные счётчики rate limit: запросы пользователя за интервал от одного инстанса бота"""
+    __tablename__ = "rate_limit_buckets"
 
-    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
-    telegram_id: Mapped[int] = mapped_column(BigInteger, nullable=False, index=True)
-    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, index=True)
+    scope: Mapped[str] = mapped_column(String(32), primary_key=True)  # Тип апдейта (message, callback_query...)
+    telegram_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    bucket_start: Mapped[int] = mapped_column(BigInteger, primary_key=True, index=True)  # unix time, кратно размеру бакета
+    instance_id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    hits: Mapped[int] = mapped_column(Integer, default=0)
 
 class SparringProfile(Base):
     """Модель спарринг-профиля (зеркало таблицы Supabase)"""
@@ -36,4 +42,74 @@ class SparringProfile(Base):
     weight_kg: Mapped[int | None] = mapped_column(Integer, nullable=True)
     experience_years: Mapped[float | None] = mapped_column(Integer, nullable=True)
     style: Mapped[str | None] = mapped_column(String, nullable=True)
+    hand: Mapped[str | None] = mapped_column(String, nullable=True)  # left | right | both
+    latitude: Mapped[float | None] = mapped_column(Float, nullable=True)
+    longitude: Mapped[float | None] = mapped_column(Float, nullable=True)
     is_active: Mapped[bool] = mapped_column(default=True)
+    updated_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True, index=True)
+
+class BroadcastJob(Base):
+    """Задание рассылки (переживает рестарт бота)"""
+    __tablename__ = "broadcast_jobs"
+
+    id: Mapped[int] = mapped_column(BigIntPK, primary_key=True, autoincrement=True)
+    text: Mapped[str] = mapped_column(Text, nullable=False)
+    status: Mapped[str] = mapped_column(String(16), default="pending", index=True)
+    created_by: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    segment: Mapped[dict | None] = mapped_column(JSON, nullable=True)  # Фильтр получателей (RecipientSegment)
+    # Курсор по users.id: всё, что <= cursor, уже обработано
+    cursor: Mapped[int] = mapped_column(BigInteger, default=0)
+    total: Mapped[int] = mapped_column(Integer, default=0)
+    sent: Mapped[int] = mapped_column(Integer, default=0)
+    failed: Mapped[int] = mapped_column(Integer, default=0)
+    blocked: Mapped[int] = mapped_column(Integer, default=0)
+    # Сообщение админа, в котором показываем прогресс
+    status_chat_id: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    status_message_id: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    # Аренда: какой процесс сейчас шлёт рассылку и когда он последний раз отметился
+    owner: Mapped[str | None] = mapped_column(String(128), nullable=True)
+    heartbeat_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class FsmRecord(Base):
+    """Состояние FSM (aiogram), общее для всех процессов бота"""
+    __tablename__ = "fsm_states"
+
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)  # DefaultKeyBuilder: fsm:<chat_id>:<user_id>
+    state: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    data: Mapped[dict | None] = mapped_column(JSON(none_as_null=True), nullable=True)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class JobWatermark(Base):
+    """Водяная метка фонового задания: до какого updated_at всё уже обработано"""
+    __tablename__ = "job_watermarks"
+
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    watermark: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class PartnerAlert(Base):
+    """Уведомление "рядом новый партнёр": пара получатель/партнёр уведомляется один раз"""
+    __tablename__ = "partner_alerts"
+
+    recipient_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)  # telegram_id
+    partner_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)  # telegram_id нового профиля
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    # NULL — ждёт отправки (тихие часы, лимит на пользователя)
+    sent_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True, index=True)
+
+class UserActivity(Base):
+    """Кто писал боту в этот день (UTC): одна строка на пользователя в сутки, для DAU в админке"""
+    __tablename__ = "user_activity"
+
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    telegram_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+
+class SchemaVersion(Base):
+    """Отпечаток схемы, под которую создавались таблицы: при совпадении create_all на старте не нужен"""
+    __tablename__ = "schema_version"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)  # Одна строка, id = 1
+    version: Mapped[str] = mapped_column(String(64), nullable=False)
+    applied_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
@@ -1,4 +1,3 @@
-import asyncio
 from dataclasses import dataclass
 from enum import Enum
 
@@ -8,15 +7,23 @@ from aiogram.enums import ParseMode
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from loguru import logger
-from sqlalchemy import select, func
+from sqlalchemy.exc import DBAPIError
 
 from bot.config import ADMIN_IDS
-from bot.db.database import AsyncSessionLocal
-from bot.db.models import User, SparringProfile
-from bot.keyboards.inline import get_admin_keyboard
+from bot.db.database import PoolStats, db_breaker, get_pool_stats
+from bot.db.health import CLOSED, OPEN, BreakerStats
+from bot.keyboards.inline import (
+    get_admin_keyboard,
+    get_broadcast_job_keyboard,
+    get_broadcast_segment_keyboard,
+)
+from bot.services.admin_stats import StatsSnapshot, admin_stats
+from bot.services.broadcast_jobs import broadcast_runner, create_job, render_job
+from bot.services.recipients import RecipientSegment, segment_preset
 from bot.states import AdminStates
+from bot.utils.routing import ExactText
 
-router = Router()
+router = Router(name="admin")
 
 
 class AdminCommand(str, Enum):
@@ -28,24 +35,28 @@ class AdminCommand(str, Enum):
 class AdminCallback(str, Enum):
     STATS = "admin_stats"
     BROADCAST = "admin_broadcast"
+    SEGMENT = "admin_segment"
+    JOB_PAUSE = "admin_job_pause"
+    JOB_RESUME = "admin_job_resume"
+    JOB_CANCEL = "admin_job_cancel"
 
 
 ADMIN_BUTTON_TEXT = "⚙️ Админка"
 NO_ACCESS_TEXT = "⛔ Нет доступа"
 CANCEL_COMMAND = f"/{AdminCommand.CANCEL.value}"
+BROADCAST_SEGMENT_PROMPT = "👥 Кому отправить рассылку?"
 BROADCAST_PROMPT = f"📢 Введите текст для рассылки (или {CANCEL_COMMAND} для отмены):"
 BROADCAST_CANCELLED = "❌ Рассылка отменена."
 BROADCAST_START = "⏳ Начинаю рассылку..."
-BROADCAST_DONE = "✅ Рассылка завершена. Отправлено: {count}"
-BROADCAST_BATCH_SIZE = 20
-BROADCAST_PAUSE_SECONDS = 1
+BROADCAST_FAILED = "⚠️ Не удалось создать рассылку: база данных недоступна."
+JOB_NOT_CHANGED = "Статус рассылки уже изменился"
 
 
 @dataclass(frozen=True)
 class AdminStats:
-    total_users: int
-    total_profiles: int
-    active_profiles: int
+    snapshot: StatsSnapshot | None  # None — БД недоступна и снимка ещё нет
+    pool: PoolStats | None = None
+    breaker: BreakerStats | None = None
 
 
 def is_admin(user_id: int | None) -> bool:
@@ -53,26 +64,53 @@ def is_admin(user_id: int | None) -> bool:
 
 
 async def fetch_stats() -> AdminStats:
-    async with AsyncSessionLocal() as session:
-        users_result = await session.execute(select(func.count(User.id)))
-        profiles_result = await session.execute(select(func.count(SparringProfile.id)))
-        active_result = await session.execute(
-            select(func.count(SparringProfile.id)).where(SparringProfile.is_active.is_(True))
-        )
-
-    return AdminStats(
-        total_users=users_result.scalar() or 0,
-        total_profiles=profiles_result.scalar() or 0,
-        active_profiles=active_result.scalar() or 0
-    )
+    try:
+        snapshot = await admin_stats.get()
+    except (DBAPIError, OSError, Exception) as exc:
+        # Показываем последний снимок, пусть и старый
+        logger.warning("admin stats fetch failed: {}", type(exc).__name__)
+        snapshot = admin_stats.snapshot
+    return AdminStats(snapshot=snapshot, pool=get_pool_stats(), breaker=db_breaker.stats)
 
 
 def render_stats(stats: AdminStats) -> str:
-    return (
-        "⚙️ <b>Админ-панель</b>\n\n"
-        f"👥 Всего в боте: <b>{stats.total_users}</b>\n"
-        f"🥊 Спарринг-профилей: <b>{stats.total_profiles}</b> (Активных: {stats.active_profiles})"
-    )
+    text = "⚙️ <b>Админ-панель</b>\n\n"
+    snapshot = stats.snapshot
+    if snapshot is None:
+        text += "⚠️ Статистика недоступна: база данных не отвечает."
+    else:
+        text += (
+            f"👥 Всего в боте: <b>{snapshot.total_users}</b> (заблокировали: {snapshot.blocked_users})\n"
+            f"🆕 Новых: сегодня {snapshot.new_users_today}, за неделю {snapshot.new_users_week}\n"
+            f"📈 Активных: сегодня {snapshot.dau}, за неделю {snapshot.wau}\n"
+            f"🥊 Спарринг-профилей: <b>{snapshot.total_profiles}</b> (Активных: {snapshot.active_profiles}, "
+            f"обновлено за неделю: {snapshot.profiles_updated_week})"
+        )
+        if snapshot.delivery_rate is not None:
+            text += (
+                f"\n📢 Рассылки: доставлено {snapshot.broadcast_sent} ({snapshot.delivery_rate:.0%}), "
+                f"заблокировали {snapshot.broadcast_blocked}, ошибок {snapshot.broadcast_failed}"
+            )
+        text += f"\n\n<i>Данные на {snapshot.computed_at:%H:%M} UTC</i>"
+    if stats.pool:
+        text += (
+            f"\n\n🗄 Пул БД ({stats.pool.mode}): соединений {stats.pool.connects}, "
+            f"переиспользование {stats.pool.reuse_ratio:.0%}, "
+            f"получение {stats.pool.avg_acquire_ms:.1f} мс (макс {stats.pool.acquire_max_seconds * 1000:.0f})"
+        )
+    breaker = stats.breaker
+    if breaker:
+        if breaker.state == CLOSED:
+            status = "✅ БД отвечает"
+        elif breaker.state == OPEN:
+            status = f"⛔ БД недоступна, проверка через {breaker.retry_in:.0f} с"
+        else:
+            status = "🔄 БД: пробный запрос"
+        text += f"\n{status} (отключений: {breaker.trips}, отклонено запросов: {breaker.rejected}"
+        if breaker.last_error:
+            text += f", последняя ошибка: {breaker.last_error}"
+        text += ")"
+    return text
 
 
 @router.message(Command(AdminCommand.CHECK_ID.value))
@@ -89,7 +127,7 @@ async def cmd_check_id(message: Message) -> None:
 
 
 @router.message(Command(AdminCommand.ADMIN.value))
-@router.message(F.text == ADMIN_BUTTON_TEXT)
+@router.message(ExactText(ADMIN_BUTTON_TEXT))
 async def cmd_admin_panel(message: Message) -> None:
     user_id = message.from_user.id if message.from_user else None
     if not is_admin(user_id):
@@ -136,8 +174,27 @@ async def cb_admin_broadcast(callback: CallbackQuery, state: FSMContext) -> None
         await callback.answer("Сообщение не найдено", show_alert=True)
         return
 
-    await callback.message.answer(BROADCAST_PROMPT)
+    await callback.message.answer(
+        BROADCAST_SEGMENT_PROMPT,
+        reply_markup=get_broadcast_segment_keyboard()
+    )
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith(f"{AdminCallback.SEGMENT.value}:"))
+async def cb_admin_broadcast_segment(callback: CallbackQuery, state: FSMContext) -> None:
+    if not is_admin(callback.from_user.id if callback.from_user else None):
+        await callback.answer(NO_ACCESS_TEXT, show_alert=True)
+        return
+
+    segment = segment_preset((callback.data or "").partition(":")[2])
+    if segment is None or not callback.message or not isinstance(callback.message, Message):
+        await callback.answer()
+        return
+
+    await callback.message.edit_text(BROADCAST_PROMPT)
     await state.set_state(AdminStates.waiting_for_broadcast_text)
+    await state.update_data(segment=segment.to_dict())
     await callback.answer()
 
 
@@ -153,29 +210,60 @@ async def process_broadcast(message: Message, state: FSMContext, bot: Bot) -> No
         await message.answer("Сообщение пустое. Введите текст или /cancel.")
         return
 
+    data = await state.get_data()
     status_msg = await message.answer(BROADCAST_START)
-    user_ids = await _fetch_user_ids()
-
-    sent_count = 0
-    failed_count = 0
-    for index, user_id in enumerate(user_ids, start=1):
-        try:
-            await bot.send_message(user_id, text)
-            sent_count += 1
-            if index % BROADCAST_BATCH_SIZE == 0:
-                await asyncio.sleep(BROADCAST_PAUSE_SECONDS)
-        except Exception as exc:
-            failed_count += 1
-            logger.warning("broadcast send failed: {}", type(exc).__name__)
+    try:
+        job = await create_job(
+            text,
+            created_by=message.from_user.id if message.from_user else None,
+            segment=RecipientSegment.from_dict(data.get("segment")),
+            status_chat_id=status_msg.chat.id,
+            status_message_id=status_msg.message_id,
+        )
+    except (DBAPIError, OSError, Exception) as exc:
+        logger.warning("broadcast job create failed: {}", type(exc).__name__)
+        await status_msg.edit_text(BROADCAST_FAILED)
+        await state.clear()
+        return
 
-    summary = BROADCAST_DONE.format(count=sent_count)
-    if failed_count:
-        summary += f" (ошибок: {failed_count})"
-    await status_msg.edit_text(summary)
+    await status_msg.edit_text(
+        render_job(job),
+        reply_markup=get_broadcast_job_keyboard(job.id, job.status)
+    )
+    broadcast_runner.submit(job.id)
     await state.clear()
 
 
-async def _fetch_user_ids() -> list[int]:
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(select(User.telegram_id))
-        return list(result.scalars().all())
+@router.callback_query(F.data.startswith(f"{AdminCallback.JOB_PAUSE.value}:"))
+@router.callback_query(F.data.startswith(f"{AdminCallback.JOB_RESUME.value}:"))
+@router.callback_query(F.data.startswith(f"{AdminCallback.JOB_CANCEL.value}:"))
+async def cb_broadcast_job_control(callback: CallbackQuery) -> None:
+    if not is_admin(callback.from_user.id if callback.from_user else None):
+        await callback.answer(NO_ACCESS_TEXT, show_alert=True)
+        return
+
+    action, _, raw_job_id = (callback.data or "").partition(":")
+    if not raw_job_id.isdigit():
+        await callback.answer()
+        return
+
+    job_id = int(raw_job_id)
+    controls = {
+        AdminCallback.JOB_PAUSE.value: broadcast_runner.pause,
+        AdminCallback.JOB_RESUME.value: broadcast_runner.resume,
+        AdminCallback.JOB_CANCEL.value: broadcast_runner.cancel,
+    }
+    job = await controls[action](job_id)
+    if job is None:
+        await callback.answer(JOB_NOT_CHANGED, show_alert=True)
+        return
+
+    if callback.message and isinstance(callback.message, Message):
+        try:
+            await callback.message.edit_text(
+                render_job(job),
+                reply_markup=get_broadcast_job_keyboard(job.id, job.status)
+            )
+        except Exception as exc:
+            logger.warning("broadcast job edit failed: {}", type(exc).__name__)
+    await callback.answer()
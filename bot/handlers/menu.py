@@ -1,37 +1,34 @@
-import asyncio
+import os
 from html import escape as html_escape
 
-from aiogram import Router, F
+from aiogram import Router
 from aiogram.filters import Command
 from aiogram.types import Message
 from aiogram.enums import ParseMode
-from loguru import logger
 
 from bot.services.user_service import get_user_snapshot
+from bot.utils.deadline import deadline
+from bot.utils.routing import ExactText
+
+router = Router(name="menu")
+
+# Бюджет на загрузку профиля (секунды), внутри общего UPDATE_DEADLINE
+PROFILE_DEADLINE = float(os.getenv("PROFILE_DEADLINE", "2"))
 
-router = Router()
 
 def _safe(value: str | None, fallback: str = '—') -> str:
     return html_escape(value) if value else fallback
 
 
 @router.message(Command("profile"))
-@router.message(F.text == "👤 Профиль")
+@router.message(ExactText("👤 Профиль"))
 async def cmd_profile(message: Message) -> None:
     user_id = message.from_user.id
 
-    user = None
-    try:
-        user = await asyncio.wait_for(get_user_snapshot(user_id), timeout=1.2)
-    except asyncio.TimeoutError:
-        user = None
-
-    if not user:
-        # Повторяем запрос без тайм-аута, логируем ошибку, но не раскрываем детали пользователю
-        try:
-            user = await get_user_snapshot(user_id)
-        except Exception as exc:
-            logger.warning("profile snapshot retry failed: {}", type(exc).__name__)
+    # Частая кнопка: ждём меньше общего бюджета апдейта. Не успели — отвечаем тем,
+    # что знает Telegram, а снимок догрузится в кэш к следующему нажатию
+    with deadline(PROFILE_DEADLINE):
+        user = await get_user_snapshot(user_id)
 
     if not user:
         first_name = _safe(message.from_user.first_name)
@@ -59,7 +56,7 @@ async def cmd_profile(message: Message) -> None:
     await message.answer(text, parse_mode=ParseMode.HTML)
 
 @router.message(Command("info"))
-@router.message(F.text == "ℹ️ Инфо")
+@router.message(ExactText("ℹ️ Инфо"))
 async def cmd_info(message: Message) -> None:
     text = (
         "ℹ️ <b>Контакты</b>\n\n"
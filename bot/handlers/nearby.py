@@ -0,0 +1,103 @@
+from html import escape as html_escape
+
+from aiogram import Router
+from aiogram.enums import ParseMode
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message
+from loguru import logger
+from sqlalchemy.exc import DBAPIError
+
+from bot.services.matching import Match, matching_service
+from bot.services.nearby import (
+    NearbyFilters,
+    PartnerLocation,
+    nearby_service,
+    parse_filters,
+    weight_class_label,
+)
+from bot.services.user_service import STYLE_LABELS
+
+router = Router(name="nearby")
+
+HAND_LABELS = {"left": "левая", "right": "правая", "both": "обе руки"}
+
+
+def _describe_filters(filters: NearbyFilters) -> str:
+    parts = []
+    if filters.hand and filters.hand != "both":
+        parts.append(f"{HAND_LABELS[filters.hand]} рука")
+    if filters.style and filters.style != "both":
+        parts.append(STYLE_LABELS[filters.style].lower())
+    if filters.weight_class is not None:
+        parts.append(weight_class_label(filters.weight_class))
+    return ", ".join(parts) or "без фильтров"
+
+
+def _format_partner(position: int, distance_km: float, partner: PartnerLocation) -> str:
+    name = html_escape(partner.first_name or "—")
+    details = [f"{distance_km:.1f} км"]
+    if partner.hand:
+        details.append(HAND_LABELS.get(partner.hand, partner.hand))
+    if partner.style:
+        details.append(STYLE_LABELS.get(partner.style, partner.style).lower())
+    if partner.weight_kg is not None:
+        details.append(f"{partner.weight_kg}кг")
+    return f"{position}. <a href=\"tg://user?id={partner.telegram_id}\">{name}</a> — {' · '.join(details)}"
+
+
+def _format_match(position: int, match: Match) -> str:
+    return f"{_format_partner(position, match.distance_km, match.partner)} · {match.score}%"
+
+
+@router.message(Command("nearby"))
+async def cmd_nearby(message: Message, command: CommandObject) -> None:
+    user_id = message.from_user.id
+    try:
+        me = await nearby_service.locate(user_id)
+        if me is None:
+            await message.answer(
+                "📍 Чтобы искать партнёров рядом, заполни спарринг-профиль с геолокацией в приложении."
+            )
+            return
+        filters = parse_filters(command.args, me)
+        partners = await nearby_service.find(me, filters)
+    except DBAPIError as exc:
+        logger.warning("nearby lookup failed: {}", type(exc).__name__)
+        await message.answer("⚠️ Не удалось загрузить профили. Попробуйте позже.")
+        return
+
+    header = f"📍 <b>Партнёры рядом</b> ({_describe_filters(filters)})"
+    if not partners:
+        await message.answer(
+            f"{header}\n\nНикого не нашлось. Попробуй <code>/nearby all</code> — поиск без фильтров.",
+            parse_mode=ParseMode.HTML,
+        )
+        return
+
+    lines = [_format_partner(position, distance, partner) for position, (distance, partner) in enumerate(partners, 1)]
+    await message.answer(f"{header}\n\n" + "\n".join(lines), parse_mode=ParseMode.HTML)
+
+
+@router.message(Command("match"))
+async def cmd_match(message: Message) -> None:
+    try:
+        result = await matching_service.matches(message.from_user.id)
+    except DBAPIError as exc:
+        logger.warning("match lookup failed: {}", type(exc).__name__)
+        await message.answer("⚠️ Не удалось загрузить профили. Попробуйте позже.")
+        return
+
+    if result is None:
+        await message.answer(
+            "🤝 Чтобы подобрать партнёров, заполни спарринг-профиль с геолокацией в приложении."
+        )
+        return
+    if not result.matches:
+        await message.answer("🤝 Подходящих партнёров поблизости пока нет. Загляни позже.")
+        return
+
+    lines = [_format_match(position, match) for position, match in enumerate(result.matches, 1)]
+    await message.answer(
+        "🤝 <b>Подходящие партнёры</b> (вес, стаж, стиль и расстояние)\n\n" + "\n".join(lines),
+        parse_mode=ParseMode.HTML,
+    )
@@ -1,17 +1,17 @@
 from html import escape as html_escape
 
 from aiogram import Router, Bot, F
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import Message, CallbackQuery, ChatMemberUpdated
 from aiogram.filters import CommandStart
 from aiogram.enums import ParseMode
 
-from bot.services.subscription import check_subscription
+from bot.services.subscription import apply_chat_member_update, check_subscription, is_channel_chat
 from bot.services.user_service import get_or_create_user
 from bot.keyboards.inline import get_subscription_keyboard
 from bot.keyboards.reply import get_main_menu_keyboard
-from loguru import logger
+from bot.utils.logs import hot_logger
 
-router = Router()
+router = Router(name="start")
 
 @router.message(CommandStart())
 async def cmd_start(message: Message, bot: Bot) -> None:
@@ -35,10 +35,11 @@ async def cmd_start(message: Message, bot: Bot) -> None:
     await get_or_create_user(
         telegram_id=user_id,
         username=username,
-        first_name=first_name
+        first_name=first_name,
+        subscription_status=True,
     )
     
-    logger.info(f"User {user_id} (@{username}) started bot")
+    hot_logger.info("User {} (@{}) started bot", user_id, username)
     
     text = (
         f"👋 Привет, {safe_first_name}!\n\n"
@@ -54,7 +55,7 @@ async def cmd_start(message: Message, bot: Bot) -> None:
 
 @router.callback_query(F.data == "check_subscription")
 async def callback_check_subscription(callback: CallbackQuery, bot: Bot) -> None:
-    is_subscribed = await check_subscription(bot, callback.from_user.id)
+    is_subscribed = await check_subscription(bot, callback.from_user.id, recheck=True)
     
     if is_subscribed:
         await callback.message.delete()
@@ -64,7 +65,8 @@ async def callback_check_subscription(callback: CallbackQuery, bot: Bot) -> None
         await get_or_create_user(
             telegram_id=callback.from_user.id,
             username=callback.from_user.username,
-            first_name=first_name
+            first_name=first_name,
+            subscription_status=True,
         )
         
         text = (
@@ -79,3 +81,8 @@ async def callback_check_subscription(callback: CallbackQuery, bot: Bot) -> None
         )
     else:
         await callback.answer("❌ Подписка не найдена. Попробуй ещё раз.", show_alert=True)
+
+@router.chat_member(F.chat.func(is_channel_chat))
+async def on_channel_member_update(event: ChatMemberUpdated) -> None:
+    # Подписки/отписки в канале (приходят, только если бот — админ канала)
+    await apply_chat_member_update(event)
@@ -26,3 +26,38 @@ def get_admin_keyboard() -> InlineKeyboardMarkup:
             ]
         ]
     )
+
+def get_broadcast_segment_keyboard() -> InlineKeyboardMarkup:
+    """
+    Выбор получателей рассылки.
+    """
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text="👥 Все", callback_data="admin_segment:all")],
+            [InlineKeyboardButton(text="🥊 С активным спарринг-профилем", callback_data="admin_segment:sparring")],
+            [
+                InlineKeyboardButton(text="🆕 Новые за 7 дней", callback_data="admin_segment:new7"),
+                InlineKeyboardButton(text="🆕 За 30 дней", callback_data="admin_segment:new30")
+            ]
+        ]
+    )
+
+def get_broadcast_job_keyboard(job_id: int, status: str) -> InlineKeyboardMarkup | None:
+    """
+    Управление заданием рассылки (пауза / продолжить / отмена).
+    """
+    if status in ("pending", "running"):
+        toggle = InlineKeyboardButton(text="⏸ Пауза", callback_data=f"admin_job_pause:{job_id}")
+    elif status == "paused":
+        toggle = InlineKeyboardButton(text="▶️ Продолжить", callback_data=f"admin_job_resume:{job_id}")
+    else:
+        return None
+
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [
+                toggle,
+                InlineKeyboardButton(text="❌ Отменить", callback_data=f"admin_job_cancel:{job_id}")
+            ]
+        ]
+    )
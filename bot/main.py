@@ -1,28 +1,95 @@
 import asyncio
-import sys
+
+# Первым: время старта считаем вместе с импортом aiogram и остальных модулей
+from bot.utils.startup import startup_timer
+
 from aiogram import Bot, Dispatcher
 from loguru import logger
 
-from bot.config import BOT_TOKEN
-from bot.db.database import init_db
+from bot.config import BOT_MODE, BOT_TOKEN
+from bot.db.database import db_breaker, db_health, init_db, pool_reaper
+from bot.db.fsm_storage import create_fsm_storage
+from bot.middlewares.activity import ActivityMiddleware
+from bot.middlewares.deadline import DeadlineMiddleware
+from bot.middlewares.metrics import setup_bot_metrics, setup_metrics
+from bot.middlewares.routing import setup_exact_routing
 from bot.middlewares.spam_protection import SpamProtectionMiddleware
-from bot.handlers import start, menu, admin
+from bot.handlers import start, menu, nearby, admin
+from bot.services.admin_stats import admin_stats
+from bot.services.broadcast_jobs import broadcast_runner
+from bot.services.partner_alerts import partner_alerts
+from bot.services.profile_feed import profile_feed
+from bot.utils.logs import flush_logs, setup_logging
+from bot.utils.metrics import METRICS_PORT, MetricsServer
+
+# Настройка логирования: запись в stdout и файл — в фоновом потоке (см. utils/logs.py)
+setup_logging()
+
+
+def create_dispatcher(resume_broadcasts: bool = True, metrics_port: int = METRICS_PORT, **kwargs) -> Dispatcher:
+    """
+    resume_broadcasts=False — не подхватывать незавершённые рассылки при старте
+    (в режиме supervisor это делает только первый воркер).
+    metrics_port — порт /metrics (0 — не поднимать).
+    kwargs уходят в Dispatcher (например, events_isolation).
+    """
+    dp = Dispatcher(storage=create_fsm_storage(), **kwargs)
+
+    # Антиспам создаём заранее: метрики отдают память его лимитера (регистрируется ниже)
+    spam_protection = SpamProtectionMiddleware()
+
+    # Метрики задержек: внешняя middleware меряет апдейт целиком, вместе с антиспамом
+    setup_metrics(dp, spam_protection)
+    metrics_server = MetricsServer(port=metrics_port)
+    dp.startup.register(metrics_server.start)
+    dp.shutdown.register(metrics_server.stop)
+
+    # Бюджет времени на апдейт: сервисы и БД по нему отдают кэш или неполный ответ вовремя
+    dp.update.outer_middleware(DeadlineMiddleware())
+
+    # Проверка БД в фоне: пока она не отвечает, запросы сразу получают отказ (см. db/health.py)
+    dp.startup.register(db_health.start)
+    dp.shutdown.register(db_health.stop)
+    # Простаивающие соединения пула закрываем сами: pool_recycle срабатывает только при выдаче
+    dp.startup.register(pool_reaper.start)
+    dp.shutdown.register(pool_reaper.stop)
+
+    # DAU для админки: отмечаем каждого, кто пишет боту (в БД — пачкой, см. admin_stats.py)
+    dp.update.middleware(ActivityMiddleware())
+    dp.startup.register(admin_stats.start)
+    dp.shutdown.register(admin_stats.stop)
+
+    # Middleware (будет работать даже без БД благодаря обработке ошибок)
+    dp.update.middleware(spam_protection)
+    dp.shutdown.register(spam_protection.close)
+
+    # Роутеры
+    dp.include_router(start.router)
+    dp.include_router(menu.router)
+    dp.include_router(nearby.router)
+    dp.include_router(admin.router)
+    # Кнопки и команды — по хеш-таблице, мимо перебора фильтров (после всех include_router)
+    setup_exact_routing(dp)
+
+    # Фоновые рассылки: продолжаем незавершённые задания после рестарта
+    dp.startup.register(broadcast_runner.start if resume_broadcasts else broadcast_runner.attach)
+    dp.shutdown.register(broadcast_runner.stop)
+
+    # Уведомления о новых партнёрах рядом — тоже только в одном процессе
+    if resume_broadcasts:
+        dp.startup.register(partner_alerts.start)
+        dp.shutdown.register(partner_alerts.stop)
 
-# Настройка логирования
-logger.remove()
-logger.add(
-    sys.stdout,
-    format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>",
-    level="INFO"
-)
-logger.add("logs/bot.log", rotation="10 MB", level="DEBUG")
+    # Сброс кэша профилей по изменениям из WebApp (USER_CACHE_FEED=notify|poll)
+    dp.startup.register(profile_feed.start)
+    dp.shutdown.register(profile_feed.stop)
+
+    return dp
 
-# Флаг доступности БД
-db_available = False
 
 async def main() -> None:
-    global db_available
-    
+    startup_timer.lap("imports")
+
     if not BOT_TOKEN:
         logger.error("BOT_TOKEN is missing!")
         return
@@ -31,26 +98,45 @@ async def main() -> None:
     try:
         result = await init_db()
         if result:
-            db_available = True
             logger.info("Database initialized successfully")
         else:
             logger.warning("Database initialization returned False, continuing without DB")
     except Exception as e:
-        logger.warning(f"Database not available, continuing without DB: {e}")
+        result = False
+        logger.warning("Database not available, continuing without DB: {}", e)
+    if not result:
+        # Первые апдейты не ждут таймаутов: в БД вернёт фоновая проверка
+        db_breaker.trip()
+    startup_timer.lap("init_db")
 
     bot = Bot(token=BOT_TOKEN)
-    dp = Dispatcher()
+    setup_bot_metrics(bot)
+    dp = create_dispatcher()
+    dp.shutdown.register(flush_logs)
+    startup_timer.lap("dispatcher")
+    # Последним из startup-хендлеров: дальше бот уже принимает апдейты
+    dp.startup.register(startup_timer.ready)
 
-    # Middleware (будет работать даже без БД благодаря обработке ошибок)
-    dp.update.middleware(SpamProtectionMiddleware())
+    # Режимы с aiohttp-сервером импортируем только когда они выбраны
+    if BOT_MODE == "webhook":
+        from bot.webhook import run_webhook
 
-    # Роутеры
-    dp.include_router(start.router)
-    dp.include_router(menu.router)
-    dp.include_router(admin.router)
+        logger.info("Bot started in webhook mode... (DB: {})", db_breaker.state)
+        await run_webhook(bot, dp)
+        return
+
+    if BOT_MODE == "supervisor":
+        from bot.supervisor import run_supervisor
+
+        logger.info("Bot started in supervisor mode... (DB: {})", db_breaker.state)
+        await run_supervisor(bot, dp)
+        return
 
-    logger.info(f"Bot started polling... (DB: {'connected' if db_available else 'offline'})")
-    await dp.start_polling(bot)
+    # getUpdates не работает, пока установлен вебхук (например, после BOT_MODE=webhook)
+    await bot.delete_webhook()
+    logger.info("Bot started polling... (DB: {})", db_breaker.state)
+    # chat_member не приходит по умолчанию — запрашиваем все типы апдейтов, на которые есть хендлеры
+    await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,29 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+
+from bot.services.admin_stats import ActivityTracker, admin_stats
+
+
+class ActivityMiddleware(BaseMiddleware):
+    """
+    Внутренняя middleware на dp.update (dp.update.middleware): отмечает
+    пользователя как активного сегодня (DAU в админке). event_from_user к этому
+    моменту уже заполнен внешней UserContextMiddleware aiogram. Только запись
+    в set — в БД пишет ActivityTracker пачкой.
+    """
+
+    def __init__(self, tracker: ActivityTracker | None = None) -> None:
+        self._tracker = tracker or admin_stats.activity
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is not None and not user.is_bot:
+            self._tracker.record(user.id)
+        return await handler(event, data)
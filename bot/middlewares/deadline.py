@@ -0,0 +1,27 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+
+from bot.utils.deadline import UPDATE_DEADLINE, deadline
+
+
+class DeadlineMiddleware(BaseMiddleware):
+    """
+    Внешняя middleware на dp.update: задаёт бюджет времени на апдейт.
+    Сам хендлер не прерывается — бюджет читают сервисы (кэш пользователей,
+    проверка подписки) и БД (statement_timeout), чтобы вовремя вернуть
+    закэшированный или неполный ответ.
+    """
+
+    def __init__(self, seconds: float = UPDATE_DEADLINE) -> None:
+        self.seconds = seconds
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        with deadline(self.seconds):
+            return await handler(event, data)
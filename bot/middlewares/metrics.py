@@ -0,0 +1,168 @@
+from time import perf_counter
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+from aiogram.types import TelegramObject, Update
+
+from bot.db.database import db_breaker, get_pool_stats
+from bot.db.health import CLOSED, HALF_OPEN, OPEN
+from bot.middlewares.spam_protection import SpamProtectionMiddleware
+from bot.services.subscription import get_subscription_cache_stats
+from bot.services.user_service import get_user_cache_stats
+from bot.utils.metrics import (
+    BOT_API_ERRORS,
+    BOT_API_LATENCY,
+    REGISTRY,
+    UPDATE_ERRORS,
+    UPDATE_LATENCY,
+    CallbackMetric,
+)
+from bot.utils.logs import get_log_drops
+from bot.utils.startup import startup_timer
+
+# Ключ в data: словарь меток, который заполняет внутренняя middleware
+METRICS_LABELS_KEY = "metrics_labels"
+UNHANDLED = "unhandled"
+_BREAKER_STATES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """
+    Внешняя middleware на dp.update: время обработки апдейта целиком
+    (включая антиспам, фильтры и хендлер). Роутер и хендлер известны только
+    внутри роутера — их дописывает HandlerLabelMiddleware в общий словарь меток.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        labels = {"event_type": event.event_type, "router": UNHANDLED, "handler": UNHANDLED}
+        data[METRICS_LABELS_KEY] = labels
+        started = perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception as exc:
+            UPDATE_ERRORS.inc(event_type=labels["event_type"], error=type(exc).__name__)
+            raise
+        finally:
+            UPDATE_LATENCY.observe(perf_counter() - started, **labels)
+
+
+class HandlerLabelMiddleware(BaseMiddleware):
+    """Внутренняя middleware: вызывается только для сработавшего хендлера"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        labels = data.get(METRICS_LABELS_KEY)
+        if labels is not None:
+            router = data.get("event_router")
+            handler_object = data.get("handler")
+            labels["router"] = (router.name if router else None) or UNHANDLED
+            if handler_object is not None:
+                labels["handler"] = getattr(handler_object.callback, "__name__", UNHANDLED)
+        return await handler(event, data)
+
+
+class BotApiMetricsMiddleware(BaseRequestMiddleware):
+    """Время вызовов Bot API по методам (bot.session.middleware)"""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        name = type(method).__name__
+        started = perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as exc:
+            BOT_API_ERRORS.inc(method=name, error=type(exc).__name__)
+            raise
+        finally:
+            BOT_API_LATENCY.observe(perf_counter() - started, method=name)
+
+
+def _cache_stats(field: str) -> Dict[tuple, float]:
+    return {
+        ("users",): getattr(get_user_cache_stats(), field),
+        ("subscription",): getattr(get_subscription_cache_stats(), field),
+    }
+
+
+def _limiter_stats(spam_protection: SpamProtectionMiddleware, field: str) -> Dict[tuple, float]:
+    # Бэкенд без состояния в процессе (db, redis без fallback) — метрики пустые
+    stats = spam_protection.memory_stats()
+    return {} if stats is None else {(): getattr(stats, field)}
+
+
+def register_collectors(spam_protection: SpamProtectionMiddleware | None = None) -> None:
+    """Метрики, которые читаются из уже существующих счётчиков при каждом /metrics"""
+    for field in ("hits", "misses", "stale_hits", "negative_hits", "evictions"):
+        REGISTRY.register(CallbackMetric(
+            f"bot_cache_{field}_total", f"Cache {field.replace('_', ' ')}",
+            lambda field=field: _cache_stats(field), ("cache",), type_name="counter",
+        ))
+    REGISTRY.register(CallbackMetric(
+        "bot_db_pool_checked_out", "Connections currently checked out", lambda: get_pool_stats().checked_out,
+    ))
+    REGISTRY.register(CallbackMetric(
+        "bot_db_pool_connects_total", "New physical DB connections", lambda: get_pool_stats().connects,
+        type_name="counter",
+    ))
+    REGISTRY.register(CallbackMetric(
+        "bot_db_pool_acquire_seconds_total", "Time spent acquiring pooled connections",
+        lambda: get_pool_stats().acquire_seconds, type_name="counter",
+    ))
+    REGISTRY.register(CallbackMetric(
+        "bot_db_breaker_state", "DB circuit breaker: 0 closed, 1 half-open, 2 open",
+        lambda: _BREAKER_STATES[db_breaker.state],
+    ))
+    REGISTRY.register(CallbackMetric(
+        "bot_db_breaker_rejected_total", "DB calls rejected by the open circuit breaker",
+        lambda: db_breaker.stats.rejected, type_name="counter",
+    ))
+    REGISTRY.register(CallbackMetric(
+        "bot_log_dropped_total", "Log records dropped because the sink queue was full",
+        lambda: {(name,): dropped for name, dropped in get_log_drops().items()}, ("sink",), type_name="counter",
+    ))
+    if spam_protection is not None:
+        for name, field, documentation, type_name in (
+            ("bot_rate_limit_tracked_keys", "tracked_keys", "Users tracked by the in-process rate limiter", "gauge"),
+            ("bot_rate_limit_memory_bytes", "approx_bytes", "Approximate memory of the in-process rate limiter", "gauge"),
+            ("bot_rate_limit_evictions_total", "evicted", "Rate limiter keys evicted over max_keys", "counter"),
+        ):
+            REGISTRY.register(CallbackMetric(
+                name, documentation, lambda field=field: _limiter_stats(spam_protection, field), type_name=type_name,
+            ))
+    REGISTRY.register(CallbackMetric(
+        "bot_startup_seconds", "Process startup time by phase",
+        lambda: {(name,): seconds for name, seconds in startup_timer.phases.items()}, ("phase",),
+    ))
+
+
+def setup_metrics(dp: Dispatcher, spam_protection: SpamProtectionMiddleware | None = None) -> None:
+    """
+    Вешает middleware на диспетчер; внутренняя — на все типы событий роутеров.
+    spam_protection — антиспам этого диспетчера, чтобы отдавать память его лимитера.
+    """
+    register_collectors(spam_protection)
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    label_middleware = HandlerLabelMiddleware()
+    for name, observer in dp.observers.items():
+        if name not in ("update", "error"):
+            observer.middleware(label_middleware)
+
+
+def setup_bot_metrics(bot: Bot) -> None:
+    bot.session.middleware(BotApiMetricsMiddleware())
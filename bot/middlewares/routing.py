@@ -0,0 +1,65 @@
+from typing import Any, Awaitable, Callable, Dict, List
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.dispatcher.event.bases import SkipHandler
+from aiogram.dispatcher.middlewares.manager import MiddlewareManager
+from aiogram.types import Message
+from loguru import logger
+
+from bot.utils.routing import ROUTED_KEY, ExactRouteIndex, Route, message_keys
+
+
+def _inner_middlewares(route: Route) -> List[Any]:
+    """Внутренние middleware на message от корня до роутера хендлера — как при обычной обработке"""
+    middlewares: List[Any] = []
+    for router in reversed(tuple(route.router.chain_head)):
+        middlewares.extend(router.message.middleware)
+    return middlewares
+
+
+class ExactRoutingMiddleware(BaseMiddleware):
+    """
+    Внешняя middleware на dp.message: кнопки и команды находятся по хеш-таблице
+    и сразу уходят в свой хендлер — фильтры проверяются только у кандидатов,
+    а не у каждого хендлера каждого роутера по очереди. Внутренние middleware
+    роутеров (метрики и т.п.) вызываются как при обычной обработке. Если
+    кандидат отказался (SkipHandler), пробуем следующих; если не подошёл ни
+    один — обычная цепочка, в которой проиндексированные хендлеры уже
+    пропускаются (фильтр NotRouted), так что никто не вызывается дважды.
+    """
+
+    def __init__(self, index: ExactRouteIndex) -> None:
+        self.index = index
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
+        event: Message,
+        data: Dict[str, Any],
+    ) -> Any:
+        for route in self.index.candidates(message_keys(event)):
+            kwargs = {**data, "event_router": route.router, "handler": route.handler}
+            matched, filter_data = await route.handler.check(event, **kwargs)
+            if not matched:
+                continue
+            kwargs.update(filter_data)
+            wrapped = MiddlewareManager.wrap_middlewares(_inner_middlewares(route), route.handler.call)
+            try:
+                return await wrapped(event, kwargs)
+            except SkipHandler:
+                continue  # Как в обычной цепочке: следующий подходящий хендлер
+        return await handler(event, {**data, ROUTED_KEY: True})
+
+
+def setup_exact_routing(dp: Dispatcher) -> ExactRouteIndex:
+    """
+    Строит индекс по уже подключённым роутерам (вызывать после include_router).
+    Middleware должна быть последней внешней на dp.message: всё, что
+    зарегистрировано после неё, быстрый путь обошёл бы.
+    """
+    index = ExactRouteIndex.build(dp)
+    dp.message.outer_middleware(ExactRoutingMiddleware(index))
+    logger.debug(
+        "Exact routing: {} keys for {} handlers (stopped at {})", len(index), index.indexed, index.stopped_at,
+    )
+    return index
@@ -1,31 +1,47 @@
 from aiogram import BaseMiddleware
 from aiogram.types import Update
-from collections import deque
-from datetime import datetime, timedelta
-from time import monotonic
-from typing import Any, Awaitable, Callable, Deque, Dict
+from typing import Any, Awaitable, Callable, Dict
 import os
-from sqlalchemy import select, func
-from sqlalchemy.exc import DBAPIError
 
-from bot.db.database import AsyncSessionLocal
-from bot.db.models import RateLimitEntry
+from bot.services.rate_limit import (
+    LimiterMemoryStats,
+    RateLimit,
+    RateLimiter,
+    create_rate_limiter,
+    parse_rate_limit,
+    parse_rate_limits,
+)
+from bot.utils.metrics import RATE_LIMIT_REJECTIONS
 
 class SpamProtectionMiddleware(BaseMiddleware):
     """
-    Защита от спама с хранением в БД (Async).
-    С обработкой ошибок подключения.
+    Защита от спама. Бэкенд выбирается через RATE_LIMIT_BACKEND:
+    memory — в памяти процесса, db — локальные счётчики с синхронизацией через БД,
+    redis — общий лимит для всех воркеров.
+    Лимиты задаются по типу апдейта: RATE_LIMITS="message=30/60,callback_query=60/60".
     """
 
-    MAX_REQUESTS = 30
-    TIME_PERIOD = 60
     SKIP_ADMINS = True
     RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
-
-    _memory_requests: Dict[int, Deque[float]] = {}
+    DEFAULT_LIMIT = parse_rate_limit(os.getenv("RATE_LIMIT_DEFAULT", "30/60")) or RateLimit(30, 60)
+    LIMITS = parse_rate_limits(os.getenv("RATE_LIMITS", ""))
 
     ADMIN_ID = int(os.getenv("ADMIN_ID", "0"))
 
+    def __init__(
+        self,
+        limiter: RateLimiter | None = None,
+        limits: Dict[str, RateLimit] | None = None,
+    ) -> None:
+        self._limiter = limiter or create_rate_limiter(self.RATE_LIMIT_BACKEND)
+        self._limits = self.LIMITS if limits is None else limits
+
+    async def close(self) -> None:
+        await self._limiter.close()
+
+    def memory_stats(self) -> LimiterMemoryStats | None:
+        return self._limiter.memory_stats()
+
     async def __call__(
         self,
         handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
@@ -40,19 +56,12 @@ class SpamProtectionMiddleware(BaseMiddleware):
         if self.SKIP_ADMINS and user_id == self.ADMIN_ID:
             return await handler(event, data)
 
-        if self.RATE_LIMIT_BACKEND == "db":
-            try:
-                if not await self._check_limit_db(user_id):
-                    await self._send_rate_limit_exceeded(event)
-                    return
-                await self._add_request_db(user_id)
-            except (DBAPIError, OSError, Exception) as e:
-                print(f"SpamProtection DB error (skipping check): {e}")
-        else:
-            if not self._check_limit_memory(user_id):
-                await self._send_rate_limit_exceeded(event)
-                return
-            self._add_request_memory(user_id)
+        scope = event.event_type
+        limit = self._limits.get(scope, self.DEFAULT_LIMIT)
+        if not await self._limiter.hit(scope, user_id, limit):
+            RATE_LIMIT_REJECTIONS.inc(scope=scope)
+            await self._send_rate_limit_exceeded(event)
+            return
 
         return await handler(event, data)
 
@@ -70,43 +79,3 @@ class SpamProtectionMiddleware(BaseMiddleware):
             await event.message.answer("Слишком много запросов. Подожди немного.")
         elif event.callback_query:
             await event.callback_query.answer("Слишком много запросов.")
-
-    def _check_limit_memory(self, telegram_id: int) -> bool:
-        now = monotonic()
-        window_start = now - self.TIME_PERIOD
-
-        bucket = self._memory_requests.get(telegram_id)
-        if bucket is None:
-            bucket = deque()
-            self._memory_requests[telegram_id] = bucket
-
-        while bucket and bucket[0] < window_start:
-            bucket.popleft()
-
-        return len(bucket) < self.MAX_REQUESTS
-
-    def _add_request_memory(self, telegram_id: int) -> None:
-        bucket = self._memory_requests.get(telegram_id)
-        if bucket is None:
-            bucket = deque()
-            self._memory_requests[telegram_id] = bucket
-        bucket.append(monotonic())
-
-    async def _check_limit_db(self, telegram_id: int) -> bool:
-        async with AsyncSessionLocal() as session:
-            cutoff_time = datetime.utcnow() - timedelta(seconds=self.TIME_PERIOD)
-            
-            stmt = select(func.count(RateLimitEntry.id)).where(
-                RateLimitEntry.telegram_id == telegram_id,
-                RateLimitEntry.created_at >= cutoff_time
-            )
-            result = await session.execute(stmt)
-            count = result.scalar() or 0
-            
-            return count < self.MAX_REQUESTS
-
-    async def _add_request_db(self, telegram_id: int) -> None:
-        async with AsyncSessionLocal() as session:
-            entry = RateLimitEntry(telegram_id=telegram_id)
-            session.add(entry)
-            await session.commit()
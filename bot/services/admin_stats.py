@@ -0,0 +1,220 @@
+import asyncio
+import os
+from dataclasses import dataclass, replace
+from datetime import date, datetime, timedelta
+from time import monotonic
+from typing import Callable, Set
+
+from loguru import logger
+from sqlalchemy import delete, func, select, true
+from sqlalchemy.exc import DBAPIError
+
+from bot.db.database import AsyncSessionLocal, dialect_insert
+from bot.db.models import BroadcastJob, SparringProfile, User, UserActivity
+
+# Сколько секунд админка показывает снимок без пересчёта
+ADMIN_STATS_TTL = float(os.getenv("ADMIN_STATS_TTL", "300"))
+# Фоновый пересчёт снимка (0 — только по запросу, когда снимок устарел)
+ADMIN_STATS_REFRESH_SECONDS = float(os.getenv("ADMIN_STATS_REFRESH_SECONDS", "300"))
+# Активность копится в памяти и пишется в user_activity пачкой
+ACTIVITY_FLUSH_SECONDS = float(os.getenv("ACTIVITY_FLUSH_SECONDS", "60"))
+ACTIVITY_RETENTION_DAYS = int(os.getenv("ACTIVITY_RETENTION_DAYS", "90"))
+# Доставка рассылок — по заданиям за последние N дней
+BROADCAST_STATS_DAYS = int(os.getenv("BROADCAST_STATS_DAYS", "30"))
+
+WEEK = timedelta(days=7)
+
+
+@dataclass(frozen=True)
+class StatsSnapshot:
+    total_users: int
+    blocked_users: int
+    new_users_today: int
+    new_users_week: int
+    total_profiles: int
+    active_profiles: int
+    profiles_updated_week: int  # Профили, изменённые за 7 дней
+    dau: int
+    wau: int
+    broadcast_sent: int
+    broadcast_failed: int
+    broadcast_blocked: int
+    computed_at: datetime
+
+    @property
+    def delivery_rate(self) -> float | None:
+        attempted = self.broadcast_sent + self.broadcast_failed + self.broadcast_blocked
+        return self.broadcast_sent / attempted if attempted else None
+
+
+class ActivityTracker:
+    """
+    DAU по трафику апдейтов: пользователи за текущие сутки (UTC) копятся в
+    памяти и раз в ACTIVITY_FLUSH_SECONDS пишутся в user_activity одной
+    вставкой с ON CONFLICT DO NOTHING. Уже записанных за сегодня повторно
+    не пишем — на пользователя одна строка в сутки от каждого процесса.
+    """
+
+    def __init__(self, today: Callable[[], date] = lambda: datetime.utcnow().date()) -> None:
+        self._today = today
+        self._day = today()
+        self._pending: Set[int] = set()
+        self._flushed: Set[int] = set()
+
+    def record(self, telegram_id: int) -> None:
+        day = self._today()
+        if day != self._day:
+            # Новые сутки: вчерашний остаток уйдёт со следующей пачкой под новой датой —
+            # не страшно, пользователь был активен на границе суток
+            self._day = day
+            self._flushed.clear()
+        if telegram_id not in self._flushed:
+            self._pending.add(telegram_id)
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+        day, batch, self._pending = self._day, self._pending, set()
+        try:
+            async with AsyncSessionLocal() as session:
+                stmt = dialect_insert(session, UserActivity).values(
+                    [{"day": day, "telegram_id": telegram_id} for telegram_id in batch]
+                ).on_conflict_do_nothing(index_elements=["day", "telegram_id"])
+                await session.execute(stmt)
+                await session.commit()
+        except (DBAPIError, OSError, Exception) as exc:
+            self._pending |= batch  # Отправим со следующей пачкой
+            logger.warning("activity flush error: {}", type(exc).__name__)
+            return
+        if day == self._day:
+            self._flushed |= batch
+
+    async def prune(self) -> None:
+        try:
+            async with AsyncSessionLocal() as session:
+                await session.execute(
+                    delete(UserActivity).where(UserActivity.day < self._day - timedelta(days=ACTIVITY_RETENTION_DAYS))
+                )
+                await session.commit()
+        except (DBAPIError, OSError, Exception) as exc:
+            logger.warning("activity prune error: {}", type(exc).__name__)
+
+
+def _stats_select(now: datetime):
+    """
+    Вся сводка одним запросом: по одному агрегату на таблицу
+    (COUNT ... FILTER вместо отдельного COUNT(*) на каждое условие).
+    """
+    today_start = datetime(now.year, now.month, now.day)
+    week_start = now - WEEK
+    users = select(
+        func.count(User.id).label("total_users"),
+        func.count(User.id).filter(User.is_blocked.is_(True)).label("blocked_users"),
+        func.count(User.id).filter(User.created_at >= today_start).label("new_users_today"),
+        func.count(User.id).filter(User.created_at >= week_start).label("new_users_week"),
+    ).subquery()
+    profiles = select(
+        func.count(SparringProfile.id).label("total_profiles"),
+        func.count(SparringProfile.id).filter(SparringProfile.is_active.is_(True)).label("active_profiles"),
+        func.count(SparringProfile.id).filter(SparringProfile.updated_at >= week_start).label("profiles_updated_week"),
+    ).subquery()
+    # Активность — по первичному ключу (day, telegram_id) за неделю; заданий рассылок немного
+    activity = select(
+        func.count(UserActivity.telegram_id.distinct()).filter(UserActivity.day == today_start.date()).label("dau"),
+        func.count(UserActivity.telegram_id.distinct()).label("wau"),
+    ).where(UserActivity.day > (now - WEEK).date()).subquery()
+    broadcasts = select(
+        func.coalesce(func.sum(BroadcastJob.sent), 0).label("broadcast_sent"),
+        func.coalesce(func.sum(BroadcastJob.failed), 0).label("broadcast_failed"),
+        func.coalesce(func.sum(BroadcastJob.blocked), 0).label("broadcast_blocked"),
+    ).where(BroadcastJob.created_at >= now - timedelta(days=BROADCAST_STATS_DAYS)).subquery()
+    return select(users, profiles, activity, broadcasts).select_from(
+        users.join(profiles, true()).join(activity, true()).join(broadcasts, true())
+    )
+
+
+class AdminStatsService:
+    """
+    Снимок статистики для админки. Пересчитывается одним агрегирующим
+    запросом в фоне или по запросу, если снимок старше ADMIN_STATS_TTL;
+    между пересчётами новые пользователи добавляются к снимку на месте.
+    """
+
+    def __init__(
+        self,
+        ttl: float = ADMIN_STATS_TTL,
+        refresh_interval: float = ADMIN_STATS_REFRESH_SECONDS,
+        clock: Callable[[], float] = monotonic,
+        now: Callable[[], datetime] = datetime.utcnow,
+    ) -> None:
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self.activity = ActivityTracker(today=lambda: now().date())
+        self._clock = clock
+        self._now = now
+        self._snapshot: StatsSnapshot | None = None
+        self._refreshed_at = 0.0
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+
+    @property
+    def snapshot(self) -> StatsSnapshot | None:
+        return self._snapshot
+
+    async def get(self) -> StatsSnapshot:
+        if self._snapshot is not None and self._clock() - self._refreshed_at < self.ttl:
+            return self._snapshot
+        async with self._lock:
+            # Пока ждали блокировку, снимок мог обновить другой запрос
+            if self._snapshot is not None and self._clock() - self._refreshed_at < self.ttl:
+                return self._snapshot
+            return await self.refresh()
+
+    async def refresh(self) -> StatsSnapshot:
+        # Свежая активность этого процесса должна попасть в DAU
+        await self.activity.flush()
+        now = self._now()
+        async with AsyncSessionLocal() as session:
+            row = (await session.execute(_stats_select(now))).one()
+        self._snapshot = StatsSnapshot(**{key: int(value or 0) for key, value in row._mapping.items()}, computed_at=now)
+        self._refreshed_at = self._clock()
+        return self._snapshot
+
+    def on_user_created(self) -> None:
+        """Инкремент вместо пересчёта: счётчики пользователей актуальны до следующего снимка"""
+        if self._snapshot is None:
+            return
+        self._snapshot = replace(
+            self._snapshot,
+            total_users=self._snapshot.total_users + 1,
+            new_users_today=self._snapshot.new_users_today + 1,
+            new_users_week=self._snapshot.new_users_week + 1,
+        )
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.activity.flush()
+
+    async def _run(self) -> None:
+        last_prune: date | None = None
+        while True:
+            await asyncio.sleep(ACTIVITY_FLUSH_SECONDS)
+            await self.activity.flush()
+            today = self._now().date()
+            if last_prune != today:
+                last_prune = today
+                await self.activity.prune()
+            if self.refresh_interval and self._clock() - self._refreshed_at >= self.refresh_interval:
+                try:
+                    await self.refresh()
+                except (DBAPIError, OSError, Exception) as exc:
+                    logger.warning("admin stats refresh failed: {}", type(exc).__name__)
+
+
+admin_stats = AdminStatsService()
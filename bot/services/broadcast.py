@@ -0,0 +1,273 @@
+import asyncio
+import os
+from dataclasses import dataclass
+from time import monotonic
+from typing import Awaitable, Callable, Dict, Iterable, List, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+from loguru import logger
+
+from bot.utils.metrics import BROADCAST_MESSAGES
+
+# Telegram допускает ~30 сообщений/сек на бота и ~1 сообщение/сек в один чат.
+# Держим запас, чтобы не ловить flood control на пике.
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "8"))
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))
+BROADCAST_MIN_RATE = float(os.getenv("BROADCAST_MIN_RATE", "3"))
+BROADCAST_PER_CHAT_INTERVAL = float(os.getenv("BROADCAST_PER_CHAT_INTERVAL", "1.0"))
+BROADCAST_MAX_ATTEMPTS = int(os.getenv("BROADCAST_MAX_ATTEMPTS", "3"))
+BROADCAST_PROGRESS_INTERVAL = float(os.getenv("BROADCAST_PROGRESS_INTERVAL", "3"))
+
+FLOOD_RATE_FACTOR = 0.5  # Во сколько раз режем скорость после RetryAfter
+NETWORK_BACKOFF_SECONDS = 0.5
+BLOCKED_FLUSH_SIZE = 50
+
+# Ошибки BadRequest, после которых писать пользователю бессмысленно
+UNREACHABLE_MARKERS = ("chat not found", "user is deactivated", "bot was blocked")
+
+ProgressCallback = Callable[["BroadcastStats"], Awaitable[None]]
+BlockedCallback = Callable[[List[int]], Awaitable[None]]
+
+
+@dataclass
+class BroadcastStats:
+    total: int = 0
+    sent: int = 0
+    failed: int = 0
+    blocked: int = 0
+    retries: int = 0
+
+    @property
+    def done(self) -> int:
+        return self.sent + self.failed + self.blocked
+
+
+class TokenBucket:
+    """
+    Token bucket с возможностью паузы и изменения скорости на лету.
+    Ожидающие получают токены строго по очереди (FIFO через lock).
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None) -> None:
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    @property
+    def paused(self) -> bool:
+        return monotonic() < self._paused_until
+
+    def pause(self, seconds: float) -> None:
+        now = monotonic()
+        self._paused_until = max(self._paused_until, now + seconds)
+        self._tokens = 0
+        self._updated = now
+
+
+class BroadcastEngine:
+    """
+    Рассылка через пул воркеров с общим token bucket.
+    RetryAfter ставит на паузу весь пул и снижает скорость (AIMD),
+    заблокировавшие бота пользователи отдаются в on_blocked пачками.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        *,
+        concurrency: int = BROADCAST_CONCURRENCY,
+        rate: float = BROADCAST_RATE,
+        min_rate: float = BROADCAST_MIN_RATE,
+        per_chat_interval: float = BROADCAST_PER_CHAT_INTERVAL,
+        max_attempts: int = BROADCAST_MAX_ATTEMPTS,
+        progress_interval: float = BROADCAST_PROGRESS_INTERVAL,
+        on_blocked: BlockedCallback | None = None,
+    ) -> None:
+        self._bot = bot
+        self._concurrency = max(1, concurrency)
+        self._max_rate = rate
+        self._min_rate = min(min_rate, rate)
+        self._per_chat_interval = per_chat_interval
+        self._max_attempts = max(1, max_attempts)
+        self._progress_interval = progress_interval
+        self._on_blocked = on_blocked
+
+        self._bucket = TokenBucket(rate)
+        self._chat_last_sent: Dict[int, float] = {}
+        self._success_streak = 0
+        self._blocked_buffer: List[int] = []
+        self.stats = BroadcastStats()
+
+    async def run(
+        self,
+        chat_ids: Iterable[int],
+        text: str,
+        on_progress: ProgressCallback | None = None,
+    ) -> BroadcastStats:
+        return await self.run_messages(((chat_id, text) for chat_id in chat_ids), on_progress)
+
+    async def run_messages(
+        self,
+        messages: Iterable[Tuple[int, str]],
+        on_progress: ProgressCallback | None = None,
+    ) -> BroadcastStats:
+        """Как run, но у каждого получателя свой текст (персональные уведомления)"""
+        messages = list(messages)
+        self.stats = BroadcastStats(total=len(messages))
+
+        queue: asyncio.Queue[Tuple[int, str] | None] = asyncio.Queue(maxsize=self._concurrency * 2)
+        workers = [asyncio.create_task(self._worker(queue)) for _ in range(self._concurrency)]
+        reporter = asyncio.create_task(self._report(on_progress)) if on_progress else None
+
+        try:
+            for message in messages:
+                await queue.put(message)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            if reporter:
+                reporter.cancel()
+            await self._flush_blocked()
+
+        return self.stats
+
+    async def _worker(self, queue: "asyncio.Queue[Tuple[int, str] | None]") -> None:
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            chat_id, text = item
+            try:
+                await self._deliver(chat_id, text)
+            finally:
+                self._chat_last_sent.pop(chat_id, None)
+
+    async def _deliver(self, chat_id: int, text: str) -> None:
+        for attempt in range(1, self._max_attempts + 1):
+            await self._wait_for_chat(chat_id)
+            await self._bucket.acquire()
+            self._chat_last_sent[chat_id] = monotonic()
+            try:
+                await self._bot.send_message(chat_id, text)
+            except TelegramRetryAfter as exc:
+                self.stats.retries += 1
+                BROADCAST_MESSAGES.inc(result="retry")
+                self._on_flood(exc.retry_after)
+                continue
+            except TelegramForbiddenError:
+                await self._mark_blocked(chat_id)
+                return
+            except TelegramBadRequest as exc:
+                if any(marker in exc.message.lower() for marker in UNREACHABLE_MARKERS):
+                    await self._mark_blocked(chat_id)
+                else:
+                    self.stats.failed += 1
+                    BROADCAST_MESSAGES.inc(result="failed")
+                    logger.warning("broadcast send failed: {}", type(exc).__name__)
+                return
+            except (TelegramNetworkError, TelegramServerError) as exc:
+                self.stats.retries += 1
+                BROADCAST_MESSAGES.inc(result="retry")
+                logger.debug("broadcast transient error: {}", type(exc).__name__)
+                await asyncio.sleep(NETWORK_BACKOFF_SECONDS * 2 ** (attempt - 1))
+                continue
+            except Exception as exc:
+                self.stats.failed += 1
+                BROADCAST_MESSAGES.inc(result="failed")
+                logger.warning("broadcast send failed: {}", type(exc).__name__)
+                return
+            else:
+                self.stats.sent += 1
+                BROADCAST_MESSAGES.inc(result="sent")
+                self._on_success()
+                return
+
+        self.stats.failed += 1
+        BROADCAST_MESSAGES.inc(result="failed")
+        logger.warning("broadcast gave up on chat after {} attempts", self._max_attempts)
+
+    async def _wait_for_chat(self, chat_id: int) -> None:
+        last_sent = self._chat_last_sent.get(chat_id)
+        if last_sent is None:
+            return
+        delay = last_sent + self._per_chat_interval - monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _on_flood(self, retry_after: float) -> None:
+        # Несколько воркеров ловят один и тот же флуд — скорость режем один раз
+        already_paused = self._bucket.paused
+        self._bucket.pause(retry_after)
+        if already_paused:
+            return
+        self._bucket.rate = max(self._min_rate, self._bucket.rate * FLOOD_RATE_FACTOR)
+        self._success_streak = 0
+        logger.warning(
+            "broadcast flood control: pause {}s, rate -> {:.1f}/s",
+            retry_after,
+            self._bucket.rate,
+        )
+
+    def _on_success(self) -> None:
+        if self._bucket.rate >= self._max_rate:
+            return
+        self._success_streak += 1
+        # Аддитивно восстанавливаем скорость: +1 msg/s за каждую "секунду" без флуда
+        if self._success_streak >= self._bucket.rate:
+            self._bucket.rate = min(self._max_rate, self._bucket.rate + 1)
+            self._success_streak = 0
+
+    async def _mark_blocked(self, chat_id: int) -> None:
+        self.stats.blocked += 1
+        BROADCAST_MESSAGES.inc(result="blocked")
+        self._blocked_buffer.append(chat_id)
+        if len(self._blocked_buffer) >= BLOCKED_FLUSH_SIZE:
+            await self._flush_blocked()
+
+    async def _flush_blocked(self) -> None:
+        if not self._blocked_buffer or not self._on_blocked:
+            self._blocked_buffer.clear()
+            return
+        batch, self._blocked_buffer = self._blocked_buffer, []
+        try:
+            await self._on_blocked(batch)
+        except Exception as exc:
+            logger.warning("broadcast blocked flush failed: {}", type(exc).__name__)
+
+    async def _report(self, on_progress: ProgressCallback) -> None:
+        while True:
+            await asyncio.sleep(self._progress_interval)
+            try:
+                await on_progress(self.stats)
+            except Exception as exc:
+                logger.debug("broadcast progress update failed: {}", type(exc).__name__)
@@ -0,0 +1,374 @@
+import asyncio
+import os
+import socket
+from contextlib import aclosing
+from datetime import datetime, timedelta
+from enum import Enum
+from time import monotonic
+from typing import Dict, List
+
+from aiogram import Bot
+from loguru import logger
+from sqlalchemy import and_, case, or_, select, update
+from sqlalchemy.exc import DBAPIError
+
+from bot.db.database import AsyncSessionLocal
+from bot.db.models import BroadcastJob
+from bot.keyboards.inline import get_broadcast_job_keyboard
+from bot.services.broadcast import BROADCAST_PROGRESS_INTERVAL, BroadcastEngine, BroadcastStats
+from bot.services.recipients import (
+    ALL_USERS,
+    RecipientSegment,
+    count_recipients,
+    iter_chunks,
+    iter_recipients,
+)
+from bot.services.user_service import mark_users_blocked
+from bot.utils.deadline import unbounded
+
+# Сколько получателей обрабатываем между сохранениями курсора.
+# После рестарта повторно могут получить сообщение максимум столько человек.
+BROADCAST_CHECKPOINT_SIZE = int(os.getenv("BROADCAST_CHECKPOINT_SIZE", "100"))
+# Аренда задания (секунды): продлевается на каждом чекпоинте. Задание RUNNING, чей
+# владелец не отмечался дольше, считается брошенным (процесс упал) и подхватывается
+# другим. Должна быть заметно больше времени отправки одной пачки.
+BROADCAST_LEASE_SECONDS = float(os.getenv("BROADCAST_LEASE_SECONDS", "120"))
+# Владелец аренды — процесс: у воркеров supervisor один хост, но разные pid
+RUNNER_ID = f"{socket.gethostname()}-{os.getpid()}"
+
+
+class BroadcastJobStatus(str, Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    PAUSED = "paused"
+    CANCELLED = "cancelled"
+    DONE = "done"
+
+
+RESUMABLE_STATUSES = (BroadcastJobStatus.PENDING.value, BroadcastJobStatus.RUNNING.value)
+
+STATUS_LABELS = {
+    BroadcastJobStatus.PENDING.value: "⏳ В очереди",
+    BroadcastJobStatus.RUNNING.value: "⏳ Идёт",
+    BroadcastJobStatus.PAUSED.value: "⏸ На паузе",
+    BroadcastJobStatus.CANCELLED.value: "❌ Отменена",
+    BroadcastJobStatus.DONE.value: "✅ Завершена",
+}
+
+
+def render_job(job: BroadcastJob, in_flight: BroadcastStats | None = None) -> str:
+    sent = job.sent + (in_flight.sent if in_flight else 0)
+    failed = job.failed + (in_flight.failed if in_flight else 0)
+    blocked = job.blocked + (in_flight.blocked if in_flight else 0)
+    done = sent + failed + blocked
+
+    text = (
+        f"📢 Рассылка #{job.id}: {STATUS_LABELS.get(job.status, job.status)}\n"
+        f"Обработано: {done}/{job.total}, отправлено: {sent}"
+    )
+    if blocked:
+        text += f"\nЗаблокировали бота: {blocked}"
+    if failed:
+        text += f"\nОшибок: {failed}"
+    return text
+
+
+async def create_job(
+    text: str,
+    created_by: int | None,
+    segment: RecipientSegment = ALL_USERS,
+    status_chat_id: int | None = None,
+    status_message_id: int | None = None,
+) -> BroadcastJob:
+    total = await count_recipients(segment)
+    async with AsyncSessionLocal() as session:
+        job = BroadcastJob(
+            text=text,
+            status=BroadcastJobStatus.PENDING.value,
+            created_by=created_by,
+            segment=segment.to_dict(),
+            total=total,
+            status_chat_id=status_chat_id,
+            status_message_id=status_message_id,
+        )
+        session.add(job)
+        await session.commit()
+        return job
+
+
+async def get_job(job_id: int) -> BroadcastJob | None:
+    async with AsyncSessionLocal() as session:
+        return await session.get(BroadcastJob, job_id)
+
+
+async def _set_status(job_id: int, status: BroadcastJobStatus, only_from: tuple[str, ...]) -> BroadcastJob | None:
+    """Меняет статус, только если текущий входит в only_from. Возвращает задание или None."""
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            update(BroadcastJob)
+            .where(BroadcastJob.id == job_id, BroadcastJob.status.in_(only_from))
+            .values(status=status.value)
+        )
+        await session.commit()
+        if not result.rowcount:
+            return None
+        return await session.get(BroadcastJob, job_id)
+
+
+def _claimable(owner: str, lease_seconds: float):
+    """
+    Задание можно взять: ещё не начато, или RUNNING без живого владельца
+    (аренда просрочена или снята), или уже наше
+    """
+    expired_before = datetime.utcnow() - timedelta(seconds=lease_seconds)
+    running = BroadcastJob.status == BroadcastJobStatus.RUNNING.value
+    return or_(
+        BroadcastJob.status == BroadcastJobStatus.PENDING.value,
+        and_(
+            running,
+            or_(
+                BroadcastJob.owner.is_(None),
+                BroadcastJob.owner == owner,
+                BroadcastJob.heartbeat_at.is_(None),
+                BroadcastJob.heartbeat_at < expired_before,
+            ),
+        ),
+    )
+
+
+async def _claim(job_id: int, owner: str, lease_seconds: float) -> BroadcastJob | None:
+    """Атомарно берёт аренду задания. None — задание шлёт другой процесс или оно уже не активно"""
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            update(BroadcastJob)
+            .where(BroadcastJob.id == job_id, _claimable(owner, lease_seconds))
+            .values(status=BroadcastJobStatus.RUNNING.value, owner=owner, heartbeat_at=datetime.utcnow())
+        )
+        await session.commit()
+        if not result.rowcount:
+            return None
+        return await session.get(BroadcastJob, job_id)
+
+
+async def _checkpoint(job_id: int, owner: str, cursor: int, stats: BroadcastStats) -> BroadcastJob | None:
+    """
+    Сохраняет курсор и продлевает аренду. None — аренду перехватил другой процесс,
+    продолжать нельзя. Если задание больше не RUNNING (пауза, отмена), аренда
+    снимается в том же UPDATE — продолжить его сможет любой процесс.
+    """
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            update(BroadcastJob)
+            .where(BroadcastJob.id == job_id, BroadcastJob.owner == owner)
+            .values(
+                cursor=cursor,
+                sent=BroadcastJob.sent + stats.sent,
+                failed=BroadcastJob.failed + stats.failed,
+                blocked=BroadcastJob.blocked + stats.blocked,
+                heartbeat_at=datetime.utcnow(),
+                owner=case(
+                    (BroadcastJob.status == BroadcastJobStatus.RUNNING.value, BroadcastJob.owner),
+                    else_=None,
+                ),
+            )
+        )
+        await session.commit()
+        if not result.rowcount:
+            return None
+        return await session.get(BroadcastJob, job_id)
+
+
+async def _release(job_ids: List[int], owner: str) -> None:
+    """Снимает нашу аренду при остановке процесса — задания сразу подхватит следующий запуск"""
+    async with AsyncSessionLocal() as session:
+        await session.execute(
+            update(BroadcastJob)
+            .where(BroadcastJob.id.in_(job_ids), BroadcastJob.owner == owner)
+            .values(owner=None, heartbeat_at=None)
+        )
+        await session.commit()
+
+
+async def _load_resumable_job_ids(owner: str, lease_seconds: float) -> List[int]:
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(BroadcastJob.id)
+            .where(_claimable(owner, lease_seconds))
+            .order_by(BroadcastJob.id)
+        )
+        return list(result.scalars().all())
+
+
+class BroadcastJobRunner:
+    """
+    Фоновый исполнитель рассылок.
+    Курсор и счётчики сохраняются в БД после каждой пачки, поэтому после
+    рестарта задание продолжается с места остановки. Пауза и отмена
+    применяются на границе пачки. Задание шлёт только процесс, взявший
+    аренду (owner/heartbeat_at): в режиме supervisor рестарт воркера или
+    «Продолжить» из другого воркера не запускают вторую копию рассылки.
+    """
+
+    def __init__(
+        self,
+        checkpoint_size: int = BROADCAST_CHECKPOINT_SIZE,
+        lease_seconds: float = BROADCAST_LEASE_SECONDS,
+        owner: str = RUNNER_ID,
+    ) -> None:
+        self._bot: Bot | None = None
+        self._checkpoint_size = max(1, checkpoint_size)
+        self.lease_seconds = lease_seconds
+        self.owner = owner
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._last_render: Dict[int, float] = {}
+        self._watcher: asyncio.Task | None = None
+
+    async def start(self, bot: Bot) -> None:
+        """Продолжает брошенные задания и дальше раз в аренду подбирает те, чей владелец пропал"""
+        self._bot = bot
+        await self.resume_abandoned()
+        if self.lease_seconds > 0:
+            with unbounded():
+                self._watcher = asyncio.create_task(self._watch())
+
+    async def resume_abandoned(self) -> None:
+        try:
+            job_ids = await _load_resumable_job_ids(self.owner, self.lease_seconds)
+        except (DBAPIError, OSError, Exception) as exc:
+            logger.warning("broadcast runner resume error: {}", type(exc).__name__)
+            return
+
+        for job_id in job_ids:
+            if job_id not in self._tasks:
+                logger.info("Resuming broadcast job {}", job_id)
+                self._spawn(job_id)
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.lease_seconds)
+            await self.resume_abandoned()
+
+    async def attach(self, bot: Bot) -> None:
+        """Как start, но без продолжения заданий (их подхватывает другой процесс)"""
+        self._bot = bot
+
+    async def stop(self) -> None:
+        # Статус RUNNING остаётся в БД — задание продолжится при следующем запуске,
+        # аренду снимаем, чтобы не ждать её истечения
+        if self._watcher is not None:
+            self._watcher.cancel()
+            await asyncio.gather(self._watcher, return_exceptions=True)
+            self._watcher = None
+        job_ids = list(self._tasks)
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if job_ids:
+            try:
+                await _release(job_ids, self.owner)
+            except (DBAPIError, OSError, Exception) as exc:
+                logger.warning("broadcast lease release error: {}", type(exc).__name__)
+
+    def submit(self, job_id: int) -> None:
+        self._spawn(job_id)
+
+    async def pause(self, job_id: int) -> BroadcastJob | None:
+        return await _set_status(job_id, BroadcastJobStatus.PAUSED, RESUMABLE_STATUSES)
+
+    async def resume(self, job_id: int) -> BroadcastJob | None:
+        # Если прежний владелец ещё не дошёл до границы пачки и держит аренду,
+        # он увидит RUNNING на чекпоинте и продолжит сам, а наш запуск не возьмёт аренду
+        job = await _set_status(
+            job_id, BroadcastJobStatus.RUNNING, (BroadcastJobStatus.PAUSED.value,)
+        )
+        if job is not None:
+            self._spawn(job_id)
+        return job
+
+    async def cancel(self, job_id: int) -> BroadcastJob | None:
+        return await _set_status(
+            job_id,
+            BroadcastJobStatus.CANCELLED,
+            RESUMABLE_STATUSES + (BroadcastJobStatus.PAUSED.value,),
+        )
+
+    def _spawn(self, job_id: int) -> None:
+        task = self._tasks.get(job_id)
+        if task is not None and not task.done():
+            return
+        # Рассылку запускают из хендлера админки — бюджет того апдейта ей не нужен
+        with unbounded():
+            task = asyncio.create_task(self._run_job(job_id))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+
+    async def _run_job(self, job_id: int) -> None:
+        try:
+            job = await _claim(job_id, self.owner, self.lease_seconds)
+            if job is None:
+                return  # Задание шлёт другой процесс или оно уже не активно
+
+            engine = BroadcastEngine(self._bot, on_blocked=mark_users_blocked)
+            segment = RecipientSegment.from_dict(job.segment)
+            recipients = iter_recipients(segment, after_id=job.cursor)
+            async with aclosing(iter_chunks(recipients, self._checkpoint_size)) as chunks:
+                async for batch in chunks:
+                    current = job
+
+                    async def report_progress(progress: BroadcastStats) -> None:
+                        await self._render(current, progress)
+
+                    stats = await engine.run(
+                        [telegram_id for _, telegram_id in batch],
+                        job.text,
+                        on_progress=report_progress,
+                    )
+                    job = await _checkpoint(job_id, self.owner, batch[-1][0], stats)
+                    if job is None:
+                        logger.warning("Broadcast job {} lease was taken over, stopping", job_id)
+                        return
+                    if job.status != BroadcastJobStatus.RUNNING.value:
+                        break
+                    await self._render(job)
+                else:
+                    job = await _set_status(
+                        job_id, BroadcastJobStatus.DONE, (BroadcastJobStatus.RUNNING.value,)
+                    ) or await get_job(job_id)
+
+            if job is not None:
+                await self._render(job, force=True)
+                logger.info("Broadcast job {} stopped with status {}", job_id, job.status)
+        except asyncio.CancelledError:
+            raise
+        except (DBAPIError, OSError, Exception) as exc:
+            logger.warning("broadcast job {} error: {}", job_id, type(exc).__name__)
+        finally:
+            self._last_render.pop(job_id, None)
+
+    async def _render(
+        self,
+        job: BroadcastJob,
+        in_flight: BroadcastStats | None = None,
+        force: bool = False,
+    ) -> None:
+        if self._bot is None or job.status_chat_id is None or job.status_message_id is None:
+            return
+
+        now = monotonic()
+        if not force and now - self._last_render.get(job.id, 0.0) < BROADCAST_PROGRESS_INTERVAL:
+            return
+        self._last_render[job.id] = now
+
+        try:
+            await self._bot.edit_message_text(
+                text=render_job(job, in_flight),
+                chat_id=job.status_chat_id,
+                message_id=job.status_message_id,
+                reply_markup=get_broadcast_job_keyboard(job.id, job.status),
+            )
+        except Exception as exc:
+            logger.debug("broadcast job render failed: {}", type(exc).__name__)
+
+
+broadcast_runner = BroadcastJobRunner()
@@ -0,0 +1,296 @@
+import os
+from dataclasses import dataclass
+from math import inf
+from time import monotonic
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+from bot.services.nearby import (
+    EARTH_RADIUS_KM,
+    NEARBY_REFRESH_SECONDS,
+    PartnerLocation,
+    ProfileIndexSync,
+    haversine_km,
+    weight_class,
+)
+from bot.services.profile_feed import profile_feed
+from bot.utils.cache import AsyncTTLCache
+
+MATCH_LIMIT = int(os.getenv("MATCH_LIMIT", "10"))
+MATCH_MAX_KM = float(os.getenv("MATCH_MAX_KM", "100"))
+MATCH_REFRESH_SECONDS = float(os.getenv("MATCH_REFRESH_SECONDS", str(NEARBY_REFRESH_SECONDS)))
+# Результат подбора на пользователя; сбрасывается при изменении профилей, TTL — страховка
+MATCH_CACHE_TTL = float(os.getenv("MATCH_CACHE_TTL", "900"))
+MATCH_CACHE_SIZE = int(os.getenv("MATCH_CACHE_SIZE", "5000"))
+
+# Штрафы за несовпадение (меньше — лучше)
+WEIGHT_CLASS_PENALTY = 1.0  # за каждую весовую категорию разницы
+WEIGHT_KG_PENALTY = 0.02  # за килограмм разницы внутри категории и сверх неё
+EXPERIENCE_PENALTY = 0.2  # за год разницы в стаже
+STYLE_PENALTY = 1.0  # аутсайд против инсайда
+DISTANCE_PENALTY_KM = 25.0  # +1 за каждые 25 км
+MISSING_PENALTY = 0.5  # вес или стаж не указаны
+
+# Битовые коды: both = left | right, совместимы коды с общим битом; не указано — как both
+HAND_CODES = {"left": 1, "right": 2, "both": 3}
+STYLE_CODES = {"outside": 1, "inside": 2, "both": 3}
+
+
+@dataclass(frozen=True)
+class Match:
+    partner: PartnerLocation
+    distance_km: float
+    penalty: float
+
+    @property
+    def score(self) -> int:
+        """Совместимость в процентах"""
+        return round(100 / (1 + self.penalty))
+
+
+@dataclass(frozen=True)
+class MatchResult:
+    matches: Tuple[Match, ...]
+    # Штраф худшего из top-K: кандидат с меньшим штрафом вытеснил бы его.
+    # inf — мест больше, чем нашлось кандидатов
+    threshold: float
+
+
+def pair_penalty(me: PartnerLocation, other: PartnerLocation, max_km: float = MATCH_MAX_KM) -> float:
+    """Штраф для одной пары (эталон для ProfileMatrix.penalties; симметричен)"""
+    if not HAND_CODES.get(me.hand, 3) & HAND_CODES.get(other.hand, 3):
+        return inf
+    distance = haversine_km(me.latitude, me.longitude, other.latitude, other.longitude)
+    if distance > max_km:
+        return inf
+    penalty = distance / DISTANCE_PENALTY_KM
+    if me.weight_kg is None or other.weight_kg is None:
+        penalty += MISSING_PENALTY
+    else:
+        penalty += abs(weight_class(me.weight_kg) - weight_class(other.weight_kg)) * WEIGHT_CLASS_PENALTY
+        penalty += abs(me.weight_kg - other.weight_kg) * WEIGHT_KG_PENALTY
+    if me.experience_years is None or other.experience_years is None:
+        penalty += MISSING_PENALTY
+    else:
+        penalty += abs(me.experience_years - other.experience_years) * EXPERIENCE_PENALTY
+    if not STYLE_CODES.get(me.style, 3) & STYLE_CODES.get(other.style, 3):
+        penalty += STYLE_PENALTY
+    return penalty
+
+
+class ProfileMatrix:
+    """
+    Активные профили по столбцам (NumPy): подбор для пользователя — один
+    векторный проход по всем кандидатам. Строки удалённых профилей
+    переиспользуются, массивы растут удвоением.
+    """
+
+    # Столбец, тип, значение пустой строки; координаты — в радианах
+    _COLUMNS = (
+        ("weight", np.float64, np.nan),
+        ("weight_class", np.float64, np.nan),
+        ("experience", np.float64, np.nan),
+        ("latitude", np.float64, 0.0),
+        ("longitude", np.float64, 0.0),
+        ("cos_latitude", np.float64, 1.0),
+        ("hand", np.int8, 0),
+        ("style", np.int8, 0),
+        ("active", np.bool_, False),
+    )
+
+    def __init__(self, capacity: int = 1024) -> None:
+        self._capacity = 0
+        self._size = 0  # Занятая часть массивов (включая освобождённые строки)
+        self._rows: Dict[int, int] = {}
+        self._free: List[int] = []
+        self._profiles: List[PartnerLocation | None] = []
+        self._grow(max(1, capacity))
+
+    def _grow(self, capacity: int) -> None:
+        for name, dtype, fill in self._COLUMNS:
+            array = np.full(capacity, fill, dtype=dtype)
+            old = getattr(self, name, None)
+            if old is not None:
+                array[: self._size] = old[: self._size]
+            setattr(self, name, array)
+        self._profiles.extend([None] * (capacity - self._capacity))
+        self._capacity = capacity
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def row(self, telegram_id: int) -> int | None:
+        return self._rows.get(telegram_id)
+
+    def get(self, telegram_id: int) -> PartnerLocation | None:
+        row = self._rows.get(telegram_id)
+        return None if row is None else self._profiles[row]
+
+    def upsert(self, partner: PartnerLocation) -> None:
+        row = self._rows.get(partner.telegram_id)
+        if row is None:
+            if self._free:
+                row = self._free.pop()
+            else:
+                if self._size == self._capacity:
+                    self._grow(self._capacity * 2)
+                row = self._size
+                self._size += 1
+            self._rows[partner.telegram_id] = row
+        latitude = np.radians(partner.latitude)
+        self.weight[row] = np.nan if partner.weight_kg is None else partner.weight_kg
+        self.weight_class[row] = np.nan if partner.weight_kg is None else weight_class(partner.weight_kg)
+        self.experience[row] = np.nan if partner.experience_years is None else partner.experience_years
+        self.latitude[row] = latitude
+        self.longitude[row] = np.radians(partner.longitude)
+        self.cos_latitude[row] = np.cos(latitude)
+        self.hand[row] = HAND_CODES.get(partner.hand, 3)
+        self.style[row] = STYLE_CODES.get(partner.style, 3)
+        self.active[row] = True
+        self._profiles[row] = partner
+
+    def remove(self, telegram_id: int) -> None:
+        row = self._rows.pop(telegram_id, None)
+        if row is None:
+            return
+        self.active[row] = False
+        self._profiles[row] = None
+        self._free.append(row)
+
+    def clear(self) -> None:
+        self.active[:] = False
+        self._rows.clear()
+        self._free.clear()
+        self._profiles = [None] * self._capacity
+        self._size = 0
+
+    def penalties(self, me: PartnerLocation, max_km: float = MATCH_MAX_KM) -> Tuple[np.ndarray, np.ndarray]:
+        """(штраф, расстояние км) для всех строк; inf — кандидат не подходит"""
+        n = self._size
+        latitude = np.radians(me.latitude)
+        half_dlat = (self.latitude[:n] - latitude) / 2
+        half_dlon = (self.longitude[:n] - np.radians(me.longitude)) / 2
+        a = np.sin(half_dlat) ** 2 + np.cos(latitude) * self.cos_latitude[:n] * np.sin(half_dlon) ** 2
+        distance = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+        penalty = distance / DISTANCE_PENALTY_KM
+
+        if me.weight_kg is None:
+            penalty += MISSING_PENALTY
+        else:
+            weight = self.weight[:n]
+            weight_penalty = (
+                np.abs(self.weight_class[:n] - weight_class(me.weight_kg)) * WEIGHT_CLASS_PENALTY
+                + np.abs(weight - me.weight_kg) * WEIGHT_KG_PENALTY
+            )
+            penalty += np.where(np.isnan(weight), MISSING_PENALTY, weight_penalty)
+
+        if me.experience_years is None:
+            penalty += MISSING_PENALTY
+        else:
+            experience = self.experience[:n]
+            experience_penalty = np.abs(experience - me.experience_years) * EXPERIENCE_PENALTY
+            penalty += np.where(np.isnan(experience), MISSING_PENALTY, experience_penalty)
+
+        penalty += ((self.style[:n] & STYLE_CODES.get(me.style, 3)) == 0) * STYLE_PENALTY
+        excluded = (
+            ~self.active[:n]
+            | ((self.hand[:n] & HAND_CODES.get(me.hand, 3)) == 0)
+            | (distance > max_km)
+        )
+        penalty[excluded] = np.inf
+        own_row = self._rows.get(me.telegram_id)
+        if own_row is not None:
+            penalty[own_row] = np.inf
+        return penalty, distance
+
+    def top_k(self, me: PartnerLocation, limit: int, max_km: float = MATCH_MAX_KM) -> MatchResult:
+        penalty, distance = self.penalties(me, max_km)
+        candidates = np.flatnonzero(np.isfinite(penalty))
+        if len(candidates) > limit:
+            # O(n) отбор K лучших, сортируем только их
+            candidates = candidates[np.argpartition(penalty[candidates], limit - 1)[:limit]]
+        ordered = candidates[np.argsort(penalty[candidates], kind="stable")]
+        matches = tuple(
+            Match(partner=self._profiles[row], distance_km=float(distance[row]), penalty=float(penalty[row]))
+            for row in ordered
+        )
+        threshold = matches[-1].penalty if len(matches) == limit else inf
+        return MatchResult(matches=matches, threshold=threshold)
+
+
+class MatchingService(ProfileIndexSync):
+    """
+    Подбор партнёров по весу, стажу, стилю, руке и расстоянию. Результаты
+    кэшируются на пользователя; при изменении профиля сбрасываются только те,
+    на которые оно влияет: свой профиль, списки, где он уже есть, и списки,
+    в которые он теперь попадает (штраф симметричен — считаем одним проходом
+    от изменённого профиля ко всем закэшированным пользователям).
+    """
+
+    name = "match index"
+
+    def __init__(
+        self,
+        limit: int = MATCH_LIMIT,
+        max_km: float = MATCH_MAX_KM,
+        refresh_interval: float = MATCH_REFRESH_SECONDS,
+        cache_ttl: float = MATCH_CACHE_TTL,
+        cache_size: int = MATCH_CACHE_SIZE,
+        clock: Callable[[], float] = monotonic,
+    ) -> None:
+        super().__init__(ProfileMatrix(), refresh_interval, clock)
+        self.limit = limit
+        self.max_km = max_km
+        self._cache: AsyncTTLCache[int, MatchResult] = AsyncTTLCache(cache_size, cache_ttl, clock=clock)
+
+    async def matches(self, telegram_id: int) -> MatchResult | None:
+        """None — у пользователя нет спарринг-профиля с координатами"""
+        await self.refresh()
+        cached = self._cache.get(telegram_id)
+        if cached is not None:
+            return cached
+        me = await self.locate(telegram_id)
+        if me is None:
+            return None
+        result = self.index.top_k(me, self.limit, self.max_km)
+        self._cache.set(telegram_id, result)
+        return result
+
+    def _on_changed(self, telegram_ids: List[int]) -> None:
+        changed = set(telegram_ids)
+        users: List[int] = []
+        rows: List[int] = []
+        thresholds: List[float] = []
+        for user_id in self._cache.keys():
+            result = self._cache.get(user_id)
+            row = self.index.row(user_id)
+            if (
+                result is None
+                or user_id in changed
+                or row is None
+                or any(match.partner.telegram_id in changed for match in result.matches)
+            ):
+                self._cache.invalidate(user_id)
+                continue
+            users.append(user_id)
+            rows.append(row)
+            thresholds.append(result.threshold)
+        if not users:
+            return
+
+        row_index = np.array(rows)
+        threshold_array = np.array(thresholds)
+        stale = np.zeros(len(users), dtype=np.bool_)
+        for telegram_id in changed:
+            partner = self.index.get(telegram_id)
+            if partner is None:
+                continue  # Удалён или неактивен: списки с ним уже сброшены выше
+            penalty, _ = self.index.penalties(partner, self.max_km)
+            stale |= penalty[row_index] < threshold_array
+        for position in np.flatnonzero(stale):
+            self._cache.invalidate(users[position])
+
+
+matching_service = MatchingService()
+profile_feed.subscribe(matching_service.on_profiles_changed)
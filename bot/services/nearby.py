@@ -0,0 +1,418 @@
+import asyncio
+import heapq
+import os
+from bisect import bisect_left
+from dataclasses import dataclass
+from datetime import datetime
+from math import asin, ceil, cos, floor, radians, sin, sqrt
+from time import monotonic
+from typing import Callable, Dict, Iterable, Iterator, List, Sequence, Set, Tuple
+
+from loguru import logger
+from sqlalchemy import select, text
+
+from bot.db.database import AsyncSessionLocal
+from bot.db.models import SparringProfile
+from bot.services.profile_feed import profile_feed
+
+# memory — сетка в памяти процесса, обновляется по updated_at;
+# earthdistance — запрос к Postgres с расширением earthdistance (GiST-индекс, см. миграцию)
+NEARBY_BACKEND = os.getenv("NEARBY_BACKEND", "memory").lower()
+NEARBY_LIMIT = int(os.getenv("NEARBY_LIMIT", "10"))
+NEARBY_MAX_KM = float(os.getenv("NEARBY_MAX_KM", "300"))
+# Как часто подтягивать изменённые профили (секунды); фид профилей обновляет индекс сразу
+NEARBY_REFRESH_SECONDS = float(os.getenv("NEARBY_REFRESH_SECONDS", "60"))
+# Размер ячейки сетки в градусах (0.25° ≈ 28 км по широте)
+NEARBY_CELL_DEGREES = float(os.getenv("NEARBY_CELL_DEGREES", "0.25"))
+
+EARTH_RADIUS_KM = 6371.0088
+# Верхние границы весовых категорий (кг); тяжелее последней — абсолютная категория
+WEIGHT_CLASSES = (55, 60, 65, 70, 75, 80, 85, 90, 100, 110)
+HANDS = ("left", "right", "both")
+STYLES = ("outside", "inside", "both")
+
+Cell = Tuple[int, int]
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    dlat = radians(lat2 - lat1)
+    dlon = radians(lon2 - lon1)
+    a = sin(dlat / 2) ** 2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * asin(min(1.0, sqrt(a)))
+
+
+def weight_class(weight_kg: float | None) -> int | None:
+    """Номер весовой категории (индекс в WEIGHT_CLASSES, len — абсолютная)"""
+    if weight_kg is None:
+        return None
+    return bisect_left(WEIGHT_CLASSES, weight_kg)
+
+
+def weight_class_bounds(index: int) -> Tuple[float, float]:
+    lower = WEIGHT_CLASSES[index - 1] if index > 0 else 0.0
+    upper = WEIGHT_CLASSES[index] if index < len(WEIGHT_CLASSES) else float("inf")
+    return lower, upper
+
+
+def weight_class_label(index: int) -> str:
+    if index >= len(WEIGHT_CLASSES):
+        return f"{WEIGHT_CLASSES[-1]}+ кг"
+    return f"до {WEIGHT_CLASSES[index]} кг"
+
+
+@dataclass(frozen=True)
+class PartnerLocation:
+    telegram_id: int
+    first_name: str
+    latitude: float
+    longitude: float
+    hand: str | None = None
+    style: str | None = None
+    weight_kg: float | None = None
+    experience_years: float | None = None
+
+
+@dataclass(frozen=True)
+class NearbyFilters:
+    hand: str | None = None  # left | right; both у партнёра подходит к любой руке
+    style: str | None = None  # outside | inside
+    weight_class: int | None = None
+
+    def matches(self, partner: PartnerLocation) -> bool:
+        if self.hand and self.hand != "both" and partner.hand not in (self.hand, "both"):
+            return False
+        if self.style and self.style != "both" and partner.style not in (self.style, "both"):
+            return False
+        if self.weight_class is not None and weight_class(partner.weight_kg) != self.weight_class:
+            return False
+        return True
+
+
+def parse_filters(args: str | None, me: PartnerLocation) -> NearbyFilters:
+    """
+    /nearby — партнёры для той же руки и весовой категории, что у пользователя;
+    /nearby all — без фильтров; left/right/outside/inside/<вес> — явные значения.
+    """
+    tokens = (args or "").lower().replace(",", " ").split()
+    if any(token in ("all", "все") for token in tokens):
+        return NearbyFilters()
+    hand = me.hand
+    style = None
+    klass = weight_class(me.weight_kg)
+    for token in tokens:
+        if token in HANDS or token in ("левая", "правая"):
+            hand = {"левая": "left", "правая": "right"}.get(token, token)
+        elif token in STYLES or token in ("аутсайд", "инсайд"):
+            style = {"аутсайд": "outside", "инсайд": "inside"}.get(token, token)
+        elif token.replace(".", "", 1).isdigit():
+            klass = weight_class(float(token))
+    return NearbyFilters(hand=hand, style=style, weight_class=klass)
+
+
+class GeoGridIndex:
+    """
+    Сетка по широте/долготе: ячейка -> профили. Поиск K ближайших обходит кольца
+    ячеек вокруг точки и останавливается, когда ближайшая возможная точка
+    следующего кольца дальше K-го найденного (или дальше max_km).
+    """
+
+    def __init__(self, cell_degrees: float = NEARBY_CELL_DEGREES) -> None:
+        self.cell_degrees = cell_degrees
+        self._lat_cells = ceil(180 / cell_degrees)
+        self._lon_cells = ceil(360 / cell_degrees)
+        self._cells: Dict[Cell, Dict[int, PartnerLocation]] = {}
+        self._where: Dict[int, Cell] = {}
+        self._items: Dict[int, PartnerLocation] = {}
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, telegram_id: int) -> PartnerLocation | None:
+        return self._items.get(telegram_id)
+
+    def _cell(self, latitude: float, longitude: float) -> Cell:
+        row = min(self._lat_cells - 1, max(0, floor((latitude + 90) / self.cell_degrees)))
+        # Долгота по кругу: ячейки у ±180° соседние
+        column = floor((longitude + 180) / self.cell_degrees) % self._lon_cells
+        return row, column
+
+    def upsert(self, partner: PartnerLocation) -> None:
+        self.remove(partner.telegram_id)
+        cell = self._cell(partner.latitude, partner.longitude)
+        self._cells.setdefault(cell, {})[partner.telegram_id] = partner
+        self._where[partner.telegram_id] = cell
+        self._items[partner.telegram_id] = partner
+
+    def remove(self, telegram_id: int) -> None:
+        cell = self._where.pop(telegram_id, None)
+        self._items.pop(telegram_id, None)
+        if cell is None:
+            return
+        bucket = self._cells[cell]
+        bucket.pop(telegram_id, None)
+        if not bucket:
+            del self._cells[cell]
+
+    def clear(self) -> None:
+        self._cells.clear()
+        self._where.clear()
+        self._items.clear()
+
+    def _ring(self, center: Cell, radius: int) -> Iterator[Cell]:
+        row, column = center
+        for d_row in range(-radius, radius + 1):
+            r = row + d_row
+            if not 0 <= r < self._lat_cells:
+                continue
+            if abs(d_row) == radius:
+                d_columns: Iterable[int] = range(-radius, radius + 1)
+            else:
+                d_columns = (-radius, radius)
+            for d_column in d_columns:
+                yield r, (column + d_column) % self._lon_cells
+
+    def _ring_min_km(self, latitude: float, radius: int) -> float:
+        """Нижняя граница расстояния до любой точки кольца radius"""
+        if radius <= 1:
+            return 0.0
+        delta = radians(min(180.0, (radius - 1) * self.cell_degrees))
+        far_latitude = min(90.0, abs(latitude) + (radius + 1) * self.cell_degrees)
+        # hav(d) >= cos²(φmax)·hav(Δλ) и hav(d) >= hav(Δφ); берём меньшую из двух оценок
+        return 2 * EARTH_RADIUS_KM * asin(min(1.0, cos(radians(far_latitude)) * sin(delta / 2)))
+
+    def nearest(
+        self,
+        latitude: float,
+        longitude: float,
+        limit: int,
+        max_km: float = NEARBY_MAX_KM,
+        predicate: Callable[[PartnerLocation], bool] | None = None,
+        exclude: int | None = None,
+    ) -> List[Tuple[float, PartnerLocation]]:
+        center = self._cell(latitude, longitude)
+        best: List[Tuple[float, int, PartnerLocation]] = []  # max-куча по расстоянию (-distance)
+        seen: Set[Cell] = set()
+        max_radius = max(self._lat_cells, self._lon_cells // 2 + 1)
+        for radius in range(max_radius + 1):
+            bound = self._ring_min_km(latitude, radius)
+            if bound > max_km or (len(best) == limit and bound > -best[0][0]):
+                break
+            for cell in self._ring(center, radius):
+                if cell in seen:
+                    continue
+                seen.add(cell)
+                for partner in self._cells.get(cell, {}).values():
+                    if partner.telegram_id == exclude or (predicate and not predicate(partner)):
+                        continue
+                    distance = haversine_km(latitude, longitude, partner.latitude, partner.longitude)
+                    if distance > max_km:
+                        continue
+                    item = (-distance, partner.telegram_id, partner)
+                    if len(best) < limit:
+                        heapq.heappush(best, item)
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, item)
+        return sorted(((-neg, partner) for neg, _, partner in best), key=lambda pair: pair[0])
+
+
+PROFILE_COLUMNS = (
+    SparringProfile.telegram_user_id,
+    SparringProfile.first_name,
+    SparringProfile.latitude,
+    SparringProfile.longitude,
+    SparringProfile.hand,
+    SparringProfile.style,
+    SparringProfile.weight_kg,
+    SparringProfile.experience_years,
+    SparringProfile.is_active,
+    SparringProfile.updated_at,
+)
+
+
+def row_to_location(row) -> PartnerLocation | None:
+    if row.latitude is None or row.longitude is None or not str(row.telegram_user_id).isdigit():
+        return None
+    return PartnerLocation(
+        telegram_id=int(row.telegram_user_id),
+        first_name=row.first_name,
+        latitude=row.latitude,
+        longitude=row.longitude,
+        hand=row.hand,
+        style=row.style,
+        weight_kg=row.weight_kg,
+        experience_years=row.experience_years,
+    )
+
+
+class ProfileIndexSync:
+    """
+    Держит в памяти индекс активных sparring_profiles: первая загрузка — все
+    активные профили, дальше только изменённые (updated_at >= водяной метки)
+    и то, что пришло из фида профилей. Индекс — любой объект с
+    upsert/remove/clear/get (GeoGridIndex, ProfileMatrix).
+    """
+
+    name = "profile index"
+
+    def __init__(self, index, refresh_interval: float, clock: Callable[[], float] = monotonic) -> None:
+        self.index = index
+        self.refresh_interval = refresh_interval
+        self._clock = clock
+        self._watermark: datetime | None = None
+        self._refreshed_at: float | None = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return True
+
+    def _on_changed(self, telegram_ids: List[int]) -> None:
+        """Вызывается после инкрементального обновления (сброс зависимых кэшей)"""
+
+    def _apply(self, rows: Sequence) -> List[int]:
+        changed = []
+        for row in rows:
+            if not str(row.telegram_user_id).isdigit():
+                continue
+            location = row_to_location(row)
+            if location is None or not row.is_active:
+                self.index.remove(int(row.telegram_user_id))
+            else:
+                self.index.upsert(location)
+            changed.append(int(row.telegram_user_id))
+        stamps = [row.updated_at for row in rows if row.updated_at is not None]
+        if stamps:
+            latest = max(stamps)
+            self._watermark = latest if self._watermark is None else max(self._watermark, latest)
+        return changed
+
+    def _fresh(self) -> bool:
+        return self._refreshed_at is not None and self._clock() - self._refreshed_at < self.refresh_interval
+
+    async def refresh(self, force: bool = False) -> None:
+        if not force and self._fresh():
+            return
+        async with self._lock:
+            if not force and self._fresh():
+                return
+            initial = self._refreshed_at is None
+            stmt = select(*PROFILE_COLUMNS).order_by(SparringProfile.updated_at)
+            if initial:
+                stmt = stmt.where(SparringProfile.is_active.is_(True))
+            elif self._watermark is not None:
+                # >=: строки с той же меткой, закоммиченные позже, не теряем (upsert идемпотентен)
+                stmt = stmt.where(SparringProfile.updated_at >= self._watermark)
+            async with AsyncSessionLocal() as session:
+                rows = (await session.execute(stmt)).all()
+            if initial:
+                self.index.clear()
+            changed = self._apply(rows)
+            self._refreshed_at = self._clock()
+            if not initial and changed:
+                self._on_changed(changed)
+            logger.debug("{} refreshed: {} rows, {} profiles", self.name, len(rows), len(self.index))
+
+    async def on_profiles_changed(self, telegram_ids: List[int]) -> None:
+        """Подписчик profile_feed: перечитывает изменённые профили (и убирает удалённые)"""
+        if not self.enabled or self._refreshed_at is None:
+            return
+        keys = [str(telegram_id) for telegram_id in telegram_ids]
+        async with AsyncSessionLocal() as session:
+            rows = (await session.execute(
+                select(*PROFILE_COLUMNS).where(SparringProfile.telegram_user_id.in_(keys))
+            )).all()
+        found = {str(row.telegram_user_id) for row in rows}
+        missing = [int(key) for key in keys if key not in found and key.isdigit()]
+        for telegram_id in missing:
+            self.index.remove(telegram_id)
+        self._on_changed(missing + self._apply(rows))
+
+    async def locate(self, telegram_id: int) -> PartnerLocation | None:
+        """Профиль пользователя: из индекса, а если он неактивен или вне индекса — из БД"""
+        if self.enabled:
+            await self.refresh()
+            location = self.index.get(telegram_id)
+            if location is not None:
+                return location
+        async with AsyncSessionLocal() as session:
+            row = (await session.execute(
+                select(*PROFILE_COLUMNS).where(SparringProfile.telegram_user_id == str(telegram_id))
+            )).first()
+        return row_to_location(row) if row else None
+
+
+class NearbyService(ProfileIndexSync):
+    """Поиск ближайших активных партнёров: GeoGridIndex в памяти или earthdistance в Postgres"""
+
+    name = "nearby index"
+
+    def __init__(
+        self,
+        backend: str = NEARBY_BACKEND,
+        refresh_interval: float = NEARBY_REFRESH_SECONDS,
+        cell_degrees: float = NEARBY_CELL_DEGREES,
+        clock: Callable[[], float] = monotonic,
+    ) -> None:
+        super().__init__(GeoGridIndex(cell_degrees), refresh_interval, clock)
+        self.backend = backend
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend == "memory"
+
+    async def find(
+        self,
+        me: PartnerLocation,
+        filters: NearbyFilters,
+        limit: int = NEARBY_LIMIT,
+        max_km: float = NEARBY_MAX_KM,
+    ) -> List[Tuple[float, PartnerLocation]]:
+        if self.backend == "earthdistance":
+            return await self._find_earthdistance(me, filters, limit, max_km)
+        await self.refresh()
+        return self.index.nearest(
+            me.latitude, me.longitude, limit, max_km, predicate=filters.matches, exclude=me.telegram_id,
+        )
+
+    async def _find_earthdistance(
+        self, me: PartnerLocation, filters: NearbyFilters, limit: int, max_km: float
+    ) -> List[Tuple[float, PartnerLocation]]:
+        # earth_box отсекает по GiST-индексу, earth_distance уточняет (earth_box — куб, он шире круга)
+        conditions = [
+            "is_active",
+            "earth_box(ll_to_earth(:lat, :lon), :radius_m) @> ll_to_earth(latitude, longitude)",
+            "earth_distance(ll_to_earth(:lat, :lon), ll_to_earth(latitude, longitude)) <= :radius_m",
+            "telegram_user_id <> :self_id",
+        ]
+        params = {"lat": me.latitude, "lon": me.longitude, "radius_m": max_km * 1000,
+                  "self_id": str(me.telegram_id), "limit": limit}
+        if filters.hand and filters.hand != "both":
+            conditions.append("hand IN (:hand, 'both')")
+            params["hand"] = filters.hand
+        if filters.style and filters.style != "both":
+            conditions.append("style IN (:style, 'both')")
+            params["style"] = filters.style
+        if filters.weight_class is not None:
+            lower, upper = weight_class_bounds(filters.weight_class)
+            conditions.append("weight_kg > :weight_min")
+            params["weight_min"] = lower
+            if upper != float("inf"):
+                conditions.append("weight_kg <= :weight_max")
+                params["weight_max"] = upper
+        stmt = text(
+            "SELECT telegram_user_id, first_name, latitude, longitude, hand, style, weight_kg, experience_years, "
+            "earth_distance(ll_to_earth(:lat, :lon), ll_to_earth(latitude, longitude)) / 1000 AS distance_km "
+            f"FROM sparring_profiles WHERE {' AND '.join(conditions)} "
+            "ORDER BY distance_km LIMIT :limit"
+        )
+        async with AsyncSessionLocal() as session:
+            rows = (await session.execute(stmt, params)).all()
+        return [
+            (row.distance_km, location)
+            for row in rows
+            if (location := row_to_location(row)) is not None
+        ]
+
+
+nearby_service = NearbyService()
+profile_feed.subscribe(nearby_service.on_profiles_changed)
@@ -0,0 +1,298 @@
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Tuple
+
+from aiogram import Bot
+from loguru import logger
+from sqlalchemy import delete, select, tuple_, update
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import aliased
+
+from bot.db.database import AsyncSessionLocal, dialect_insert
+from bot.db.models import JobWatermark, PartnerAlert, SparringProfile
+from bot.services.broadcast import BroadcastEngine
+from bot.services.matching import MatchingService, matching_service
+from bot.services.nearby import PROFILE_COLUMNS, PartnerLocation, haversine_km, row_to_location
+from bot.services.user_service import mark_users_blocked
+
+PARTNER_ALERTS_ENABLED = os.getenv("PARTNER_ALERTS", "1") == "1"
+PARTNER_ALERTS_INTERVAL = float(os.getenv("PARTNER_ALERTS_INTERVAL", "300"))
+# Сколько изменённых профилей разбирать за один запрос (дальше — следующей пачкой)
+PARTNER_ALERTS_BATCH = int(os.getenv("PARTNER_ALERTS_BATCH", "200"))
+# Перечитываем профили начиная с метки минус это окно (секунды): updated_at ставит триггер
+# как now() — время начала транзакции, и строка, закоммиченная после прошлого прогона,
+# может получить метку раньше сохранённой. Повторно прочитанные пары отсекает ON CONFLICT.
+PARTNER_ALERTS_LAG = float(os.getenv("PARTNER_ALERTS_LAG", "60"))
+PARTNER_ALERTS_MAX_KM = float(os.getenv("PARTNER_ALERTS_MAX_KM", "30"))
+# Порог совместимости (штраф из matching.py) и сколько ближайших уведомлять о каждом новом профиле
+PARTNER_ALERTS_MAX_PENALTY = float(os.getenv("PARTNER_ALERTS_MAX_PENALTY", "3"))
+PARTNER_ALERTS_PER_PROFILE = int(os.getenv("PARTNER_ALERTS_PER_PROFILE", "20"))
+# Не чаще одного сообщения пользователю за это время; новые партнёры копятся и приходят списком
+PARTNER_ALERTS_COOLDOWN_HOURS = float(os.getenv("PARTNER_ALERTS_COOLDOWN_HOURS", "24"))
+# Тихие часы по местному времени получателя (часовой пояс — по долготе из профиля)
+PARTNER_ALERTS_QUIET_HOURS = os.getenv("PARTNER_ALERTS_QUIET_HOURS", "22-9")
+# Отдельный лимит скорости: уведомления делят лимит Bot API с ответами пользователям
+PARTNER_ALERTS_RATE = float(os.getenv("PARTNER_ALERTS_RATE", "5"))
+PARTNER_ALERTS_SEND_BATCH = int(os.getenv("PARTNER_ALERTS_SEND_BATCH", "1000"))
+
+WATERMARK_NAME = "partner_alerts"
+NAMES_IN_MESSAGE = 3
+
+
+def parse_quiet_hours(raw: str) -> Tuple[int, int] | None:
+    start, _, end = raw.partition("-")
+    if not start.strip().isdigit() or not end.strip().isdigit():
+        return None
+    return int(start) % 24, int(end) % 24
+
+
+def local_hour(now: datetime, longitude: float) -> int:
+    """Приблизительный местный час: пояс по долготе (15° на час)"""
+    return (now.hour + round(longitude / 15)) % 24
+
+
+def in_quiet_hours(hour: int, quiet: Tuple[int, int] | None) -> bool:
+    if quiet is None:
+        return False
+    start, end = quiet
+    if start <= end:
+        return start <= hour < end
+    return hour >= start or hour < end
+
+
+def render_alert(recipient: PartnerLocation | None, partners: List[PartnerLocation]) -> str:
+    def describe(partner: PartnerLocation) -> str:
+        if recipient is None:
+            return partner.first_name
+        distance = haversine_km(recipient.latitude, recipient.longitude, partner.latitude, partner.longitude)
+        return f"{partner.first_name} ({distance:.0f} км)"
+
+    names = ", ".join(describe(partner) for partner in partners[:NAMES_IN_MESSAGE])
+    more = len(partners) - NAMES_IN_MESSAGE
+    if len(partners) == 1:
+        text = f"🤝 Рядом появился новый спарринг-партнёр: {names}."
+    else:
+        text = f"🤝 Рядом появились новые спарринг-партнёры: {names}"
+        text += f" и ещё {more}." if more > 0 else "."
+    return text + "\nПодбор по весу и стилю: /match"
+
+
+class PartnerAlertJob:
+    """
+    Периодическое задание: профили, созданные или изменённые после водяной
+    метки (по индексу updated_at, без полного прохода по таблице), пачкой
+    сопоставляются с совместимыми пользователями рядом (ProfileMatrix).
+    Пары получатель/партнёр пишутся в partner_alerts (повтор — ON CONFLICT),
+    отправка — отдельным шагом с учётом тихих часов и лимита на пользователя.
+    """
+
+    def __init__(
+        self,
+        matcher: MatchingService = matching_service,
+        interval: float = PARTNER_ALERTS_INTERVAL,
+        batch_size: int = PARTNER_ALERTS_BATCH,
+        lag: timedelta = timedelta(seconds=PARTNER_ALERTS_LAG),
+        max_km: float = PARTNER_ALERTS_MAX_KM,
+        max_penalty: float = PARTNER_ALERTS_MAX_PENALTY,
+        per_profile: int = PARTNER_ALERTS_PER_PROFILE,
+        cooldown: timedelta = timedelta(hours=PARTNER_ALERTS_COOLDOWN_HOURS),
+        quiet_hours: str = PARTNER_ALERTS_QUIET_HOURS,
+        clock: Callable[[], datetime] = lambda: datetime.now(timezone.utc),
+    ) -> None:
+        self.matcher = matcher
+        self.interval = interval
+        self.batch_size = max(1, batch_size)
+        self.lag = lag
+        self.max_km = max_km
+        self.max_penalty = max_penalty
+        self.per_profile = per_profile
+        self.cooldown = cooldown
+        self.quiet_hours = parse_quiet_hours(quiet_hours)
+        self._clock = clock
+        self._bot: Bot | None = None
+        self._task: asyncio.Task | None = None
+
+    async def start(self, bot: Bot) -> None:
+        if not PARTNER_ALERTS_ENABLED:
+            return
+        self._bot = bot
+        self._task = asyncio.create_task(self._run())
+        logger.info("Partner alerts job started (every {}s)", self.interval)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once(self._bot)
+            except asyncio.CancelledError:
+                raise
+            except (DBAPIError, OSError, Exception) as exc:
+                logger.warning("partner alerts run failed: {}", type(exc).__name__)
+
+    async def run_once(self, bot: Bot) -> Tuple[int, int]:
+        """(новых пар в очереди, отправлено сообщений)"""
+        queued = await self.collect()
+        sent = await self.deliver(bot)
+        return queued, sent
+
+    async def _load_watermark(self) -> datetime | None:
+        async with AsyncSessionLocal() as session:
+            return await session.scalar(select(JobWatermark.watermark).where(JobWatermark.name == WATERMARK_NAME))
+
+    async def collect(self) -> int:
+        watermark = await self._load_watermark()
+        if watermark is None:
+            # Первый запуск: начинаем с текущего момента, старые профили не разбираем
+            await self._save(watermark=self._clock(), pairs=[])
+            return 0
+
+        await self.matcher.refresh()
+        queued = 0
+        strict = False
+        # Окно назад — только для первой пачки: дальше идём по меткам прочитанных строк
+        watermark = watermark - self.lag
+        while True:
+            # >=, как в ProfileIndexSync: строки с той же меткой, закоммиченные позже, не теряем
+            # (пары вставятся повторно без дублей)
+            since = SparringProfile.updated_at > watermark if strict else SparringProfile.updated_at >= watermark
+            rows = await self._fetch(since, limit=self.batch_size)
+            full = len(rows) == self.batch_size
+            if full and rows[-1].updated_at == watermark:
+                # Вся пачка с одной меткой (массовое обновление): метка не сдвинется —
+                # дочитываем эту метку целиком и дальше идём строго после неё
+                rows = await self._fetch(SparringProfile.updated_at == watermark)
+                strict = True
+            else:
+                strict = False
+            if not rows:
+                return queued
+            watermark = rows[-1].updated_at
+            queued += await self._save(watermark=watermark, pairs=self._pairs(rows))
+            if not full:
+                return queued
+
+    async def _fetch(self, condition, limit: int | None = None) -> list:
+        stmt = select(*PROFILE_COLUMNS).where(condition).order_by(SparringProfile.updated_at)
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        async with AsyncSessionLocal() as session:
+            return (await session.execute(stmt)).all()
+
+    def _pairs(self, rows) -> List[Tuple[int, int]]:
+        """(получатель, новый партнёр): совместимые пользователи рядом с каждым изменённым профилем"""
+        pairs = []
+        for row in rows:
+            partner = row_to_location(row)
+            if partner is None or not row.is_active:
+                continue
+            result = self.matcher.index.top_k(partner, self.per_profile, self.max_km)
+            pairs.extend(
+                (match.partner.telegram_id, partner.telegram_id)
+                for match in result.matches
+                if match.penalty <= self.max_penalty
+            )
+        return pairs
+
+    async def _save(self, watermark: datetime, pairs: List[Tuple[int, int]]) -> int:
+        """Пары и новая метка — в одной транзакции: после сбоя пачка разбирается заново без дублей"""
+        async with AsyncSessionLocal() as session:
+            inserted = 0
+            if pairs:
+                stmt = dialect_insert(session, PartnerAlert).values([
+                    {"recipient_id": recipient_id, "partner_id": partner_id, "created_at": datetime.utcnow()}
+                    for recipient_id, partner_id in pairs
+                ]).on_conflict_do_nothing(index_elements=["recipient_id", "partner_id"])
+                inserted = (await session.execute(stmt)).rowcount or 0
+            stmt = dialect_insert(session, JobWatermark).values(
+                name=WATERMARK_NAME, watermark=watermark, updated_at=datetime.utcnow(),
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["name"],
+                set_={"watermark": stmt.excluded.watermark, "updated_at": stmt.excluded.updated_at},
+            )
+            await session.execute(stmt)
+            await session.commit()
+        return inserted
+
+    def _pending_select(self, now_naive: datetime):
+        """
+        Неотправленные пары, кроме получателей на паузе после прошлого уведомления:
+        иначе старейшие строки таких получателей занимали бы всю пачку каждый прогон
+        """
+        sent = aliased(PartnerAlert)
+        recently_notified = (
+            select(sent.recipient_id)
+            .where(sent.recipient_id == PartnerAlert.recipient_id, sent.sent_at >= now_naive - self.cooldown)
+            .exists()
+        )
+        return (
+            select(PartnerAlert.recipient_id, PartnerAlert.partner_id)
+            .where(PartnerAlert.sent_at.is_(None), ~recently_notified)
+            .order_by(PartnerAlert.created_at, PartnerAlert.recipient_id, PartnerAlert.partner_id)
+        )
+
+    async def deliver(self, bot: Bot) -> int:
+        now = self._clock()
+        now_naive = now.astimezone(timezone.utc).replace(tzinfo=None)
+        query = self._pending_select(now_naive)
+
+        by_recipient: Dict[int, List[PartnerLocation]] = {}
+        picked: List[Tuple[int, int]] = []
+        gone: List[Tuple[int, int]] = []
+        offset = 0
+        async with AsyncSessionLocal() as session:
+            # Тихие часы зависят от долготы получателя и считаются в Python:
+            # пропущенные строки листаем дальше, пока не наберём пачку
+            while len(picked) < PARTNER_ALERTS_SEND_BATCH:
+                page = (await session.execute(query.offset(offset).limit(PARTNER_ALERTS_SEND_BATCH))).all()
+                offset += len(page)
+                for row in page:
+                    partner = self.matcher.index.get(row.partner_id)
+                    if partner is None:
+                        gone.append((row.recipient_id, row.partner_id))  # Профиль скрыт или удалён
+                        continue
+                    recipient = self.matcher.index.get(row.recipient_id)
+                    if recipient is not None and in_quiet_hours(local_hour(now, recipient.longitude), self.quiet_hours):
+                        continue
+                    by_recipient.setdefault(row.recipient_id, []).append(partner)
+                    picked.append((row.recipient_id, row.partner_id))
+                if len(page) < PARTNER_ALERTS_SEND_BATCH:
+                    break
+        if not picked and not gone:
+            return 0
+
+        async with AsyncSessionLocal() as session:
+            for recipient_id, partner_id in gone:
+                await session.execute(delete(PartnerAlert).where(
+                    PartnerAlert.recipient_id == recipient_id, PartnerAlert.partner_id == partner_id,
+                ))
+            if picked:
+                # Отмечаем до отправки: после сбоя уведомление не уйдёт повторно.
+                # Только пары из этого сообщения — остальные партнёры придут следующим
+                await session.execute(
+                    update(PartnerAlert)
+                    .where(tuple_(PartnerAlert.recipient_id, PartnerAlert.partner_id).in_(picked))
+                    .values(sent_at=now_naive)
+                )
+            await session.commit()
+        if not by_recipient:
+            return 0
+
+        messages = [
+            (recipient_id, render_alert(self.matcher.index.get(recipient_id), partners))
+            for recipient_id, partners in by_recipient.items()
+        ]
+        engine = BroadcastEngine(bot, rate=PARTNER_ALERTS_RATE, on_blocked=mark_users_blocked)
+        stats = await engine.run_messages(messages)
+        logger.info("Partner alerts: sent {}, blocked {}, failed {}", stats.sent, stats.blocked, stats.failed)
+        return stats.sent
+
+
+partner_alerts = PartnerAlertJob()
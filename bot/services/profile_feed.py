@@ -0,0 +1,146 @@
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, List
+
+from loguru import logger
+from sqlalchemy import select
+from sqlalchemy.exc import DBAPIError
+
+from bot.db.database import AsyncSessionLocal, engine
+from bot.db.models import SparringProfile
+from bot.services.user_service import USER_CACHE_FEED, invalidate_user
+
+# Канал pg_notify, в который пишет триггер на sparring_profiles
+PROFILE_FEED_CHANNEL = "sparring_profiles_changed"
+PROFILE_FEED_POLL_INTERVAL = float(os.getenv("PROFILE_FEED_POLL_INTERVAL", "15"))
+PROFILE_FEED_RETRY_SECONDS = float(os.getenv("PROFILE_FEED_RETRY_SECONDS", "30"))
+# Окно назад от метки (секунды), как у partner_alerts: updated_at — now() начала транзакции,
+# строка, закоммиченная позже, может получить метку раньше прочитанной. Повторный сброс кэша безвреден
+PROFILE_FEED_LAG = float(os.getenv("PROFILE_FEED_LAG", "60"))
+
+ProfileChangeCallback = Callable[[List[int]], Awaitable[None] | None]
+
+
+class SparringProfileFeed:
+    """
+    Следит за изменениями sparring_profiles (правки из WebApp) и сбрасывает кэш бота.
+
+    notify — LISTEN на канал, в который пишет триггер (нужно прямое
+    соединение или session pooler: через transaction pooler LISTEN не работает);
+    poll — периодический запрос по updated_at с водяной меткой.
+    """
+
+    def __init__(
+        self,
+        mode: str = USER_CACHE_FEED,
+        poll_interval: float = PROFILE_FEED_POLL_INTERVAL,
+        lag: float = PROFILE_FEED_LAG,
+    ) -> None:
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self.lag = timedelta(seconds=lag)
+        self._watermark: datetime | None = None
+        self._task: asyncio.Task | None = None
+        self._notify_tasks: set[asyncio.Task] = set()
+        self._subscribers: List[ProfileChangeCallback] = [self._invalidate_users]
+
+    def subscribe(self, callback: ProfileChangeCallback) -> None:
+        """Дополнительные получатели изменений (другие кэши по профилям)"""
+        self._subscribers.append(callback)
+
+    async def start(self) -> None:
+        if self.mode not in ("notify", "poll"):
+            return
+        self._task = asyncio.create_task(self._run())
+        logger.info("Sparring profile feed started ({})", self.mode)
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                if self.mode == "notify":
+                    await self._listen()
+                else:
+                    await self._poll_forever()
+            except asyncio.CancelledError:
+                raise
+            except (DBAPIError, OSError, Exception) as exc:
+                logger.warning("profile feed error, retry in {}s: {}", PROFILE_FEED_RETRY_SECONDS, type(exc).__name__)
+                await asyncio.sleep(PROFILE_FEED_RETRY_SECONDS)
+
+    async def _listen(self) -> None:
+        async with engine.connect() as conn:
+            raw = await conn.get_raw_connection()
+            driver = raw.driver_connection
+            if not hasattr(driver, "add_listener"):
+                logger.warning("profile feed: LISTEN is not supported by the driver, switching to poll")
+                self.mode = "poll"
+                return
+
+            closed = asyncio.Event()
+
+            def on_notify(connection, pid, channel, payload) -> None:
+                if payload and payload.isdigit():
+                    task = asyncio.ensure_future(self._publish([int(payload)]))
+                    self._notify_tasks.add(task)
+                    task.add_done_callback(self._notify_tasks.discard)
+
+            driver.add_termination_listener(lambda connection: closed.set())
+            await driver.add_listener(PROFILE_FEED_CHANNEL, on_notify)
+            try:
+                # Соединение держим, пока его не закроет сервер или пулер
+                await closed.wait()
+                raise ConnectionError("LISTEN connection closed")
+            finally:
+                if not driver.is_closed():
+                    await driver.remove_listener(PROFILE_FEED_CHANNEL, on_notify)
+
+    async def _poll_forever(self) -> None:
+        if self._watermark is None:
+            # Стартуем с текущего момента: кэш после рестарта всё равно пуст
+            self._watermark = datetime.now(timezone.utc)
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            await self.poll_once()
+
+    async def poll_once(self) -> List[int]:
+        async with AsyncSessionLocal() as session:
+            stmt = select(SparringProfile.telegram_user_id, SparringProfile.updated_at).order_by(
+                SparringProfile.updated_at
+            )
+            if self._watermark is not None:
+                stmt = stmt.where(SparringProfile.updated_at >= self._watermark - self.lag)
+            rows = (await session.execute(stmt)).all()
+
+        if not rows:
+            return []
+        if rows[-1].updated_at is not None:
+            self._watermark = rows[-1].updated_at
+        changed = [int(row.telegram_user_id) for row in rows if row.telegram_user_id.isdigit()]
+        await self._publish(changed)
+        return changed
+
+    async def _publish(self, telegram_ids: List[int]) -> None:
+        if not telegram_ids:
+            return
+        for callback in self._subscribers:
+            try:
+                result = callback(telegram_ids)
+                if asyncio.iscoroutine(result):
+                    await result
+            except Exception as exc:
+                logger.warning("profile feed subscriber error: {}", type(exc).__name__)
+
+    @staticmethod
+    def _invalidate_users(telegram_ids: List[int]) -> None:
+        for telegram_id in telegram_ids:
+            invalidate_user(telegram_id)
+
+
+profile_feed = SparringProfileFeed()
@@ -0,0 +1,410 @@
+import asyncio
+import os
+from abc import ABC, abstractmethod
+import socket
+import sys
+from collections import OrderedDict
+from dataclasses import dataclass
+from time import monotonic, time
+from typing import Callable, Dict, Tuple
+
+from loguru import logger
+from sqlalchemy import delete, func, select
+from sqlalchemy.exc import DBAPIError
+
+from bot.db.database import AsyncSessionLocal, dialect_insert
+from bot.db.models import RateLimitBucket
+from bot.utils.deadline import unbounded
+
+# Жёсткий предел числа пользователей в памяти (на процесс)
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+RATE_LIMIT_BUCKET_SECONDS = int(os.getenv("RATE_LIMIT_BUCKET_SECONDS", "10"))
+RATE_LIMIT_FLUSH_INTERVAL = float(os.getenv("RATE_LIMIT_FLUSH_INTERVAL", "5"))
+RATE_LIMIT_PRUNE_INTERVAL = float(os.getenv("RATE_LIMIT_PRUNE_INTERVAL", "60"))
+# Строк в одном INSERT при сбросе: иначе после простоя БД вся накопленная пачка
+# ушла бы одним запросом и упёрлась в лимит параметров (32767 у Postgres)
+RATE_LIMIT_FLUSH_CHUNK = int(os.getenv("RATE_LIMIT_FLUSH_CHUNK", "1000"))
+# Идентификатор инстанса: свои счётчики уже учтены локально, из БД берём только чужие
+INSTANCE_ID = os.getenv("INSTANCE_ID") or f"{socket.gethostname()}-{os.getpid()}"
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+REDIS_KEY_PREFIX = os.getenv("RATE_LIMIT_REDIS_PREFIX", "rl")
+REDIS_TIMEOUT = float(os.getenv("RATE_LIMIT_REDIS_TIMEOUT", "0.2"))
+# Сколько секунд работаем на локальном лимитере после ошибки Redis
+REDIS_RETRY_AFTER = float(os.getenv("RATE_LIMIT_REDIS_RETRY_AFTER", "10"))
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    max_requests: int
+    period: int  # секунды
+
+
+def parse_rate_limit(value: str) -> RateLimit | None:
+    """Разбирает лимит вида "30/60" (запросов / секунд)"""
+    max_requests, _, period = value.strip().partition("/")
+    if max_requests.isdigit() and period.isdigit() and int(period) > 0:
+        return RateLimit(int(max_requests), int(period))
+    return None
+
+
+def parse_rate_limits(raw: str) -> Dict[str, RateLimit]:
+    """
+    Разбирает лимиты вида "message=30/60,callback_query=60/60".
+    Ключ — тип апдейта (Update.event_type).
+    """
+    limits: Dict[str, RateLimit] = {}
+    for item in raw.split(","):
+        scope, _, value = item.strip().partition("=")
+        limit = parse_rate_limit(value)
+        if scope and limit:
+            limits[scope] = limit
+    return limits
+
+
+class RateLimiter(ABC):
+    """Интерфейс бэкенда rate limit"""
+
+    @abstractmethod
+    async def hit(self, scope: str, key: int, limit: RateLimit) -> bool:
+        """Учитывает запрос. False — лимит превышен (запрос не учитывается)."""
+
+    async def close(self) -> None:
+        pass
+
+    def memory_stats(self) -> "LimiterMemoryStats | None":
+        """Память локального хранилища (None — бэкенд не держит состояние в процессе)"""
+        return None
+
+
+@dataclass(frozen=True)
+class LimiterMemoryStats:
+    tracked_keys: int
+    approx_bytes: int
+    evicted: int
+
+
+class MemoryRateLimiter(RateLimiter):
+    """
+    GCRA в памяти процесса: на ключ хранится одно число — TAT
+    (теоретическое время следующего запроса).
+    Ключ с TAT в прошлом ничем не отличается от нового, поэтому такие ключи
+    удаляются без потерь. Сверх max_keys вытесняются давно не писавшие.
+    """
+
+    def __init__(
+        self,
+        max_keys: int = RATE_LIMIT_MAX_KEYS,
+        clock: Callable[[], float] = monotonic,
+    ) -> None:
+        self.max_keys = max(1, max_keys)
+        self.evicted = 0
+        self._clock = clock
+        # scope -> {telegram_id: tat}, порядок — от давно не писавших к недавним
+        self._stores: Dict[str, "OrderedDict[int, float]"] = {}
+        self._size = 0
+
+    async def hit(self, scope: str, key: int, limit: RateLimit) -> bool:
+        now = self._clock()
+        store = self._stores.get(scope)
+        if store is None:
+            store = self._stores[scope] = OrderedDict()
+        self._evict_idle(store, now)
+
+        interval = limit.period / max(1, limit.max_requests)
+        tat = store.get(key)
+        if tat is None:
+            tat = now
+            self._size += 1
+        elif tat < now:
+            tat = now
+
+        new_tat = tat + interval
+        if new_tat - now > limit.period:
+            store[key] = tat
+            store.move_to_end(key)
+            return False
+
+        store[key] = new_tat
+        store.move_to_end(key)
+        if self._size > self.max_keys:
+            self._evict_oldest()
+        return True
+
+    def _evict_idle(self, store: "OrderedDict[int, float]", now: float) -> None:
+        # Амортизированно O(1): смотрим только начало очереди
+        while store:
+            key, tat = next(iter(store.items()))
+            if tat > now:
+                return
+            del store[key]
+            self._size -= 1
+
+    def _evict_oldest(self) -> None:
+        store = max(self._stores.values(), key=len)
+        store.popitem(last=False)
+        self._size -= 1
+        self.evicted += 1
+
+    def memory_stats(self) -> LimiterMemoryStats:
+        # Узел OrderedDict + int-ключ + float-значение на каждого пользователя
+        approx_bytes = sum(sys.getsizeof(store) for store in self._stores.values())
+        approx_bytes += self._size * (sys.getsizeof(0) + sys.getsizeof(0.0))
+        return LimiterMemoryStats(
+            tracked_keys=self._size,
+            approx_bytes=approx_bytes,
+            evicted=self.evicted,
+        )
+
+
+class WriteBehindRateLimiter(RateLimiter):
+    """
+    Rate limit с хранением в БД без запросов на горячем пути.
+
+    Решение принимается по локальным счётчикам (бакеты по bucket_seconds)
+    плюс снимку счётчиков других инстансов. Фоновая задача пачкой
+    сбрасывает накопленные запросы (upsert), подтягивает чужие счётчики
+    и удаляет устаревшие бакеты. Отставание между инстансами — не больше
+    интервала сброса.
+    """
+
+    def __init__(
+        self,
+        *,
+        bucket_seconds: int = RATE_LIMIT_BUCKET_SECONDS,
+        flush_interval: float = RATE_LIMIT_FLUSH_INTERVAL,
+        prune_interval: float = RATE_LIMIT_PRUNE_INTERVAL,
+        flush_chunk: int = RATE_LIMIT_FLUSH_CHUNK,
+        instance_id: str = INSTANCE_ID,
+        clock: Callable[[], float] = time,
+    ) -> None:
+        self.bucket_seconds = max(1, bucket_seconds)
+        self.flush_interval = flush_interval
+        self.prune_interval = prune_interval
+        self.flush_chunk = max(1, flush_chunk)
+        self.instance_id = instance_id
+        self._clock = clock
+
+        # (scope, telegram_id) -> {bucket_start: hits}
+        self._local: Dict[Tuple[str, int], Dict[int, int]] = {}
+        self._remote: Dict[Tuple[str, int], Dict[int, int]] = {}  # То же для других инстансов
+        self._pending: Dict[Tuple[str, int, int], int] = {}  # (scope, telegram_id, bucket_start) -> hits
+        self._max_period = self.bucket_seconds
+        self._task: asyncio.Task | None = None
+        self._last_prune = 0.0
+
+    def _bucket_start(self, now: float) -> int:
+        return int(now // self.bucket_seconds) * self.bucket_seconds
+
+    def _window_start(self, now: float, period: int) -> int:
+        # Окно — последние period секунд, округлённые до целых бакетов
+        return self._bucket_start(now) - max(period, self.bucket_seconds) + self.bucket_seconds
+
+    async def hit(self, scope: str, key: int, limit: RateLimit) -> bool:
+        self.ensure_started()
+        self._max_period = max(self._max_period, limit.period)
+
+        now = self._clock()
+        window_start = self._window_start(now, limit.period)
+
+        buckets = self._local.setdefault((scope, key), {})
+        for start in [start for start in buckets if start < window_start]:
+            del buckets[start]
+
+        remote = self._remote.get((scope, key), {})
+        count = sum(buckets.values()) + sum(hits for start, hits in remote.items() if start >= window_start)
+        if count >= limit.max_requests:
+            return False
+
+        bucket = self._bucket_start(now)
+        buckets[bucket] = buckets.get(bucket, 0) + 1
+        pending_key = (scope, key, bucket)
+        self._pending[pending_key] = self._pending.get(pending_key, 0) + 1
+        return True
+
+    def ensure_started(self) -> None:
+        if self._task is None or self._task.done():
+            # Запускается из middleware: фоновая синхронизация не наследует дедлайн апдейта
+            with unbounded():
+                self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+            await self.sync()
+            if self._clock() - self._last_prune >= self.prune_interval:
+                await self.prune()
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending, {}
+        items = list(batch.items())
+        sent = 0
+        try:
+            async with AsyncSessionLocal() as session:
+                # Каждая часть — свой INSERT и свой commit: при ошибке в очередь
+                # возвращается только то, что ещё не записано, без двойного счёта
+                while sent < len(items):
+                    chunk = items[sent:sent + self.flush_chunk]
+                    rows = [
+                        {
+                            "scope": scope,
+                            "telegram_id": telegram_id,
+                            "bucket_start": bucket_start,
+                            "instance_id": self.instance_id,
+                            "hits": hits,
+                        }
+                        for (scope, telegram_id, bucket_start), hits in chunk
+                    ]
+                    stmt = dialect_insert(session, RateLimitBucket).values(rows)
+                    stmt = stmt.on_conflict_do_update(
+                        index_elements=["scope", "telegram_id", "bucket_start", "instance_id"],
+                        set_={"hits": RateLimitBucket.hits + stmt.excluded.hits},
+                    )
+                    await session.execute(stmt)
+                    await session.commit()
+                    sent += len(chunk)
+        except (DBAPIError, OSError, Exception) as exc:
+            # Возвращаем неотправленные счётчики в очередь, отправим со следующей пачкой
+            for pending_key, hits in items[sent:]:
+                self._pending[pending_key] = self._pending.get(pending_key, 0) + hits
+            logger.warning("rate limit flush error: {}", type(exc).__name__)
+
+    async def sync(self) -> None:
+        window_start = self._window_start(self._clock(), self._max_period)
+        try:
+            async with AsyncSessionLocal() as session:
+                result = await session.execute(
+                    select(
+                        RateLimitBucket.scope,
+                        RateLimitBucket.telegram_id,
+                        RateLimitBucket.bucket_start,
+                        func.sum(RateLimitBucket.hits),
+                    )
+                    .where(
+                        RateLimitBucket.bucket_start >= window_start,
+                        RateLimitBucket.instance_id != self.instance_id,
+                    )
+                    .group_by(
+                        RateLimitBucket.scope,
+                        RateLimitBucket.telegram_id,
+                        RateLimitBucket.bucket_start,
+                    )
+                )
+                remote: Dict[Tuple[str, int], Dict[int, int]] = {}
+                for scope, telegram_id, bucket_start, hits in result:
+                    remote.setdefault((scope, telegram_id), {})[bucket_start] = int(hits or 0)
+                self._remote = remote
+        except (DBAPIError, OSError, Exception) as exc:
+            logger.warning("rate limit sync error: {}", type(exc).__name__)
+
+    async def prune(self) -> None:
+        now = self._clock()
+        self._last_prune = now
+        window_start = self._window_start(now, self._max_period)
+
+        for local_key in [k for k, buckets in self._local.items() if max(buckets, default=0) < window_start]:
+            del self._local[local_key]
+
+        try:
+            async with AsyncSessionLocal() as session:
+                await session.execute(
+                    delete(RateLimitBucket).where(
+                        RateLimitBucket.bucket_start < window_start - self.bucket_seconds
+                    )
+                )
+                await session.commit()
+        except (DBAPIError, OSError, Exception) as exc:
+            logger.warning("rate limit prune error: {}", type(exc).__name__)
+
+
+# GCRA: в ключе хранится одно число — теоретическое время следующего запроса (TAT, мс).
+# Проверка и обновление выполняются атомарно за один round trip.
+GCRA_SCRIPT = """
+local period = tonumber(ARGV[1])
+local interval = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+if tat < now then
+  tat = now
+end
+local new_tat = tat + interval
+if new_tat - now > period then
+  return 0
+end
+redis.call('SET', KEYS[1], new_tat, 'PX', new_tat - now)
+return 1
+"""
+
+
+class RedisRateLimiter(RateLimiter):
+    """
+    Общий для всех воркеров лимит в Redis (GCRA через Lua-скрипт).
+    Пока Redis недоступен, решение принимает локальный fallback.
+    """
+
+    def __init__(
+        self,
+        client=None,
+        *,
+        prefix: str = REDIS_KEY_PREFIX,
+        fallback: RateLimiter | None = None,
+        retry_after: float = REDIS_RETRY_AFTER,
+    ) -> None:
+        # redis импортируем только для этого бэкенда: на старте с RATE_LIMIT_BACKEND=memory он не нужен
+        from redis import asyncio as redis_asyncio
+        from redis.exceptions import RedisError
+
+        self._errors = (RedisError, OSError, asyncio.TimeoutError)
+        self._client = client or redis_asyncio.from_url(
+            REDIS_URL,
+            socket_timeout=REDIS_TIMEOUT,
+            socket_connect_timeout=REDIS_TIMEOUT,
+        )
+        self._script = self._client.register_script(GCRA_SCRIPT)
+        self._prefix = prefix
+        self._fallback = fallback or MemoryRateLimiter()
+        self._retry_after = retry_after
+        self._unavailable_until = 0.0
+
+    async def hit(self, scope: str, key: int, limit: RateLimit) -> bool:
+        if monotonic() < self._unavailable_until:
+            return await self._fallback.hit(scope, key, limit)
+
+        period_ms = limit.period * 1000
+        interval_ms = max(1, period_ms // max(1, limit.max_requests))
+        try:
+            allowed = await self._script(
+                keys=[f"{self._prefix}:{scope}:{key}"],
+                args=[period_ms, interval_ms],
+            )
+        except self._errors as exc:
+            self._unavailable_until = monotonic() + self._retry_after
+            logger.warning("rate limit redis unavailable, using local fallback: {}", type(exc).__name__)
+            return await self._fallback.hit(scope, key, limit)
+        return bool(allowed)
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+    def memory_stats(self) -> LimiterMemoryStats | None:
+        return self._fallback.memory_stats()
+
+
+def create_rate_limiter(backend: str) -> RateLimiter:
+    if backend == "redis":
+        return RedisRateLimiter()
+    if backend == "db":
+        return WriteBehindRateLimiter()
+    return MemoryRateLimiter()
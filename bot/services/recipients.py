@@ -0,0 +1,131 @@
+import asyncio
+import os
+from contextlib import aclosing
+from dataclasses import dataclass, asdict
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Dict, List, Tuple
+
+from sqlalchemy import String, cast, exists, func, select
+
+from bot.db.database import AsyncSessionLocal
+from bot.db.models import SparringProfile, User
+
+# Размер страницы keyset-пагинации. Следующая страница читается,
+# пока отправляется текущая.
+RECIPIENTS_PAGE_SIZE = int(os.getenv("RECIPIENTS_PAGE_SIZE", "500"))
+
+Recipient = Tuple[int, int]  # (users.id, telegram_id)
+
+
+@dataclass(frozen=True)
+class RecipientSegment:
+    """Фильтр получателей рассылки"""
+    has_active_sparring_profile: bool = False
+    created_after: datetime | None = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        if self.created_after is not None:
+            data["created_after"] = self.created_after.isoformat()
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any] | None) -> "RecipientSegment":
+        if not data:
+            return cls()
+        created_after = data.get("created_after")
+        return cls(
+            has_active_sparring_profile=bool(data.get("has_active_sparring_profile")),
+            created_after=datetime.fromisoformat(created_after) if created_after else None,
+        )
+
+
+ALL_USERS = RecipientSegment()
+
+
+def segment_preset(key: str) -> RecipientSegment | None:
+    """Готовые сегменты для кнопок админки"""
+    if key == "all":
+        return ALL_USERS
+    if key == "sparring":
+        return RecipientSegment(has_active_sparring_profile=True)
+    if key.startswith("new") and key[3:].isdigit():
+        return RecipientSegment(created_after=datetime.utcnow() - timedelta(days=int(key[3:])))
+    return None
+
+
+def _apply_segment(stmt, segment: RecipientSegment):
+    stmt = stmt.where(User.is_blocked.is_(False))
+    if segment.created_after is not None:
+        stmt = stmt.where(User.created_at >= segment.created_after)
+    if segment.has_active_sparring_profile:
+        stmt = stmt.where(
+            exists().where(
+                SparringProfile.telegram_user_id == cast(User.telegram_id, String),
+                SparringProfile.is_active.is_(True),
+            )
+        )
+    return stmt
+
+
+async def count_recipients(segment: RecipientSegment = ALL_USERS) -> int:
+    async with AsyncSessionLocal() as session:
+        total = await session.scalar(_apply_segment(select(func.count(User.id)), segment))
+        return total or 0
+
+
+async def _fetch_page(segment: RecipientSegment, after_id: int, limit: int) -> List[Recipient]:
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            _apply_segment(select(User.id, User.telegram_id), segment)
+            .where(User.id > after_id)
+            .order_by(User.id)
+            .limit(limit)
+        )
+        return [(row.id, row.telegram_id) for row in result]
+
+
+async def iter_recipients(
+    segment: RecipientSegment = ALL_USERS,
+    after_id: int = 0,
+    page_size: int = RECIPIENTS_PAGE_SIZE,
+) -> AsyncIterator[Recipient]:
+    """
+    Потоково отдаёт получателей по возрастанию users.id.
+    Keyset-пагинация вместо серверного курсора: каждая страница — короткий
+    запрос, который нормально работает через pgbouncer / Supabase pooler.
+    """
+    next_page = asyncio.create_task(_fetch_page(segment, after_id, page_size))
+    try:
+        while True:
+            page = await next_page
+            if not page:
+                return
+            if len(page) == page_size:
+                next_page = asyncio.create_task(_fetch_page(segment, page[-1][0], page_size))
+            else:
+                next_page = None
+            for recipient in page:
+                yield recipient
+            if next_page is None:
+                return
+    finally:
+        if next_page is not None and not next_page.done():
+            next_page.cancel()
+
+
+async def iter_chunks(
+    recipients: AsyncIterator[Recipient],
+    size: int,
+) -> AsyncIterator[List[Recipient]]:
+    # aclosing закрывает и источник: иначе при паузе/отмене iter_recipients
+    # остаётся приостановленным, а его префетч страницы живёт до сборки мусора.
+    chunk: List[Recipient] = []
+    async with aclosing(recipients):
+        async for recipient in recipients:
+            chunk.append(recipient)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
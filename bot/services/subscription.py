@@ -1,39 +1,108 @@
 import os
 from aiogram import Bot
 from aiogram.enums import ChatMemberStatus
+from aiogram.types import Chat, ChatMemberUpdated
+from loguru import logger
 
 from bot.config import PRIVILEGED_IDS
+from bot.services.user_service import get_user_snapshot, set_subscription_status
+from bot.utils.cache import AsyncTTLCache, CacheStats
+from bot.utils.deadline import DeadlineExceeded, bounded, shared_load
 
 # Получаем из env, например @armtemiy
 CHANNEL_ID = os.getenv("CHANNEL_ID", "@armtemiy")
 
-async def check_subscription(bot: Bot, user_id: int) -> bool:
+# Подписку кэшируем: get_chat_member — HTTP-запрос к Telegram, который расходует лимиты API.
+# Свежесть поддерживают апдейты chat_member (бот — админ канала).
+SUBSCRIPTION_CACHE_TTL = int(os.getenv("SUBSCRIPTION_CACHE_TTL", "600"))
+# "Не подписан" держим коротко: пользователь подписывается и сразу жмёт "Я подписался"
+SUBSCRIPTION_CACHE_NEGATIVE_TTL = int(os.getenv("SUBSCRIPTION_CACHE_NEGATIVE_TTL", "20"))
+SUBSCRIPTION_CACHE_STALE_TTL = int(os.getenv("SUBSCRIPTION_CACHE_STALE_TTL", "300"))
+# Ещё столько помним "подписан", чтобы не требовать подписку, когда проверка не удалась
+SUBSCRIPTION_CACHE_FALLBACK_TTL = int(os.getenv("SUBSCRIPTION_CACHE_FALLBACK_TTL", "3600"))
+SUBSCRIPTION_CACHE_SIZE = int(os.getenv("SUBSCRIPTION_CACHE_SIZE", "10000"))
+
+SUBSCRIBED_STATUSES = (
+    ChatMemberStatus.MEMBER,
+    ChatMemberStatus.ADMINISTRATOR,
+    ChatMemberStatus.CREATOR,
+)
+
+# True — подписан; "не подписан" хранится отрицательной записью (None) со своим TTL
+_subscription_cache: AsyncTTLCache[int, bool] = AsyncTTLCache(
+    SUBSCRIPTION_CACHE_SIZE,
+    SUBSCRIPTION_CACHE_TTL,
+    negative_ttl=SUBSCRIPTION_CACHE_NEGATIVE_TTL,
+    stale_ttl=SUBSCRIPTION_CACHE_STALE_TTL,
+    fallback_ttl=SUBSCRIPTION_CACHE_FALLBACK_TTL,
+)
+
+
+def get_subscription_cache_stats() -> CacheStats:
+    return _subscription_cache.stats
+
+
+def _check_disabled(user_id: int) -> bool:
+    # Если канал не задан, пропускаем проверку (для разработки)
+    return user_id in PRIVILEGED_IDS or not CHANNEL_ID or CHANNEL_ID == "@channel"
+
+
+def is_channel_chat(chat: Chat) -> bool:
+    """CHANNEL_ID может быть @username или числовым id"""
+    if CHANNEL_ID.startswith("@"):
+        return bool(chat.username) and chat.username.lower() == CHANNEL_ID[1:].lower()
+    return str(chat.id) == CHANNEL_ID
+
+
+async def _fetch_subscription(bot: Bot, user_id: int) -> bool | None:
+    # Как и снимки пользователей: общая загрузка переживает бюджет апдейта, который
+    # её начал, но ограничена своим пределом — и запрос к Telegram, и запись в БД
+    with shared_load():
+        chat_member = await bounded(bot.get_chat_member(chat_id=CHANNEL_ID, user_id=user_id))
+        subscribed = chat_member.status in SUBSCRIBED_STATUSES
+        await set_subscription_status(user_id, subscribed)
+    return True if subscribed else None
+
+
+async def check_subscription(bot: Bot, user_id: int, *, recheck: bool = False) -> bool:
     """
     Проверяет, подписан ли пользователь на канал.
+    recheck=True — не верить закэшированному "не подписан" (кнопка "Я подписался").
+    Если бюджет апдейта исчерпан или проверка не удалась — последний известный
+    статус (False, если его нет); проверка доработает в фоне, и "Я подписался"
+    возьмёт её результат из кэша.
     """
+    if _check_disabled(user_id):
+        return True
+
+    found, cached = _subscription_cache.peek(user_id)
+    if found and cached is None and recheck:
+        _subscription_cache.invalidate(user_id)
+    elif not found:
+        # После рестарта берём сохранённый статус из users и перепроверяем его в фоне
+        snapshot = await get_user_snapshot(user_id)
+        if snapshot is not None and snapshot.subscription_status:
+            _subscription_cache.set_stale(user_id, True)
+
     try:
-        if user_id in PRIVILEGED_IDS:
-            return True
-        # Если канал не задан, пропускаем проверку (для разработки)
-        if not CHANNEL_ID or CHANNEL_ID == "@channel": 
-             return True
-
-        chat_member = await bot.get_chat_member(
-            chat_id=CHANNEL_ID,
-            user_id=user_id
+        subscribed = await bounded(
+            _subscription_cache.get_or_load(user_id, lambda: _fetch_subscription(bot, user_id))
         )
+    except DeadlineExceeded:
+        logger.debug("subscription check: deadline exceeded for {}", user_id)
+        return bool(_subscription_cache.last_known(user_id))
+    except Exception as exc:
+        # Например, бот не админ канала: лучше вернуть False и попросить проверить права
+        logger.warning("Error checking subscription: {}", type(exc).__name__)
+        return bool(_subscription_cache.last_known(user_id))
+    return bool(subscribed)
 
-        subscribed_statuses = [
-            ChatMemberStatus.MEMBER,
-            ChatMemberStatus.ADMINISTRATOR,
-            ChatMemberStatus.CREATOR,
-        ]
-
-        return chat_member.status in subscribed_statuses
 
-    except Exception as e:
-        # Логирование ошибки лучше добавить
-        print(f"Error checking subscription: {e}")
-        # Если ошибка (например, бот не админ канала), возвращаем False или True в зависимости от строгости
-        # Обычно лучше вернуть False и попросить проверить права
-        return False
+async def apply_chat_member_update(event: ChatMemberUpdated) -> None:
+    """Обновляет кэш и users по апдейту chat_member из канала"""
+    if event.new_chat_member.user.is_bot:
+        return
+    user_id = event.new_chat_member.user.id
+    subscribed = event.new_chat_member.status in SUBSCRIBED_STATUSES
+    _subscription_cache.set(user_id, True if subscribed else None)
+    await set_subscription_status(user_id, subscribed)
@@ -1,17 +1,37 @@
 import os
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from datetime import datetime
-from time import time
-from typing import Dict, Tuple
+from typing import Dict, Iterable, List, Sequence, Tuple
 
 from loguru import logger
-from sqlalchemy import select
+from sqlalchemy import Row, String, cast, or_, select, update
 from sqlalchemy.exc import DBAPIError
 
-from bot.db.database import AsyncSessionLocal
+from bot.config import BOT_MODE
+from bot.db.database import AsyncSessionLocal, dialect_insert
 from bot.db.models import User, SparringProfile
+from bot.services.admin_stats import admin_stats
+from bot.utils.cache import AsyncTTLCache, CacheStats
+from bot.utils.deadline import DeadlineExceeded, bounded, shared_load
 
-USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "300"))
+# Источник изменений sparring_profiles для сброса кэша: off | notify | poll (см. profile_feed.py).
+# С включённым фидом кэш инвалидируется по событию, поэтому TTL можно держать большим.
+USER_CACHE_FEED = os.getenv("USER_CACHE_FEED", "off").lower()
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "300" if USER_CACHE_FEED == "off" else "3600"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+# "Пользователь не найден" кэшируем коротко: он может зарегистрироваться в любой момент
+USER_CACHE_NEGATIVE_TTL = int(os.getenv("USER_CACHE_NEGATIVE_TTL", "30"))
+# Сколько ещё после TTL отдаём устаревший снимок, обновляя его в фоне
+USER_CACHE_STALE_TTL = int(os.getenv("USER_CACHE_STALE_TTL", "60"))
+# Ещё столько держим снимок, чтобы показать его, если БД не ответила
+USER_CACHE_FALLBACK_TTL = int(os.getenv("USER_CACHE_FALLBACK_TTL", "3600"))
+# Фильтр "недавно видели" для get_or_create_user. Только для одного процесса: в supervisor
+# блокировку может отметить рассылка другого воркера, и пропущенный /start не снял бы флаг
+USER_SEEN_TTL = int(os.getenv("USER_SEEN_TTL", "3600"))
+SKIP_RECENTLY_SEEN = BOT_MODE != "supervisor" and USER_SEEN_TTL > 0
+USER_SEEN_SIZE = int(os.getenv("USER_SEEN_SIZE", "50000"))
+# Сколько telegram_id в одном IN (...) у get_user_snapshots: у asyncpg не больше 32767 параметров
+USER_SNAPSHOT_CHUNK = int(os.getenv("USER_SNAPSHOT_CHUNK", "1000"))
 STYLE_LABELS = {"outside": "Аутсайд", "inside": "Инсайд", "both": "Универсал"}
 
 
@@ -25,48 +45,89 @@ class UserSnapshot:
     sparring_stats: str | None = None  # Строка с кратким инфо о спарринге
 
 
-_user_cache: Dict[int, Tuple[float, UserSnapshot]] = {}
+# Кого этот процесс недавно записал в users: повторный /start с теми же данными не идёт в БД
+_recently_seen: AsyncTTLCache[int, Tuple[str | None, str | None]] = AsyncTTLCache(USER_SEEN_SIZE, USER_SEEN_TTL)
 
+_user_cache: AsyncTTLCache[int, UserSnapshot] = AsyncTTLCache(
+    USER_CACHE_SIZE,
+    USER_CACHE_TTL,
+    negative_ttl=USER_CACHE_NEGATIVE_TTL,
+    stale_ttl=USER_CACHE_STALE_TTL,
+    fallback_ttl=USER_CACHE_FALLBACK_TTL,
+)
 
-def _get_cached_user(telegram_id: int) -> UserSnapshot | None:
-    cached = _user_cache.get(telegram_id)
-    if not cached:
-        return None
-    timestamp, snapshot = cached
-    if time() - timestamp > USER_CACHE_TTL:
-        _user_cache.pop(telegram_id, None)
-        return None
-    return snapshot
 
+def get_user_cache_stats() -> CacheStats:
+    return _user_cache.stats
 
-def _set_cached_user(snapshot: UserSnapshot) -> None:
-    _user_cache[snapshot.telegram_id] = (time(), snapshot)
 
+def invalidate_user(telegram_id: int) -> None:
+    """Сбрасывает снимок пользователя (вызывают все, кто меняет users / sparring_profiles)"""
+    _user_cache.invalidate(telegram_id)
 
-def _make_snapshot(user: User, sparring_info: str | None = None) -> UserSnapshot:
-    return UserSnapshot(
-        telegram_id=user.telegram_id,
-        username=user.username,
-        first_name=user.first_name,
-        created_at=user.created_at,
-        subscription_status=user.subscription_status,
-        sparring_stats=sparring_info
+
+def _write_through_user(user: User | Row) -> None:
+    """
+    Обновляет закэшированный снимок после записи в users.
+    Спарринг-часть берём из старого снимка; если снимка нет (или закэшировано
+    "не найден") — просто сбрасываем, следующий запрос загрузит всё целиком.
+    """
+    cached = _user_cache.get(user.telegram_id)
+    if cached is None:
+        _user_cache.invalidate(user.telegram_id)
+        return
+    _user_cache.set(
+        user.telegram_id,
+        replace(
+            cached,
+            username=user.username,
+            first_name=user.first_name,
+            subscription_status=user.subscription_status,
+        ),
     )
 
 
-async def _fetch_user(session, telegram_id: int) -> User | None:
-    result = await session.execute(select(User).where(User.telegram_id == telegram_id))
-    return result.scalar_one_or_none()
+def _snapshot_select():
+    """Пользователь + спарринг-профиль одним запросом, только нужные снимку колонки"""
+    return select(
+        User.telegram_id,
+        User.username,
+        User.first_name,
+        User.created_at,
+        User.subscription_status,
+        SparringProfile.style,
+        SparringProfile.weight_kg,
+        SparringProfile.experience_years,
+        SparringProfile.is_active,
+    ).outerjoin(
+        SparringProfile,
+        SparringProfile.telegram_user_id == cast(User.telegram_id, String),
+    )
+
 
+async def _fetch_snapshot_rows(session, telegram_ids: Sequence[int]) -> List[Row]:
+    stmt = _snapshot_select()
+    if len(telegram_ids) == 1:
+        stmt = stmt.where(User.telegram_id == telegram_ids[0])
+    else:
+        stmt = stmt.where(User.telegram_id.in_(telegram_ids))
+    result = await session.execute(stmt)
+    return list(result)
 
-async def _fetch_sparring_profile(session, telegram_id: int) -> SparringProfile | None:
-    result = await session.execute(
-        select(SparringProfile).where(SparringProfile.telegram_user_id == str(telegram_id))
+
+def _row_to_snapshot(row: Row) -> UserSnapshot:
+    return UserSnapshot(
+        telegram_id=row.telegram_id,
+        username=row.username,
+        first_name=row.first_name,
+        created_at=row.created_at,
+        subscription_status=row.subscription_status,
+        sparring_stats=_format_sparring_stats(row)
     )
-    return result.scalar_one_or_none()
 
 
-def _format_sparring_stats(profile: SparringProfile | None) -> str | None:
+def _format_sparring_stats(profile) -> str | None:
+    # profile — строка выборки или сущность SparringProfile (нужны style, weight_kg, experience_years, is_active)
     if not profile or not profile.is_active:
         return None
 
@@ -76,55 +137,177 @@ def _format_sparring_stats(profile: SparringProfile | None) -> str | None:
     return f"{style_name}, {weight}, {experience}"
 
 
+async def _load_user_snapshot(telegram_id: int) -> UserSnapshot | None:
+    # Загрузка общая для всех ждущих (single-flight) и переживает бюджет апдейта,
+    # который её начал, — следующий запрос возьмёт результат из кэша. Поэтому
+    # statement_timeout для неё — свой фиксированный предел, а не дедлайн апдейта
+    with shared_load():
+        async with AsyncSessionLocal() as session:
+            rows = await _fetch_snapshot_rows(session, [telegram_id])
+    return _row_to_snapshot(rows[0]) if rows else None
+
+
 async def get_user_snapshot(telegram_id: int) -> UserSnapshot | None:
-    cached = _get_cached_user(telegram_id)
-    if cached:
-        return cached
+    """
+    Снимок пользователя. Если БД недоступна или бюджет апдейта исчерпан —
+    последний известный снимок (пусть и устаревший), иначе None.
+    """
+    try:
+        return await bounded(_user_cache.get_or_load(telegram_id, lambda: _load_user_snapshot(telegram_id)))
+    except DeadlineExceeded:
+        logger.debug("user_service snapshot: deadline exceeded for {}", telegram_id)
+    except (DBAPIError, OSError, Exception) as exc:
+        logger.warning("user_service snapshot error: {}", type(exc).__name__)
+    return _user_cache.last_known(telegram_id)
+
+
+async def get_user_snapshots(telegram_ids: Iterable[int]) -> Dict[int, UserSnapshot]:
+    """
+    Снимки сразу для многих пользователей: закэшированные берём из кэша,
+    остальные — запросами по USER_SNAPSHOT_CHUNK id. Ненайденных в результате нет.
+    """
+    snapshots: Dict[int, UserSnapshot] = {}
+    missing: List[int] = []
+    for telegram_id in dict.fromkeys(telegram_ids):
+        found, cached = _user_cache.peek(telegram_id)
+        if found:
+            if cached is not None:
+                snapshots[telegram_id] = cached
+            continue
+        missing.append(telegram_id)
+
+    if not missing:
+        return snapshots
 
     try:
         async with AsyncSessionLocal() as session:
-            user = await _fetch_user(session, telegram_id)
-            if not user:
-                return None
-
-            sparring = await _fetch_sparring_profile(session, telegram_id)
-            snapshot = _make_snapshot(user, _format_sparring_stats(sparring))
-            _set_cached_user(snapshot)
-            return snapshot
+            # Результат каждой части кэшируем сразу: при ошибке на следующей
+            # уже прочитанные снимки не теряются
+            for start in range(0, len(missing), USER_SNAPSHOT_CHUNK):
+                chunk = missing[start:start + USER_SNAPSHOT_CHUNK]
+                for row in await _fetch_snapshot_rows(session, chunk):
+                    snapshot = _row_to_snapshot(row)
+                    snapshots[snapshot.telegram_id] = snapshot
+                    _user_cache.set(snapshot.telegram_id, snapshot)
+                for telegram_id in chunk:
+                    if telegram_id not in snapshots:
+                        _user_cache.set(telegram_id, None)
     except (DBAPIError, OSError, Exception) as exc:
-        logger.warning("user_service snapshot error: {}", type(exc).__name__)
-        return cached
+        logger.warning("user_service snapshots error: {}", type(exc).__name__)
+    return snapshots
+
+
+async def _upsert_user(session, values: dict) -> Row | None:
+    """
+    Один INSERT ... ON CONFLICT (telegram_id) DO UPDATE ... RETURNING вместо
+    SELECT + INSERT/UPDATE: одновременные /start не упираются в уникальный индекс.
+    Строку обновляем, только если что-то изменилось; None — пользователь уже
+    есть и данные те же. Для SQLite без RETURNING (старше 3.35) — upsert и отдельный SELECT.
+    """
+    stmt = dialect_insert(session, User).values(**values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["telegram_id"],
+        set_={
+            "username": stmt.excluded.username,
+            "first_name": stmt.excluded.first_name,
+            "is_blocked": False,  # Раз пишет боту — снова доступен для рассылок
+        },
+        where=or_(
+            User.username.is_distinct_from(stmt.excluded.username),
+            User.first_name.is_distinct_from(stmt.excluded.first_name),
+            User.is_blocked.is_(True),
+        ),
+    )
+    columns = (User.telegram_id, User.username, User.first_name, User.created_at, User.subscription_status)
+    if session.get_bind().dialect.insert_returning:
+        row = (await session.execute(stmt.returning(*columns))).one_or_none()
+    else:
+        await session.execute(stmt)
+        row = (await session.execute(select(*columns).where(User.telegram_id == values["telegram_id"]))).one()
+    await session.commit()
+    return row
+
+
+async def get_or_create_user(
+    telegram_id: int,
+    username: str | None = None,
+    first_name: str | None = None,
+    subscription_status: bool = False,
+) -> bool:
+    """
+    Регистрирует пользователя или обновляет имя. Пользователей, которых этот
+    процесс недавно записал с теми же данными, пропускает без запроса к БД
+    (кроме режима supervisor — см. SKIP_RECENTLY_SEEN).
+    Возвращает False если БД недоступна.
+    """
+    if SKIP_RECENTLY_SEEN and _recently_seen.get(telegram_id) == (username, first_name):
+        return True
 
+    # created_at задаём сами: если RETURNING вернул это же значение — строка новая
+    created_at = datetime.utcnow()
+    try:
+        async with AsyncSessionLocal() as session:
+            row = await _upsert_user(session, {
+                "telegram_id": telegram_id,
+                "username": username,
+                "first_name": first_name,
+                "subscription_status": subscription_status,
+                "created_at": created_at,
+                "is_blocked": False,
+            })
+    except (DBAPIError, OSError, Exception) as exc:
+        logger.warning("user_service error: {}", type(exc).__name__)
+        return False
 
-async def get_or_create_user(telegram_id: int, username: str | None = None, first_name: str | None = None) -> User | None:
+    _recently_seen.set(telegram_id, (username, first_name))
+    if row is None:
+        return True
+    if row.created_at == created_at:
+        # Убираем закэшированное "не найден"; полный снимок (со спаррингом) загрузится при запросе
+        invalidate_user(telegram_id)
+        admin_stats.on_user_created()
+    else:
+        _write_through_user(row)
+    return True
+
+
+async def mark_users_blocked(telegram_ids: Iterable[int]) -> None:
     """
-    Получить или создать пользователя.
-    Возвращает None если БД недоступна.
+    Помечает пользователей, заблокировавших бота, чтобы рассылки их пропускали.
     """
+    ids = list(telegram_ids)
+    if not ids:
+        return
+    for telegram_id in ids:
+        _recently_seen.invalidate(telegram_id)  # Следующий /start должен снять флаг
+
     try:
         async with AsyncSessionLocal() as session:
-            result = await session.execute(select(User).where(User.telegram_id == telegram_id))
-            user = result.scalar_one_or_none()
-
-            if user:
-                if user.username != username or user.first_name != first_name:
-                    user.username = username
-                    user.first_name = first_name
-                    await session.commit()
-                # Не обновляем кэш тут, так как нет данных о спарринге
-                return user
-
-            new_user = User(
-                telegram_id=telegram_id,
-                username=username,
-                first_name=first_name,
-                subscription_status=False,
+            await session.execute(
+                update(User).where(User.telegram_id.in_(ids)).values(is_blocked=True)
             )
-            session.add(new_user)
             await session.commit()
-            await session.refresh(new_user)
-            # Не кэшируем тут, чтобы при следующем запросе подтянулся и спарринг профиль (если есть)
-            return new_user
     except (DBAPIError, OSError, Exception) as exc:
-        logger.warning("user_service error: {}", type(exc).__name__)
-        return None
+        logger.warning("user_service mark blocked error: {}", type(exc).__name__)
+
+
+async def set_subscription_status(telegram_id: int, subscribed: bool) -> None:
+    """
+    Сохраняет статус подписки в users.subscription_status (пишем только при изменении)
+    и обновляет закэшированный снимок.
+    """
+    try:
+        async with AsyncSessionLocal() as session:
+            await session.execute(
+                update(User)
+                .where(User.telegram_id == telegram_id, User.subscription_status.is_not(subscribed))
+                .values(subscription_status=subscribed)
+            )
+            await session.commit()
+    except (DBAPIError, OSError, Exception) as exc:
+        logger.warning("user_service subscription status error: {}", type(exc).__name__)
+        return
+
+    cached = _user_cache.get(telegram_id)
+    if cached is not None and cached.subscription_status != subscribed:
+        _user_cache.set(telegram_id, replace(cached, subscription_status=subscribed))
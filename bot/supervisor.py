@@ -0,0 +1,228 @@
+import asyncio
+import multiprocessing
+import os
+import secrets
+from typing import Any, Dict, List
+
+from aiogram import Bot, Dispatcher
+from aiohttp import ClientError, ClientSession, ClientTimeout, web
+from loguru import logger
+
+from bot.webhook import (
+    HEALTH_PATH,
+    WEBHOOK_HOST,
+    WEBHOOK_PATH,
+    WEBHOOK_PORT,
+    WEBHOOK_SECRET,
+    create_webhook_app,
+    register_webhook,
+    serve_app,
+)
+
+# Число воркеров; по умолчанию — по процессу на ядро
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "0")) or os.cpu_count() or 1
+# Воркеры слушают 127.0.0.1:WORKER_BASE_PORT + i
+WORKER_BASE_PORT = int(os.getenv("WORKER_BASE_PORT", "8100"))
+WORKER_PATH = "/update"
+WORKER_FORWARD_TIMEOUT = float(os.getenv("WORKER_FORWARD_TIMEOUT", "10"))
+WORKER_STOP_TIMEOUT = float(os.getenv("WORKER_STOP_TIMEOUT", "30"))
+WORKER_RESTART_DELAY = float(os.getenv("WORKER_RESTART_DELAY", "1"))
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def shard_key(update: Dict[str, Any]) -> int:
+    """
+    Пользователь, к которому относится апдейт (from.id / user.id), иначе чат.
+    Апдейты без них (poll и т.п.) шардируются по update_id.
+    """
+    for key, event in update.items():
+        if key == "update_id" or not isinstance(event, dict):
+            continue
+        for field in ("from", "user"):
+            user = event.get(field)
+            if isinstance(user, dict) and "id" in user:
+                return int(user["id"])
+        chat = event.get("chat")
+        if isinstance(chat, dict) and "id" in chat:
+            return int(chat["id"])
+    return int(update.get("update_id", 0))
+
+
+def shard_index(update: Dict[str, Any], workers: int) -> int:
+    return shard_key(update) % workers
+
+
+class UpdateReceiver:
+    """
+    Принимает вебхук Telegram и пересылает апдейт воркеру по from_user.id:
+    состояние и порядок апдейтов одного пользователя остаются в одном процессе.
+    """
+
+    def __init__(self, worker_urls: List[str], *, secret: str = WEBHOOK_SECRET, worker_secret: str = "") -> None:
+        self.worker_urls = worker_urls
+        self.secret = secret
+        self.worker_secret = worker_secret
+        self._session: ClientSession | None = None
+
+    async def on_startup(self, app: web.Application) -> None:
+        self._session = ClientSession(timeout=ClientTimeout(total=WORKER_FORWARD_TIMEOUT))
+
+    async def on_cleanup(self, app: web.Application) -> None:
+        if self._session is not None:
+            await self._session.close()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if self.secret and not secrets.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret):
+            return web.Response(body="Unauthorized", status=401)
+        body = await request.read()
+        try:
+            update = await request.json()
+        except ValueError:
+            return web.Response(text="Bad update", status=400)
+
+        worker_url = self.worker_urls[shard_index(update, len(self.worker_urls))]
+        try:
+            async with self._session.post(
+                worker_url,
+                data=body,
+                headers={SECRET_HEADER: self.worker_secret, "Content-Type": "application/json"},
+            ) as response:
+                # Воркер отвечает сразу, а обрабатывает в фоне; 5xx — Telegram повторит апдейт
+                return web.Response(body=await response.read(), status=response.status, content_type="application/json")
+        except (ClientError, asyncio.TimeoutError) as exc:
+            logger.warning("Worker {} unavailable: {}", worker_url, type(exc).__name__)
+            return web.Response(text="Worker unavailable", status=503)
+
+    async def _probe(self, url: str) -> bool:
+        try:
+            async with self._session.get(url.replace(WORKER_PATH, HEALTH_PATH)) as response:
+                return response.status == 200
+        except (ClientError, asyncio.TimeoutError):
+            return False
+
+    async def health(self, request: web.Request) -> web.Response:
+        workers = await asyncio.gather(*(self._probe(url) for url in self.worker_urls))
+        healthy = all(workers)
+        return web.json_response(
+            {"status": "ok" if healthy else "degraded", "workers": workers},
+            status=200 if healthy else 503,
+        )
+
+
+def create_receiver_app(
+    worker_urls: List[str],
+    *,
+    path: str = WEBHOOK_PATH,
+    secret: str = WEBHOOK_SECRET,
+    worker_secret: str = "",
+) -> web.Application:
+    receiver = UpdateReceiver(worker_urls, secret=secret, worker_secret=worker_secret)
+    app = web.Application()
+    app.on_startup.append(receiver.on_startup)
+    app.on_cleanup.append(receiver.on_cleanup)
+    app.router.add_post(path, receiver.handle)
+    app.router.add_get(HEALTH_PATH, receiver.health)
+    return app
+
+
+def _worker_entry(index: int, port: int, worker_secret: str) -> None:
+    asyncio.run(_run_worker(index, port, worker_secret))
+
+
+async def _run_worker(index: int, port: int, worker_secret: str) -> None:
+    from aiogram.fsm.storage.memory import SimpleEventIsolation
+
+    from bot.config import BOT_TOKEN
+    # main импортирует supervisor — поэтому create_dispatcher берём здесь, уже в процессе воркера
+    from bot.main import create_dispatcher
+    from bot.middlewares.metrics import setup_bot_metrics
+    from bot.utils.logs import LOG_FILE, setup_logging
+    from bot.utils.metrics import METRICS_PORT
+
+    if LOG_FILE:
+        # Свой файл на воркер: ротация одного файла из нескольких процессов небезопасна
+        root, ext = os.path.splitext(LOG_FILE)
+        setup_logging(log_file=f"{root}.worker{index}{ext}")
+
+    bot = Bot(token=BOT_TOKEN)
+    setup_bot_metrics(bot)
+    # Апдейты одного пользователя обрабатываются по очереди, как пришли.
+    # /metrics у каждого воркера свой: METRICS_PORT + 1 + номер
+    dp = create_dispatcher(
+        resume_broadcasts=index == 0,
+        metrics_port=METRICS_PORT + 1 + index if METRICS_PORT else 0,
+        events_isolation=SimpleEventIsolation(),
+    )
+    app = create_webhook_app(bot, dp, path=WORKER_PATH, secret=worker_secret)
+    logger.info("Worker {} started (pid {})", index, os.getpid())
+    await serve_app(app, "127.0.0.1", port)
+
+
+class WorkerPool:
+    """Запускает воркеры в отдельных процессах и перезапускает упавшие"""
+
+    def __init__(self, workers: int, base_port: int = WORKER_BASE_PORT) -> None:
+        self.workers = max(1, workers)
+        self.base_port = base_port
+        self.secret = secrets.token_urlsafe(32)
+        self._context = multiprocessing.get_context("spawn")
+        self._processes: List[multiprocessing.Process | None] = [None] * self.workers
+        self._monitor: asyncio.Task | None = None
+
+    @property
+    def urls(self) -> List[str]:
+        return [f"http://127.0.0.1:{self.base_port + index}{WORKER_PATH}" for index in range(self.workers)]
+
+    def _spawn(self, index: int) -> None:
+        process = self._context.Process(
+            target=_worker_entry,
+            args=(index, self.base_port + index, self.secret),
+            name=f"bot-worker-{index}",
+        )
+        process.start()
+        self._processes[index] = process
+
+    async def start(self) -> None:
+        for index in range(self.workers):
+            self._spawn(index)
+        self._monitor = asyncio.create_task(self._watch())
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(WORKER_RESTART_DELAY)
+            for index, process in enumerate(self._processes):
+                if process is not None and not process.is_alive():
+                    logger.warning("Worker {} exited with code {}, restarting", index, process.exitcode)
+                    self._spawn(index)
+
+    async def stop(self) -> None:
+        if self._monitor is not None:
+            self._monitor.cancel()
+            await asyncio.gather(self._monitor, return_exceptions=True)
+        processes = [process for process in self._processes if process is not None]
+        # SIGTERM: каждый воркер дообрабатывает принятые апдейты и вызывает shutdown-хуки
+        for process in processes:
+            process.terminate()
+        loop = asyncio.get_running_loop()
+        for process in processes:
+            await loop.run_in_executor(None, process.join, WORKER_STOP_TIMEOUT)
+            if process.is_alive():
+                logger.warning("Worker {} did not stop in {}s, killing", process.name, WORKER_STOP_TIMEOUT)
+                process.kill()
+
+
+async def run_supervisor(bot: Bot, dp: Dispatcher, workers: int = BOT_WORKERS) -> None:
+    """
+    Один процесс принимает вебхук и раздаёт апдейты N воркерам.
+    dp здесь только для списка allowed_updates — апдейты обрабатывают воркеры.
+    """
+    pool = WorkerPool(workers)
+    await pool.start()
+    app = create_receiver_app(pool.urls, worker_secret=pool.secret)
+    logger.info("Supervisor: {} workers", pool.workers)
+    try:
+        await serve_app(app, WEBHOOK_HOST, WEBHOOK_PORT, on_started=lambda: register_webhook(bot, dp))
+    finally:
+        await pool.stop()
+        await bot.session.close()
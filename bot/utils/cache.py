@@ -0,0 +1,195 @@
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass
+from time import monotonic
+from typing import Awaitable, Callable, Dict, Generic, Hashable, List, Tuple, TypeVar
+
+from loguru import logger
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+_MISSING = object()
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    stale_hits: int = 0  # Отдали устаревшее значение и обновили в фоне
+    negative_hits: int = 0  # Попадания в закэшированное "не найдено"
+    coalesced: int = 0  # Промахи, дождавшиеся чужого запроса вместо своего
+    evictions: int = 0
+    load_errors: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class AsyncTTLCache(Generic[K, V]):
+    """
+    LRU-кэш с TTL для асинхронных загрузчиков.
+
+    - Одновременные промахи по одному ключу ждут один общий запрос (single-flight).
+    - None кэшируется отдельно на negative_ttl ("нет такого пользователя").
+    - В течение stale_ttl после истечения TTL отдаётся старое значение,
+      а свежее загружается в фоне (stale-while-revalidate).
+    - Ещё fallback_ttl значение хранится для last_known: его отдают, когда
+      загрузка не удалась (БД недоступна, кончился бюджет апдейта).
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        ttl: float,
+        *,
+        negative_ttl: float = 0.0,
+        stale_ttl: float = 0.0,
+        fallback_ttl: float = 0.0,
+        clock: Callable[[], float] = monotonic,
+    ) -> None:
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.stale_ttl = stale_ttl
+        self.fallback_ttl = fallback_ttl
+        self.stats = CacheStats()
+        self._clock = clock
+        # key -> (время записи, значение); None — отрицательная запись
+        self._entries: "OrderedDict[K, Tuple[float, V | None]]" = OrderedDict()
+        self._inflight: Dict[K, asyncio.Task] = {}
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _lifetime(self, value: V | None) -> float:
+        return self.ttl if value is not None else self.negative_ttl
+
+    def _lookup(self, key: K) -> Tuple[object, bool]:
+        """Возвращает (значение или _MISSING, устарело ли оно)"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return _MISSING, False
+
+        stored_at, value = entry
+        age = self._clock() - stored_at
+        lifetime = self._lifetime(value)
+        if age <= lifetime:
+            self._entries.move_to_end(key)
+            return value, False
+        if value is not None and age <= lifetime + self.stale_ttl:
+            return value, True
+
+        if value is None or age > lifetime + self.stale_ttl + self.fallback_ttl:
+            del self._entries[key]
+        return _MISSING, False
+
+    def get(self, key: K, default: V | None = None) -> V | None:
+        """Значение без загрузки (в том числе устаревшее в пределах stale_ttl)"""
+        value, _ = self._lookup(key)
+        return default if value is _MISSING else value
+
+    def peek(self, key: K) -> Tuple[bool, V | None]:
+        """(есть ли запись, значение) — отличает закэшированный None от отсутствия записи"""
+        value, _ = self._lookup(key)
+        if value is _MISSING:
+            return False, None
+        return True, value
+
+    def last_known(self, key: K) -> V | None:
+        """Последнее загруженное значение, даже устаревшее (в пределах fallback_ttl) — на случай ошибки"""
+        entry = self._entries.get(key)
+        if entry is None or entry[1] is None:
+            return None
+        stored_at, value = entry
+        if self._clock() - stored_at > self.ttl + self.stale_ttl + self.fallback_ttl:
+            return None
+        return value
+
+    def set(self, key: K, value: V | None) -> None:
+        if value is None and self.negative_ttl <= 0:
+            self._entries.pop(key, None)
+            return
+        self._entries[key] = (self._clock(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+
+    def set_stale(self, key: K, value: V) -> None:
+        """
+        Кладёт значение сразу устаревшим: первый get_or_load отдаст его
+        и перезагрузит в фоне (нужен stale_ttl > 0). Для прогрева из БД.
+        """
+        self.set(key, value)
+        if key in self._entries:
+            self._entries[key] = (self._clock() - self._lifetime(value) - 1e-6, value)
+
+    def keys(self) -> List[K]:
+        """Ключи всех записей (в том числе истёкших, ещё не вытесненных)"""
+        return list(self._entries)
+
+    def invalidate(self, key: K) -> None:
+        self._entries.pop(key, None)
+        # Загрузка, начатая до сброса, могла прочитать старые данные: её результат
+        # отдадим тем, кто уже ждёт, но в кэш не положим (см. _load)
+        self._inflight.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._inflight.clear()
+
+    async def get_or_load(self, key: K, loader: Callable[[], Awaitable[V | None]]) -> V | None:
+        value, stale = self._lookup(key)
+        if value is not _MISSING:
+            if stale:
+                self.stats.stale_hits += 1
+                self._load_in_background(key, loader)
+            elif value is None:
+                self.stats.negative_hits += 1
+            else:
+                self.stats.hits += 1
+            return value
+
+        self.stats.misses += 1
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats.coalesced += 1
+        else:
+            task = self._start_load(key, loader)
+        # shield: отмена одного ожидающего не должна отменять общий запрос
+        return await asyncio.shield(task)
+
+    def _start_load(self, key: K, loader: Callable[[], Awaitable[V | None]]) -> asyncio.Task:
+        task = asyncio.ensure_future(self._load(key, loader))
+        self._inflight[key] = task
+        return task
+
+    def _load_in_background(self, key: K, loader: Callable[[], Awaitable[V | None]]) -> None:
+        if key in self._inflight:
+            return
+        task = self._start_load(key, loader)
+        # Ошибку фонового обновления уже залогировали в _load
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    async def _load(self, key: K, loader: Callable[[], Awaitable[V | None]]) -> V | None:
+        task = asyncio.current_task()
+        try:
+            value = await loader()
+        except Exception as exc:
+            self.stats.load_errors += 1
+            logger.debug("cache load error: {}", type(exc).__name__)
+            raise
+        else:
+            # Ключ сбросили во время загрузки — значение могло устареть
+            if self._inflight.get(key) is task:
+                self.set(key, value)
+            return value
+        finally:
+            if self._inflight.get(key) is task:
+                del self._inflight[key]
@@ -0,0 +1,92 @@
+import asyncio
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import monotonic
+from typing import Awaitable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+# Бюджет на один апдейт (секунды): дольше пользователь ждать не должен, 0 — без ограничения
+UPDATE_DEADLINE = float(os.getenv("UPDATE_DEADLINE", "5"))
+# Свой предел для общих загрузок в кэш (single-flight): их ждут несколько апдейтов,
+# поэтому бюджет первого из них не подходит, но и без ограничения их не оставляем
+SHARED_LOAD_DEADLINE = float(os.getenv("SHARED_LOAD_DEADLINE", "10"))
+
+# Момент (monotonic), к которому апдейт должен быть обработан; None — без ограничения.
+# ContextVar виден во всех вызовах апдейта, в том числе в событиях SQLAlchemy (greenlet наследует контекст)
+_deadline: ContextVar[float | None] = ContextVar("update_deadline", default=None)
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """Бюджет апдейта исчерпан — пора отвечать тем, что есть"""
+
+
+def remaining() -> float | None:
+    """Сколько секунд осталось; None — дедлайна нет"""
+    expires_at = _deadline.get()
+    if expires_at is None:
+        return None
+    return expires_at - monotonic()
+
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+
+@contextmanager
+def deadline(seconds: float | None) -> Iterator[None]:
+    """
+    Ограничивает бюджет на время блока. Вложенный блок может только сузить
+    внешний дедлайн. seconds=None или <= 0 — не ограничивать.
+    """
+    expires_at = _deadline.get()
+    if seconds is not None and seconds > 0:
+        candidate = monotonic() + seconds
+        expires_at = candidate if expires_at is None else min(expires_at, candidate)
+    token = _deadline.set(expires_at)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+@contextmanager
+def unbounded() -> Iterator[None]:
+    """
+    Снимает дедлайн: для работы, которую доводим до конца, даже если ждавший
+    её апдейт уже ответил (общая загрузка в кэш, фоновые задачи)
+    """
+    token = _deadline.set(None)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+@contextmanager
+def shared_load(seconds: float = SHARED_LOAD_DEADLINE) -> Iterator[None]:
+    """Дедлайн общей загрузки: не бюджет апдейта, который её начал, а фиксированный предел"""
+    with unbounded(), deadline(seconds):
+        yield
+
+
+async def bounded(awaitable: Awaitable[T]) -> T:
+    """
+    Ждёт не дольше остатка бюджета, иначе отменяет ожидание и бросает
+    DeadlineExceeded. Без дедлайна — обычный await.
+    """
+    left = remaining()
+    if left is None:
+        return await awaitable
+    if left <= 0:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()  # Не оставляем "coroutine was never awaited"
+        raise DeadlineExceeded()
+    try:
+        return await asyncio.wait_for(awaitable, left)
+    except asyncio.TimeoutError:
+        if expired():
+            raise DeadlineExceeded() from None
+        raise  # Таймаут изнутри (например, asyncpg), а не наш
@@ -0,0 +1,259 @@
+import asyncio
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+from logging.handlers import RotatingFileHandler
+from typing import Any, Callable, Dict, List
+
+from loguru import logger
+
+# Уровень для stdout и для файла (в файл по умолчанию пишем подробнее)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FILE = os.getenv("LOG_FILE", "logs/bot.log")
+LOG_FILE_LEVEL = os.getenv("LOG_FILE_LEVEL", "DEBUG").upper()
+LOG_FILE_MAX_BYTES = int(os.getenv("LOG_FILE_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_FILE_BACKUPS = int(os.getenv("LOG_FILE_BACKUPS", "5"))
+# text — цветной вывод для разработки, json — по строке JSON на запись (для сборщиков логов)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+# Доля сохраняемых записей горячих путей (hot_logger, события aiogram) по уровням.
+# WARNING и выше не семплируются.
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "DEBUG=0.01,INFO=0.1")
+# Предел очереди каждого синка: если stdout или диск не успевают, лишние записи
+# отбрасываются (и считаются), а не копятся в памяти
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+TEXT_FORMAT = (
+    "<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | "
+    "<cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>"
+)
+# Логгеры библиотек, которые пишут на каждый апдейт ("Update id=... is handled")
+HOT_STDLIB_LOGGERS = ("aiogram.event",)
+
+_STOP = object()
+
+
+def parse_sample_rates(raw: str) -> Dict[str, float]:
+    rates: Dict[str, float] = {}
+    for item in raw.split(","):
+        level, _, rate = item.partition("=")
+        if level.strip() and rate.strip():
+            rates[level.strip().upper()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+class SampledLogger:
+    """
+    Логгер для горячих путей (на каждый апдейт). Запись отбрасывается
+    по LOG_SAMPLE_RATES ещё до того, как loguru начнёт её собирать.
+    """
+
+    def __init__(self, rates: Dict[str, float], rand: Callable[[], float] = random.random) -> None:
+        self.rates = rates
+        self._rand = rand
+
+    def sampled(self, level: str) -> bool:
+        rate = self.rates.get(level, 1.0)
+        return rate >= 1.0 or self._rand() < rate
+
+    def _log(self, level: str, message: str, *args: Any, **kwargs: Any) -> None:
+        if self.sampled(level):
+            logger.opt(depth=2).log(level, message, *args, **kwargs)
+
+    def debug(self, message: str, *args: Any, **kwargs: Any) -> None:
+        self._log("DEBUG", message, *args, **kwargs)
+
+    def info(self, message: str, *args: Any, **kwargs: Any) -> None:
+        self._log("INFO", message, *args, **kwargs)
+
+    def warning(self, message: str, *args: Any, **kwargs: Any) -> None:
+        logger.opt(depth=1).warning(message, *args, **kwargs)
+
+
+hot_logger = SampledLogger(parse_sample_rates(LOG_SAMPLE_RATES))
+
+
+def json_formatter(record: Dict[str, Any]) -> str:
+    """
+    Одна строка JSON на запись; поля из bind()/contextualize() попадают в запись как есть.
+    Строка собирается один раз и переиспользуется всеми JSON-синками.
+    """
+    extra = record["extra"]
+    if "_json" not in extra:
+        payload = {
+            "ts": record["time"].isoformat(),
+            "level": record["level"].name,
+            "logger": record["name"],
+            "func": record["function"],
+            "line": record["line"],
+            "msg": record["message"],
+        }
+        payload.update((key, value) for key, value in extra.items() if not key.startswith("_"))
+        if record["exception"] is not None:
+            exc_type, exc_value, _ = record["exception"]
+            payload["exc"] = f"{exc_type.__name__ if exc_type else ''}: {exc_value}"
+        extra["_json"] = json.dumps(payload, ensure_ascii=False, default=str)
+    return "{extra[_json]}\n"
+
+
+class BackgroundWriter:
+    """
+    Синк loguru: event loop только кладёт готовую строку в очередь,
+    запись в поток или файл идёт в отдельном потоке пачками с одним flush.
+    Очередь ограничена: при переполнении запись отбрасывается, а не блокирует event loop.
+    """
+
+    def __init__(
+        self,
+        write: Callable[[str], Any],
+        flush: Callable[[], Any],
+        name: str = "log-writer",
+        max_queue: int = LOG_QUEUE_SIZE,
+    ) -> None:
+        self.name = name
+        self.dropped = 0  # Записей, не попавших в очередь из-за переполнения
+        self._write = write
+        self._flush = flush
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=max(1, max_queue))
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def __call__(self, message: str) -> None:
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            waiters: List[threading.Event] = []
+            stop = False
+            while True:
+                if item is _STOP:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    try:
+                        self._write(item)
+                    except Exception:  # Сообщить об ошибке записи лога некуда
+                        pass
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            try:
+                self._flush()
+            except Exception:
+                pass
+            for waiter in waiters:
+                waiter.set()
+            if stop:
+                return
+
+    def flush(self, timeout: float = 5.0) -> None:
+        """Ждёт, пока будет записано всё, что попало в очередь до вызова"""
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return
+        done.wait(timeout)
+
+    def close(self, timeout: float = 5.0) -> None:
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return  # Поток-писатель завис; он daemon и не помешает выходу
+        self._thread.join(timeout)
+
+
+def rotating_file_writer(path: str, max_bytes: int = LOG_FILE_MAX_BYTES, backups: int = LOG_FILE_BACKUPS) -> BackgroundWriter:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8", delay=True)
+    handler.terminator = ""
+
+    def write(message: str) -> None:
+        # Строка уже отформатирована loguru; ротацию делает RotatingFileHandler
+        handler.emit(logging.makeLogRecord({"msg": message}))
+
+    return BackgroundWriter(write, handler.flush, name="log-writer-file")
+
+
+class InterceptHandler(logging.Handler):
+    """Перенаправляет stdlib logging (aiogram, aiohttp, asyncio) в loguru"""
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if record.name in HOT_STDLIB_LOGGERS and not hot_logger.sampled(record.levelname):
+            return
+        try:
+            level: str | int = logger.level(record.levelname).name
+        except ValueError:
+            level = record.levelno
+        # Ищем вызвавший код за пределами модуля logging, чтобы в записи были его имя и строка
+        frame, depth = logging.currentframe(), 2
+        while frame is not None and frame.f_code.co_filename == logging.__file__:
+            frame = frame.f_back
+            depth += 1
+
+        logger.opt(depth=depth, exception=record.exc_info).log(level, record.getMessage())
+
+
+_writers: List[BackgroundWriter] = []
+
+
+def setup_logging(
+    *,
+    level: str = LOG_LEVEL,
+    log_file: str | None = LOG_FILE,
+    file_level: str = LOG_FILE_LEVEL,
+    fmt: str = LOG_FORMAT,
+    sample_rates: str = LOG_SAMPLE_RATES,
+    stream=None,
+) -> None:
+    stream = stream or sys.stdout
+    hot_logger.rates = parse_sample_rates(sample_rates)
+    stop_logging()
+
+    stdout_writer = BackgroundWriter(stream.write, stream.flush, name="log-writer-stdout")
+    _writers.append(stdout_writer)
+    if fmt == "json":
+        logger.add(stdout_writer, level=level, format=json_formatter)
+    else:
+        logger.add(stdout_writer, level=level, format=TEXT_FORMAT, colorize=stream.isatty())
+
+    if log_file:
+        file_writer = rotating_file_writer(log_file)
+        _writers.append(file_writer)
+        logger.add(file_writer, level=file_level, format=json_formatter)
+
+    logging.basicConfig(handlers=[InterceptHandler()], level=logging.INFO, force=True)
+
+
+def stop_logging() -> None:
+    """Снимает синки и дописывает очереди (фоновые потоки завершаются)"""
+    logger.remove()
+    for writer in _writers:
+        writer.close()
+    _writers.clear()
+
+
+def get_log_drops() -> Dict[str, int]:
+    """Сколько записей отброшено из-за переполнения очереди, по синкам"""
+    return {writer.name: writer.dropped for writer in _writers}
+
+
+def flush_logs_sync() -> None:
+    for writer in _writers:
+        writer.flush()
+
+
+async def flush_logs() -> None:
+    """Дописать очередь перед выходом"""
+    await asyncio.to_thread(flush_logs_sync)
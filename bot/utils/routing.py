@@ -0,0 +1,137 @@
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Tuple
+
+from aiogram import Router
+from aiogram.dispatcher.event.handler import FilterObject, HandlerObject
+from aiogram.dispatcher.event.telegram import TelegramEventObserver
+from aiogram.filters import Command, Filter
+from aiogram.types import Message
+from loguru import logger
+
+# Ключи индекса: ("text", "👤 Профиль") или ("command", "/profile")
+RouteKey = Tuple[str, str]
+# Ключ в data: индекс уже разобрал сообщение, обычной цепочке проиндексированные хендлеры пропускать
+ROUTED_KEY = "exact_routed"
+
+
+class ExactText(Filter):
+    """
+    То же, что F.text == value, но значение видно индексу маршрутов
+    (MagicFilter — непрозрачное выражение, его в хеш-таблицу не положить).
+    """
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+
+    async def __call__(self, message: Message) -> bool:
+        return message.text == self.text
+
+
+class NotRouted(Filter):
+    """
+    Первый фильтр каждого проиндексированного хендлера. Если быстрый путь уже
+    перебрал кандидатов и передал сообщение обычной цепочке, такие хендлеры
+    пропускаются: не-кандидаты всё равно не прошли бы точный фильтр, а кандидат,
+    отказавшийся через SkipHandler, не должен вызываться второй раз.
+    """
+
+    async def __call__(self, message: Message, **kwargs: object) -> bool:
+        return not kwargs.get(ROUTED_KEY)
+
+
+def _guard(handler: HandlerObject) -> None:
+    filters = handler.filters
+    if filters and not isinstance(filters[0].callback, NotRouted):
+        filters.insert(0, FilterObject(NotRouted()))
+
+
+@dataclass(frozen=True)
+class Route:
+    position: int  # Порядковый номер хендлера в обычной цепочке роутеров
+    router: Router
+    observer: TelegramEventObserver
+    handler: HandlerObject
+
+
+def _handler_keys(handler: HandlerObject) -> List[RouteKey] | None:
+    """Ключи хендлера; None — у него нет точного фильтра (текст, команда строкой)"""
+    keys: List[RouteKey] = []
+    for filter_object in handler.filters or ():
+        event_filter = filter_object.callback
+        if isinstance(event_filter, ExactText):
+            keys.append(("text", event_filter.text))
+        elif isinstance(event_filter, Command):
+            if event_filter.ignore_case or not all(isinstance(command, str) for command in event_filter.commands):
+                return None  # Регулярки и регистр — только через обычную цепочку
+            keys.extend(
+                ("command", prefix + command) for prefix in event_filter.prefix for command in event_filter.commands
+            )
+    return keys or None
+
+
+def message_keys(message: Message) -> List[RouteKey]:
+    keys: List[RouteKey] = []
+    if message.text is not None:
+        keys.append(("text", message.text))
+    text = message.text or message.caption
+    if text and not text[0].isspace():
+        # "/start@bot payload" -> "/start"; упоминание и аргументы проверит сам фильтр Command
+        keys.append(("command", text.split(maxsplit=1)[0].partition("@")[0]))
+    return keys
+
+
+class ExactRouteIndex:
+    """
+    Хеш-таблица точных маршрутов для сообщений: текст кнопки или команда ->
+    хендлеры-кандидаты в порядке обычной цепочки. Индексируется только начало
+    цепочки до первого хендлера без точного фильтра (состояние FSM, произвольный
+    фильтр): всё, что стоит раньше кандидата, тоже в индексе — значит, первый
+    кандидат, чьи фильтры прошли, совпадает с тем, что выбрала бы цепочка.
+    """
+
+    def __init__(self) -> None:
+        self._routes: Dict[RouteKey, List[Route]] = {}
+        self.indexed = 0
+        self.stopped_at: str | None = None  # Хендлер, на котором индексация остановилась
+
+    @classmethod
+    def build(cls, root: Router, event_name: str = "message") -> "ExactRouteIndex":
+        index = cls()
+        position = 0
+        for router in root.chain_tail:
+            observer = router.observers[event_name]
+            # Общие фильтры роутера и внешние middleware дочерних роутеров быстрый путь обошёл бы.
+            # Публичного доступа к фильтрам роутера в aiogram нет: если после обновления
+            # внутренности изменились, индекс выключается, и работает обычная цепочка
+            router_filters = getattr(getattr(observer, "_handler", None), "filters", None)
+            if router_filters is None:
+                logger.warning("Exact routing disabled: aiogram observer has no _handler.filters")
+                disabled = cls()
+                disabled.stopped_at = f"{router.name} (unsupported aiogram version)"
+                return disabled
+            if router_filters or (router is not root and observer.outer_middleware):
+                index.stopped_at = f"{router.name} (router filters/middleware)"
+                return index
+            for handler in observer.handlers:
+                keys = _handler_keys(handler)
+                if keys is None:
+                    index.stopped_at = f"{router.name}:{getattr(handler.callback, '__name__', handler.callback)}"
+                    return index
+                _guard(handler)
+                route = Route(position=position, router=router, observer=observer, handler=handler)
+                for key in dict.fromkeys(keys):
+                    index._routes.setdefault(key, []).append(route)
+                index.indexed += 1
+                position += 1
+        return index
+
+    def __len__(self) -> int:
+        return len(self._routes)
+
+    def candidates(self, keys: Iterable[RouteKey]) -> List[Route]:
+        found: List[Route] = []
+        for key in keys:
+            found.extend(self._routes.get(key, ()))
+        if len(found) > 1:
+            found.sort(key=lambda route: route.position)
+        return found
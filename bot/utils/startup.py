@@ -0,0 +1,38 @@
+from time import perf_counter
+from typing import Callable, Dict
+
+from loguru import logger
+
+# Отсчёт с первого импорта модуля (bot/main.py импортирует его раньше aiogram)
+PROCESS_STARTED = perf_counter()
+
+
+class StartupTimer:
+    """
+    Время старта по фазам: импорт модулей, инициализация БД, сборка
+    диспетчера и хендлеры startup — до момента, когда бот принимает апдейты.
+    """
+
+    def __init__(self, started: float = PROCESS_STARTED, clock: Callable[[], float] = perf_counter) -> None:
+        self._clock = clock
+        self._started = started
+        self._mark = started
+        self.phases: Dict[str, float] = {}
+        self.total: float | None = None
+
+    def lap(self, name: str) -> float:
+        """Закрывает фазу: время с прошлой отметки"""
+        now = self._clock()
+        self.phases[name] = self.phases.get(name, 0.0) + now - self._mark
+        self._mark = now
+        return self.phases[name]
+
+    async def ready(self) -> None:
+        """Хендлер dp.startup (регистрируется последним): бот готов принимать апдейты"""
+        self.lap("startup_handlers")
+        self.total = self._clock() - self._started
+        details = ", ".join(f"{name} {seconds:.3f}s" for name, seconds in self.phases.items() if seconds >= 0.0005)
+        logger.info("Startup took {:.3f}s ({})", self.total, details)
+
+
+startup_timer = StartupTimer()
@@ -0,0 +1,148 @@
+import asyncio
+import os
+import signal
+from typing import Any, List
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+from loguru import logger
+
+# Публичный адрес бота (https://bot.example.com); без него сервер стартует,
+# но setWebhook не вызывается — удобно для локальных тестов
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "").rstrip("/")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+# Telegram присылает его в X-Telegram-Bot-Api-Secret-Token: 1-256 символов A-Z, a-z, 0-9, _ и -
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", os.getenv("PORT", "8080")))
+# Сколько одновременных HTTPS-соединений Telegram держит к вебхуку (1-100)
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+# Через запятую; пусто — все типы, на которые есть хендлеры
+WEBHOOK_ALLOWED_UPDATES = os.getenv("WEBHOOK_ALLOWED_UPDATES", "")
+# Сколько ждём обработки уже принятых апдейтов при остановке
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "25"))
+HEALTH_PATH = os.getenv("HEALTH_PATH", "/health")
+
+
+def resolve_allowed_updates(dp: Dispatcher, raw: str = WEBHOOK_ALLOWED_UPDATES) -> List[str]:
+    allowed = [item.strip() for item in raw.split(",") if item.strip()]
+    return allowed or dp.resolve_used_update_types()
+
+
+class DrainingRequestHandler(SimpleRequestHandler):
+    """
+    Отвечает Telegram сразу, а апдейт обрабатывает в фоне.
+    При остановке новые апдейты получают 503 (Telegram пришлёт их повторно),
+    а уже принятые дообрабатываются до WEBHOOK_DRAIN_TIMEOUT.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, *, drain_timeout: float = WEBHOOK_DRAIN_TIMEOUT, **kwargs: Any) -> None:
+        super().__init__(dispatcher, bot, handle_in_background=True, **kwargs)
+        self.drain_timeout = drain_timeout
+        self.draining = False
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._background_feed_update_tasks)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if self.draining:
+            return web.Response(text="Shutting down", status=503)
+        return await super().handle(request)
+
+    async def drain(self) -> None:
+        self.draining = True
+        pending = set(self._background_feed_update_tasks)
+        if not pending:
+            return
+        logger.info("Webhook: draining {} in-flight updates", len(pending))
+        _, still_pending = await asyncio.wait(pending, timeout=self.drain_timeout)
+        if still_pending:
+            logger.warning("Webhook: {} updates not finished in {}s, cancelling", len(still_pending), self.drain_timeout)
+            for task in still_pending:
+                task.cancel()
+            await asyncio.gather(*still_pending, return_exceptions=True)
+
+    async def close(self) -> None:
+        await self.drain()
+        await super().close()
+
+
+WEBHOOK_HANDLER_KEY = web.AppKey("webhook_handler", DrainingRequestHandler)
+
+
+def create_webhook_app(
+    bot: Bot,
+    dp: Dispatcher,
+    *,
+    path: str = WEBHOOK_PATH,
+    secret: str = WEBHOOK_SECRET,
+    drain_timeout: float = WEBHOOK_DRAIN_TIMEOUT,
+) -> web.Application:
+    app = web.Application()
+    handler = DrainingRequestHandler(dp, bot, secret_token=secret or None, drain_timeout=drain_timeout)
+    # Регистрируем до setup_application: на остановке сначала дожидаемся апдейтов, потом shutdown-хуки
+    handler.register(app, path=path)
+    app[WEBHOOK_HANDLER_KEY] = handler
+
+    async def health(request: web.Request) -> web.Response:
+        status = 503 if handler.draining else 200
+        return web.json_response(
+            {"status": "draining" if handler.draining else "ok", "in_flight": handler.in_flight},
+            status=status,
+        )
+
+    app.router.add_get(HEALTH_PATH, health)
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def register_webhook(bot: Bot, dp: Dispatcher) -> None:
+    if not WEBHOOK_BASE_URL:
+        logger.warning("WEBHOOK_BASE_URL is empty, skipping setWebhook")
+        return
+    await bot.set_webhook(
+        url=f"{WEBHOOK_BASE_URL}{WEBHOOK_PATH}",
+        secret_token=WEBHOOK_SECRET or None,
+        max_connections=WEBHOOK_MAX_CONNECTIONS,
+        allowed_updates=resolve_allowed_updates(dp),
+    )
+    logger.info("Webhook set to {}{} (max_connections={})", WEBHOOK_BASE_URL, WEBHOOK_PATH, WEBHOOK_MAX_CONNECTIONS)
+
+
+def _wait_for_stop_signal() -> asyncio.Event:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # Windows
+            pass
+    return stop
+
+
+async def serve_app(app: web.Application, host: str, port: int, on_started=None) -> None:
+    """
+    Поднимает aiohttp-приложение и ждёт SIGTERM/SIGINT.
+    cleanup: перестаём принимать соединения, дожидаемся апдейтов, вызываем shutdown-хуки.
+    """
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logger.info("HTTP server listening on {}:{}", host, port)
+
+    stop = _wait_for_stop_signal()
+    try:
+        if on_started is not None:
+            await on_started()
+        await stop.wait()
+    finally:
+        await runner.cleanup()
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher) -> None:
+    """Вебхук при остановке не удаляем: Telegram копит апдейты, пока бот перезапускается"""
+    app = create_webhook_app(bot, dp)
+    await serve_app(app, WEBHOOK_HOST, WEBHOOK_PORT, on_started=lambda: register_webhook(bot, dp))
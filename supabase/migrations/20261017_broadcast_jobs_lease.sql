@@ -0,0 +1,5 @@
+-- Аренда задания рассылки: процесс, который её шлёт, и время последней отметки.
+-- Задание с просроченной арендой подхватывает другой процесс (bot/services/broadcast_jobs.py)
+alter table public.broadcast_jobs
+  add column if not exists owner varchar(128),
+  add column if not exists heartbeat_at timestamp;
@@ -0,0 +1,3 @@
+-- Сегмент получателей рассылки (RecipientSegment в боте)
+alter table public.broadcast_jobs
+  add column if not exists segment jsonb;
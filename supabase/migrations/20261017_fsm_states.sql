@@ -0,0 +1,10 @@
+-- Общее хранилище FSM бота (FSM_STORAGE=db), нужно для BOT_MODE=supervisor
+create table if not exists public.fsm_states (
+  key varchar(255) primary key,
+  state varchar(255),
+  data jsonb,
+  updated_at timestamp not null default now()
+);
+
+-- Таблица только для бота: без политик клиенты с anon-ключом её не видят
+alter table public.fsm_states enable row level security;
@@ -0,0 +1,24 @@
+-- Уведомления "рядом новый партнёр" (bot/services/partner_alerts.py)
+create table if not exists public.job_watermarks (
+  name varchar(64) primary key,
+  watermark timestamp with time zone not null,
+  updated_at timestamp not null default now()
+);
+
+create table if not exists public.partner_alerts (
+  recipient_id bigint not null,
+  partner_id bigint not null,
+  created_at timestamp not null default now(),
+  sent_at timestamp,
+  primary key (recipient_id, partner_id)
+);
+
+-- Очередь на отправку и "последнее уведомление пользователя" для лимита
+create index if not exists idx_partner_alerts_pending
+  on public.partner_alerts(created_at) where sent_at is null;
+create index if not exists idx_partner_alerts_sent_at
+  on public.partner_alerts(sent_at);
+
+-- Таблицы только для бота: без политик клиенты с anon-ключом их не видят
+alter table public.job_watermarks enable row level security;
+alter table public.partner_alerts enable row level security;
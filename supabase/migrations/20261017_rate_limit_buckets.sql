@@ -0,0 +1,16 @@
+-- Rate limit бота теперь хранит агрегированные бакеты (RATE_LIMIT_BACKEND=db).
+-- Построчная таблица больше не используется.
+drop table if exists public.rate_limit_entries;
+
+create table if not exists public.rate_limit_buckets (
+  telegram_id bigint not null,
+  bucket_start bigint not null,  -- unix time, кратно размеру бакета
+  instance_id varchar(64) not null,
+  hits integer not null default 0,
+  primary key (telegram_id, bucket_start, instance_id)
+);
+
+create index if not exists ix_rate_limit_buckets_bucket_start on public.rate_limit_buckets (bucket_start);
+
+-- Таблица только для бота: без политик клиенты с anon-ключом её не видят
+alter table public.rate_limit_buckets enable row level security;
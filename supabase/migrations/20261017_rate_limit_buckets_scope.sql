@@ -0,0 +1,18 @@
+-- В rate_limit_buckets добавлен столбец scope (тип апдейта) в первичный ключ.
+-- Таблица хранит только счётчики за последнее окно — проще пересоздать. Создаём её здесь же:
+-- бот с уже записанным отпечатком схемы create_all на старте не запускает (bot/db/database.py).
+drop table if exists public.rate_limit_buckets;
+
+create table public.rate_limit_buckets (
+  scope varchar(32) not null,  -- тип апдейта: message, callback_query...
+  telegram_id bigint not null,
+  bucket_start bigint not null,  -- unix time, кратно размеру бакета
+  instance_id varchar(64) not null,
+  hits integer not null default 0,
+  primary key (scope, telegram_id, bucket_start, instance_id)
+);
+
+create index if not exists ix_rate_limit_buckets_bucket_start on public.rate_limit_buckets (bucket_start);
+
+-- Таблица только для бота: без политик клиенты с anon-ключом её не видят
+alter table public.rate_limit_buckets enable row level security;
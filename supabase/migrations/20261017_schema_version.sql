@@ -0,0 +1,8 @@
+-- Отпечаток схемы бота: при совпадении бот не запускает create_all на старте (bot/db/database.py)
+create table if not exists public.schema_version (
+  id integer primary key,
+  version varchar(64) not null,
+  applied_at timestamp not null default now()
+);
+
+alter table public.schema_version enable row level security;
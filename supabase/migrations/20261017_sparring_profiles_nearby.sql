@@ -0,0 +1,8 @@
+-- Поиск партнёров рядом (/nearby, NEARBY_BACKEND=earthdistance).
+-- B-tree по (latitude, longitude) радиусный запрос не ускоряет — нужен GiST по точке на сфере.
+create extension if not exists cube with schema extensions;
+create extension if not exists earthdistance with schema extensions;
+
+create index if not exists idx_sparring_profiles_earth
+  on public.sparring_profiles using gist (ll_to_earth(latitude, longitude))
+  where is_active;
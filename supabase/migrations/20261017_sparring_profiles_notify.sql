@@ -0,0 +1,21 @@
+-- Уведомления бота об изменениях спарринг-профилей (USER_CACHE_FEED=notify)
+create or replace function notify_sparring_profile_changed()
+returns trigger as $$
+begin
+  perform pg_notify(
+    'sparring_profiles_changed',
+    coalesce(new.telegram_user_id, old.telegram_user_id)
+  );
+  return null;
+end;
+$$ language plpgsql;
+
+drop trigger if exists notify_sparring_profiles_changed on public.sparring_profiles;
+create trigger notify_sparring_profiles_changed
+  after insert or update or delete on public.sparring_profiles
+  for each row
+  execute function notify_sparring_profile_changed();
+
+-- Для режима poll (выборка по updated_at)
+create index if not exists idx_sparring_profiles_updated_at
+  on public.sparring_profiles(updated_at);
@@ -0,0 +1,8 @@
+-- Дневная активность пользователей для статистики админки (bot/services/admin_stats.py)
+create table if not exists public.user_activity (
+  day date not null,
+  telegram_id bigint not null,
+  primary key (day, telegram_id)
+);
+
+alter table public.user_activity enable row level security;
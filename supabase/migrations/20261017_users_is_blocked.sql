@@ -0,0 +1,3 @@
+-- Пользователи, заблокировавшие бота (проставляет движок рассылок)
+alter table public.users
+  add column if not exists is_blocked boolean not null default false;
@@ -0,0 +1,24 @@
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from bot.db.models import Base
+
+
+@pytest.fixture
+def sqlite_db(tmp_path, monkeypatch):
+    """
+    Временная SQLite-база со схемой бота. Вызывается внутри сценария теста
+    (движок привязан к его event loop): await sqlite_db(module, ...) подменяет
+    AsyncSessionLocal в переданных модулях и возвращает (engine, session_factory).
+    """
+
+    async def setup(*modules):
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'bot.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_factory = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+        for module in modules:
+            monkeypatch.setattr(module, "AsyncSessionLocal", session_factory)
+        return engine, session_factory
+
+    return setup
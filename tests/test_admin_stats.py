@@ -0,0 +1,56 @@
+import asyncio
+from datetime import datetime
+
+from sqlalchemy import event
+
+from bot.db.models import BroadcastJob, SparringProfile, User
+from bot.services import admin_stats
+from bot.services.admin_stats import AdminStatsService
+
+
+def test_snapshot_is_one_query_and_cached_between_refreshes(sqlite_db):
+    async def scenario():
+        engine, session_factory = await sqlite_db(admin_stats)
+
+        async with session_factory() as session:
+            session.add_all([
+                User(telegram_id=1, created_at=datetime(2024, 1, 10, 8)),
+                User(telegram_id=2, created_at=datetime(2024, 1, 8), is_blocked=True),
+                User(telegram_id=3, created_at=datetime(2023, 12, 1)),
+                SparringProfile(id="a", telegram_user_id="1", first_name="A", updated_at=datetime(2024, 1, 9)),
+                SparringProfile(id="b", telegram_user_id="2", first_name="B", is_active=False,
+                                updated_at=datetime(2023, 12, 1)),
+                BroadcastJob(text="hi", sent=8, failed=1, blocked=1, created_at=datetime(2024, 1, 5)),
+                BroadcastJob(text="old", sent=100, created_at=datetime(2023, 10, 1)),
+            ])
+            await session.commit()
+
+        statements = []
+        event.listen(engine.sync_engine, "before_cursor_execute",
+                     lambda conn, cursor, statement, *args: statements.append(statement))
+
+        clock = [0.0]
+        service = AdminStatsService(ttl=300, clock=lambda: clock[0], now=lambda: datetime(2024, 1, 10, 12))
+        for telegram_id in (1, 1, 3):
+            service.activity.record(telegram_id)
+        statements.clear()
+        first = await service.get()
+        reads = [statement for statement in statements if statement.lstrip().upper().startswith("SELECT")]
+
+        service.on_user_created()
+        clock[0] = 100.0
+        cached = await service.get()
+        clock[0] = 400.0
+        refreshed = await service.get()
+        await engine.dispose()
+        return first, reads, cached, refreshed
+
+    first, reads, cached, refreshed = asyncio.run(scenario())
+    assert len(reads) == 1
+    assert (first.total_users, first.blocked_users, first.new_users_today, first.new_users_week) == (3, 1, 1, 2)
+    assert (first.total_profiles, first.active_profiles, first.profiles_updated_week) == (2, 1, 1)
+    assert (first.dau, first.wau) == (2, 2)
+    assert (first.broadcast_sent, first.broadcast_failed, first.broadcast_blocked) == (8, 1, 1)
+    assert first.delivery_rate == 0.8
+    assert (cached.total_users, cached.new_users_today) == (4, 2)  # Инкремент без запроса
+    assert refreshed.total_users == 3  # Пересчёт по TTL берёт данные из БД
@@ -0,0 +1,47 @@
+import asyncio
+
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+
+from bot.services.broadcast import BroadcastEngine
+
+
+class FakeBot:
+    def __init__(self, blocked=(), flood_once=()):
+        self.blocked = set(blocked)
+        self.flood_once = set(flood_once)
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        if chat_id in self.blocked:
+            raise TelegramForbiddenError(method=None, message="Forbidden: bot was blocked by the user")
+        if chat_id in self.flood_once:
+            self.flood_once.discard(chat_id)
+            raise TelegramRetryAfter(method=None, message="Too Many Requests", retry_after=0)
+        self.sent.append(chat_id)
+
+
+def test_broadcast_sends_to_everyone_and_collects_blocked():
+    bot = FakeBot(blocked={3, 7})
+    marked = []
+
+    async def on_blocked(ids):
+        marked.extend(ids)
+
+    engine = BroadcastEngine(bot, concurrency=4, rate=1000, on_blocked=on_blocked)
+    stats = asyncio.run(engine.run(range(1, 11), "hi"))
+
+    assert sorted(bot.sent) == [1, 2, 4, 5, 6, 8, 9, 10]
+    assert stats.sent == 8
+    assert stats.blocked == 2
+    assert sorted(marked) == [3, 7]
+
+
+def test_broadcast_retries_after_flood_and_slows_down():
+    bot = FakeBot(flood_once={5})
+    engine = BroadcastEngine(bot, concurrency=2, rate=1000, min_rate=10, per_chat_interval=0)
+    stats = asyncio.run(engine.run(range(1, 6), "hi"))
+
+    assert sorted(bot.sent) == [1, 2, 3, 4, 5]
+    assert stats.retries == 1
+    assert stats.failed == 0
+    assert engine._bucket.rate < 1000
@@ -0,0 +1,186 @@
+import asyncio
+from datetime import datetime, timedelta
+
+
+from bot.db.models import BroadcastJob, SparringProfile, User
+from bot.services import broadcast_jobs, recipients, user_service
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        self.sent.append(chat_id)
+
+    async def edit_message_text(self, **kwargs):
+        return None
+
+
+async def _setup_db(sqlite_db, users):
+    engine, session_factory = await sqlite_db(broadcast_jobs, recipients, user_service)
+
+    async with session_factory() as session:
+        session.add_all(User(telegram_id=telegram_id) for telegram_id in users)
+        await session.commit()
+    return engine
+
+
+async def _wait_for(runner):
+    while runner._tasks:
+        await asyncio.gather(*runner._tasks.values())
+
+
+def test_job_runs_to_completion_in_checkpoints(sqlite_db):
+    async def scenario():
+        engine = await _setup_db(sqlite_db, range(100, 105))
+        bot = FakeBot()
+        runner = broadcast_jobs.BroadcastJobRunner(checkpoint_size=2)
+        await runner.start(bot)
+
+        job = await broadcast_jobs.create_job("hello", created_by=1)
+        runner.submit(job.id)
+        await _wait_for(runner)
+
+        job = await broadcast_jobs.get_job(job.id)
+        await engine.dispose()
+        return bot, job
+
+    bot, job = asyncio.run(scenario())
+    assert sorted(bot.sent) == [100, 101, 102, 103, 104]
+    assert job.status == broadcast_jobs.BroadcastJobStatus.DONE.value
+    assert job.total == 5
+    assert job.sent == 5
+
+
+def test_unfinished_job_resumes_from_cursor_on_start(sqlite_db):
+    async def scenario():
+        engine = await _setup_db(sqlite_db, range(100, 105))
+        job = await broadcast_jobs.create_job("hello", created_by=1)
+
+        # Имитируем падение процесса после первых двух получателей
+        async with broadcast_jobs.AsyncSessionLocal() as session:
+            stored = await session.get(BroadcastJob, job.id)
+            stored.status = broadcast_jobs.BroadcastJobStatus.RUNNING.value
+            stored.cursor = 2
+            stored.sent = 2
+            await session.commit()
+
+        bot = FakeBot()
+        runner = broadcast_jobs.BroadcastJobRunner(checkpoint_size=2)
+        await runner.start(bot)
+        await _wait_for(runner)
+
+        job = await broadcast_jobs.get_job(job.id)
+        await engine.dispose()
+        return bot, job
+
+    bot, job = asyncio.run(scenario())
+    assert sorted(bot.sent) == [102, 103, 104]
+    assert job.status == broadcast_jobs.BroadcastJobStatus.DONE.value
+    assert job.sent == 5
+
+
+def test_iter_recipients_pages_through_segment(sqlite_db):
+    async def scenario():
+        engine = await _setup_db(sqlite_db, range(100, 107))
+        async with recipients.AsyncSessionLocal() as session:
+            session.add_all([
+                SparringProfile(id="a", telegram_user_id="101", first_name="A", is_active=True),
+                SparringProfile(id="b", telegram_user_id="104", first_name="B", is_active=True),
+                SparringProfile(id="c", telegram_user_id="105", first_name="C", is_active=False),
+            ])
+            await session.commit()
+
+        everyone = [r async for r in recipients.iter_recipients(page_size=3)]
+        segment = recipients.segment_preset("sparring")
+        sparring = [r async for r in recipients.iter_recipients(segment, page_size=1)]
+        total = await recipients.count_recipients(segment)
+        await engine.dispose()
+        return everyone, sparring, total
+
+    everyone, sparring, total = asyncio.run(scenario())
+    assert [telegram_id for _, telegram_id in everyone] == list(range(100, 107))
+    assert [telegram_id for _, telegram_id in sparring] == [101, 104]
+    assert total == 2
+
+
+def test_closing_chunks_cancels_source_prefetch(sqlite_db):
+    async def scenario():
+        engine = await _setup_db(sqlite_db, range(100, 110))
+        source = recipients.iter_recipients(page_size=4)
+        chunks = recipients.iter_chunks(source, 2)
+        first = await chunks.__anext__()
+        await chunks.aclose()
+        source_frame = source.ag_frame
+        await engine.dispose()
+        return first, source_frame
+
+    first, source_frame = asyncio.run(scenario())
+    assert [telegram_id for _, telegram_id in first] == [100, 101]
+    # Источник закрыт вместе с чанками: его finally отменил префетч страницы.
+    assert source_frame is None
+
+
+def test_job_leased_by_live_worker_is_not_started_twice(sqlite_db):
+    async def scenario():
+        engine = await _setup_db(sqlite_db, range(100, 105))
+        live = await broadcast_jobs.create_job("live", created_by=1)
+        abandoned = await broadcast_jobs.create_job("abandoned", created_by=1)
+        paused = await broadcast_jobs.create_job("paused", created_by=1)
+
+        # Первое задание шлёт живой воркер, второе — упавший, третье живой воркер поставил на паузу
+        async with broadcast_jobs.AsyncSessionLocal() as session:
+            for job_id, status, heartbeat_at in (
+                (live.id, "running", datetime.utcnow()),
+                (abandoned.id, "running", datetime.utcnow() - timedelta(minutes=5)),
+                (paused.id, "paused", datetime.utcnow()),
+            ):
+                stored = await session.get(BroadcastJob, job_id)
+                stored.status, stored.owner, stored.heartbeat_at = status, "worker-1", heartbeat_at
+            await session.commit()
+
+        bot = FakeBot()
+        runner = broadcast_jobs.BroadcastJobRunner(checkpoint_size=2, lease_seconds=60, owner="worker-0")
+        await runner.start(bot)  # Как рестарт первого воркера
+        await runner.resume(paused.id)  # «Продолжить» из другого воркера, пока владелец держит аренду
+        await _wait_for(runner)
+        await runner.stop()
+
+        jobs = [await broadcast_jobs.get_job(job.id) for job in (live, abandoned, paused)]
+        await engine.dispose()
+        return bot, jobs
+
+    bot, (live, abandoned, paused) = asyncio.run(scenario())
+    assert sorted(bot.sent) == [100, 101, 102, 103, 104]  # Только брошенное задание
+    assert abandoned.status == "done" and abandoned.owner == "worker-0"
+    assert live.status == "running" and live.owner == "worker-1" and live.sent == 0
+    # Владелец сам продолжит его на ближайшем чекпоинте
+    assert paused.status == "running" and paused.owner == "worker-1"
+
+
+def test_pause_releases_lease_at_checkpoint(sqlite_db):
+    async def scenario():
+        engine = await _setup_db(sqlite_db, range(100, 105))
+        job = await broadcast_jobs.create_job("hello", created_by=1)
+        first = broadcast_jobs.BroadcastJobRunner(checkpoint_size=2, owner="worker-0")
+        await first.attach(FakeBot())
+        first.submit(job.id)
+        await asyncio.sleep(0)
+        await first.pause(job.id)
+        await _wait_for(first)
+        paused = await broadcast_jobs.get_job(job.id)
+
+        bot = FakeBot()
+        second = broadcast_jobs.BroadcastJobRunner(checkpoint_size=2, owner="worker-1")
+        await second.attach(bot)
+        await second.resume(job.id)
+        await _wait_for(second)
+        done = await broadcast_jobs.get_job(job.id)
+        await engine.dispose()
+        return paused, done, bot
+
+    paused, done, bot = asyncio.run(scenario())
+    assert paused.status == "paused" and paused.owner is None and paused.cursor > 0
+    assert done.status == "done" and done.owner == "worker-1"
+    assert done.sent == 5 and len(bot.sent) == 5 - paused.sent
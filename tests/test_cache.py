@@ -0,0 +1,98 @@
+import asyncio
+
+from bot.utils.cache import AsyncTTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_concurrent_misses_share_one_load():
+    cache = AsyncTTLCache(10, ttl=60)
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "value"
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get_or_load("k", loader) for _ in range(5)))
+
+    assert asyncio.run(scenario()) == ["value"] * 5
+    assert len(calls) == 1
+    assert cache.stats.coalesced == 4
+
+
+def test_negative_entries_and_lru_eviction():
+    clock = FakeClock()
+    cache = AsyncTTLCache(2, ttl=60, negative_ttl=5, clock=clock)
+    calls = []
+
+    async def missing():
+        calls.append(1)
+        return None
+
+    async def scenario():
+        await cache.get_or_load("ghost", missing)
+        await cache.get_or_load("ghost", missing)
+        clock.now += 10
+        await cache.get_or_load("ghost", missing)
+
+    asyncio.run(scenario())
+    assert len(calls) == 2
+    assert cache.stats.negative_hits == 1
+
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.set("c", 3)
+    assert "a" not in cache
+    assert len(cache) == 2
+    assert cache.stats.evictions >= 1
+
+
+def test_stale_value_is_served_while_refreshing():
+    clock = FakeClock()
+    cache = AsyncTTLCache(10, ttl=10, stale_ttl=30, clock=clock)
+    versions = iter(["v1", "v2"])
+
+    async def loader():
+        return next(versions)
+
+    async def scenario():
+        first = await cache.get_or_load("k", loader)
+        clock.now += 20
+        stale = await cache.get_or_load("k", loader)
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        fresh = await cache.get_or_load("k", loader)
+        return first, stale, fresh
+
+    assert asyncio.run(scenario()) == ("v1", "v1", "v2")
+    assert cache.stats.stale_hits == 1
+
+
+def test_invalidate_during_load_discards_the_stale_result():
+    cache = AsyncTTLCache(10, ttl=3600)
+    versions = iter(["old", "new"])
+    release = asyncio.Event()
+
+    async def loader():
+        value = next(versions)  # Прочитали строку до её изменения
+        if value == "old":
+            await release.wait()
+        return value
+
+    async def scenario():
+        first = asyncio.ensure_future(cache.get_or_load("k", loader))
+        await asyncio.sleep(0)
+        cache.invalidate("k")  # Профиль изменился, пока шла загрузка
+        second = await cache.get_or_load("k", loader)
+        release.set()
+        return await first, second, await cache.get_or_load("k", loader)
+
+    assert asyncio.run(scenario()) == ("old", "new", "new")
@@ -0,0 +1,85 @@
+import asyncio
+
+from sqlalchemy import event, inspect, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from bot.db import database
+
+
+def test_init_db_creates_schema_once_then_checks_version_row(tmp_path, monkeypatch):
+    async def scenario():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'bot.db'}")
+        monkeypatch.setattr(database, "engine", engine)
+        statements = []
+        event.listen(engine.sync_engine, "before_cursor_execute",
+                     lambda conn, cursor, statement, *args: statements.append(statement))
+
+        first = await database.init_db()
+        created = len(statements)
+        statements.clear()
+        second = await database.init_db()
+        warm = list(statements)
+
+        monkeypatch.setattr(database, "schema_fingerprint", lambda: "changed")
+        statements.clear()
+        third = await database.init_db()
+        migrated = len(statements)
+        async with engine.connect() as conn:
+            tables = await conn.run_sync(lambda sync_conn: inspect(sync_conn).get_table_names())
+        await engine.dispose()
+        return first, second, third, created, warm, migrated, tables
+
+    first, second, third, created, warm, migrated, tables = asyncio.run(scenario())
+    assert first and second and third
+    assert created > 10
+    assert len(warm) == 1 and "schema_version" in warm[0]  # Обычный старт — одна строка версии
+    assert migrated > 1
+    assert "users" in tables and "schema_version" in tables
+
+
+def test_init_db_does_not_stamp_version_when_existing_table_lacks_columns(tmp_path, monkeypatch):
+    async def scenario():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'bot.db'}")
+        monkeypatch.setattr(database, "engine", engine)
+        async with engine.begin() as conn:
+            # users из старой версии: без is_blocked и прочих новых колонок
+            await conn.execute(text("CREATE TABLE users (id INTEGER PRIMARY KEY, telegram_id BIGINT)"))
+
+        ok = await database.init_db()
+        stored = await database._stored_schema_version()
+        await engine.dispose()
+        return ok, stored
+
+    ok, stored = asyncio.run(scenario())
+    assert ok
+    assert stored is None  # Следующий старт снова проверит схему
+
+
+def test_reaper_closes_connections_idle_at_the_bottom_of_the_lifo_pool(tmp_path, monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(database, "monotonic", lambda: clock[0])
+
+    async def scenario():
+        engine = create_async_engine(
+            f"sqlite+aiosqlite:///{tmp_path / 'bot.db'}",
+            poolclass=database.TimedQueuePool, pool_size=3, max_overflow=0, pool_timeout=1, pool_use_lifo=True,
+        )
+        monkeypatch.setattr(database, "engine", engine)
+        connections = [await engine.connect() for _ in range(3)]
+        for conn in connections[:2]:
+            await conn.close()  # Вернулись в пул в момент 0
+        clock[0] = 100
+        await connections[2].close()
+
+        clock[0] = 120
+        closed = await database.IdleConnectionReaper(max_idle=50).reap_once()
+        pool = engine.sync_engine.pool
+        left = pool.checkedin()
+        # Закрытые не занимают место в пуле: снова можно взять все три
+        again = [await engine.connect() for _ in range(3)]
+        for conn in again:
+            await conn.close()
+        await engine.dispose()
+        return closed, left
+
+    assert asyncio.run(scenario()) == (2, 1)
@@ -0,0 +1,92 @@
+import asyncio
+from time import perf_counter
+
+import pytest
+from sqlalchemy import select
+
+from bot.db import database
+from bot.db.health import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, DatabaseHealthCheck, DatabaseUnavailable
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_breaker_trips_on_failure_rate_and_probes_one_request_at_a_time():
+    clock = FakeClock()
+    breaker = CircuitBreaker(window=10, window_seconds=30, min_calls=4, failure_rate=0.5,
+                             open_seconds=10, max_open_seconds=25, probe_timeout=3, clock=clock)
+
+    for _ in range(3):
+        breaker.record_failure(OSError())
+    assert breaker.state == CLOSED  # Меньше min_calls обращений
+    breaker.record_success()
+    breaker.record_failure(OSError())
+    assert breaker.state == OPEN and breaker.stats.trips == 1
+
+    assert not breaker.allow()
+    clock.now += 10
+    assert breaker.allow()  # Пробный запрос
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()  # Второй ждёт результата пробы
+    breaker.record_failure(OSError())
+    assert breaker.state == OPEN and breaker.retry_in == 20  # Пауза удвоилась
+
+    clock.now += 20
+    assert breaker.allow()
+    clock.now += 3
+    assert breaker.allow()  # Проба зависла дольше probe_timeout — пускаем следующую
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.stats.rejected == 2
+
+
+def test_open_breaker_fails_fast_and_health_check_closes_it(monkeypatch):
+    clock = FakeClock()
+    breaker = CircuitBreaker(open_seconds=15, clock=clock)
+    monkeypatch.setattr(database, "db_breaker", breaker)
+    health = DatabaseHealthCheck(breaker, database.ping, interval=0)
+
+    async def scenario():
+        breaker.trip(TimeoutError())
+        started = perf_counter()
+        with pytest.raises(DatabaseUnavailable):
+            async with database.AsyncSessionLocal() as session:
+                await session.execute(select(1))
+        elapsed = perf_counter() - started
+
+        early = await health.check_once()
+        clock.now += 15
+        recovered = await health.check_once()
+        async with database.AsyncSessionLocal() as session:
+            value = await session.scalar(select(1))
+        return elapsed, early, recovered, value
+
+    elapsed, early, recovered, value = asyncio.run(scenario())
+    assert elapsed < 0.1
+    assert not early  # Пауза после размыкания ещё идёт
+    assert recovered and breaker.state == CLOSED
+    assert value == 1
+    assert breaker.stats.last_error == "TimeoutError"
+
+
+def test_service_statements_do_not_count_as_breaker_successes(monkeypatch):
+    clock = FakeClock()
+    breaker = CircuitBreaker(open_seconds=15, probe_timeout=60, clock=clock)
+    monkeypatch.setattr(database, "db_breaker", breaker)
+
+    async def scenario():
+        breaker.trip(OSError())
+        clock.now += 15
+        async with database.engine.connect() as conn:  # Пробное соединение в half_open
+            # Как SET LOCAL statement_timeout из listener'а begin
+            await conn.exec_driver_sql("SELECT 1", execution_options={database.SKIP_BREAKER_OPTION: True})
+            after_service = breaker.state
+            await conn.exec_driver_sql("SELECT 1")
+        return after_service, breaker.state
+
+    assert asyncio.run(scenario()) == (HALF_OPEN, CLOSED)
@@ -0,0 +1,113 @@
+import asyncio
+from datetime import datetime
+from time import perf_counter
+from types import SimpleNamespace
+
+from aiogram import Bot, Dispatcher, Router
+from aiogram.types import Update
+
+from bot.db.database import statement_timeout_ms
+from bot.db.health import DatabaseUnavailable
+from bot.middlewares.deadline import DeadlineMiddleware
+from bot.services import user_service
+from bot.utils.cache import AsyncTTLCache
+from bot.utils.deadline import SHARED_LOAD_DEADLINE, deadline, remaining
+
+
+def test_update_deadline_is_visible_to_handlers_and_only_narrows():
+    seen = {}
+    router = Router()
+
+    @router.message()
+    async def handler(message):
+        seen["update"] = remaining()
+        with deadline(60):
+            seen["wider"] = remaining()
+        with deadline(0.5):
+            seen["narrower"] = remaining()
+            seen["statement_timeout_ms"] = statement_timeout_ms()
+
+    async def scenario():
+        dp = Dispatcher()
+        dp.update.outer_middleware(DeadlineMiddleware(seconds=3))
+        dp.include_router(router)
+        bot = Bot(token="42:TEST")
+        await dp.feed_update(bot, Update.model_validate({
+            "update_id": 1,
+            "message": {
+                "message_id": 1, "date": 1700000000, "text": "hi",
+                "chat": {"id": 1, "type": "private"},
+                "from": {"id": 1, "is_bot": False, "first_name": "T"},
+            },
+        }, context={"bot": bot}))
+        await bot.session.close()
+
+    asyncio.run(scenario())
+    assert 2.5 < seen["update"] <= 3
+    assert seen["wider"] <= seen["update"]  # Вложенный блок бюджет не расширяет
+    assert seen["narrower"] <= 0.5
+    assert 0 < seen["statement_timeout_ms"] <= 500
+    assert remaining() is None and statement_timeout_ms() is None
+
+
+def test_snapshot_past_deadline_returns_none_and_finishes_load_in_background(monkeypatch):
+    telegram_id = 777000111
+    loader_deadlines = []
+
+    async def slow_fetch(session, telegram_ids):
+        loader_deadlines.append(remaining())
+        await asyncio.sleep(0.2)
+        return [SimpleNamespace(
+            telegram_id=telegram_ids[0], username="late", first_name="Late", created_at=datetime(2026, 1, 1),
+            subscription_status=False, is_active=False,
+        )]
+
+    monkeypatch.setattr(user_service, "_fetch_snapshot_rows", slow_fetch)
+    user_service.invalidate_user(telegram_id)
+
+    async def scenario():
+        started = perf_counter()
+        with deadline(0.05):
+            first = await user_service.get_user_snapshot(telegram_id)
+        elapsed = perf_counter() - started
+        await asyncio.sleep(0.25)
+        with deadline(0.05):
+            second = await user_service.get_user_snapshot(telegram_id)
+        return first, elapsed, second
+
+    try:
+        first, elapsed, second = asyncio.run(scenario())
+    finally:
+        user_service.invalidate_user(telegram_id)
+    assert first is None and elapsed < 0.15  # Неполный ответ вовремя
+    assert second is not None and second.username == "late"  # Загрузку не выбросили
+    assert len(loader_deadlines) == 1
+    # Общая загрузка живёт по своему пределу, а не по бюджету апдейта, который её начал
+    assert 1 < loader_deadlines[0] <= SHARED_LOAD_DEADLINE
+
+
+def test_snapshot_falls_back_to_last_known_value_when_db_fails(monkeypatch):
+    clock = [0.0]
+    cache = AsyncTTLCache(10, 60, fallback_ttl=600, clock=lambda: clock[0])
+    monkeypatch.setattr(user_service, "_user_cache", cache)
+    snapshot = user_service.UserSnapshot(5, "old", "Old", datetime(2026, 1, 1), True)
+    results = iter([snapshot, DatabaseUnavailable(15)])
+
+    async def load(telegram_id):
+        result = next(results)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    monkeypatch.setattr(user_service, "_load_user_snapshot", load)
+
+    async def scenario():
+        first = await user_service.get_user_snapshot(5)
+        clock[0] = 300  # TTL истёк, БД лежит
+        second = await user_service.get_user_snapshot(5)
+        clock[0] = 1000  # Слишком старый даже для запасного ответа
+        return first, second, cache.last_known(5)
+
+    first, second, expired = asyncio.run(scenario())
+    assert first == second == snapshot
+    assert expired is None
@@ -0,0 +1,52 @@
+import asyncio
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from loguru import logger
+from sqlalchemy import func, select
+
+from bot.db import fsm_storage
+from bot.db.models import FsmRecord
+from bot.states import AdminStates
+
+
+def test_database_storage_round_trip(sqlite_db):
+    async def scenario():
+        engine, session_factory = await sqlite_db(fsm_storage)
+
+        # Второй экземпляр — как другой процесс: видит те же данные
+        writer = fsm_storage.DatabaseStorage()
+        reader = fsm_storage.DatabaseStorage()
+        key = StorageKey(bot_id=1, chat_id=10, user_id=10)
+
+        await writer.set_state(key, AdminStates.waiting_for_broadcast_text)
+        await writer.update_data(key, {"segment": {"has_active_sparring_profile": True}})
+        state = await reader.get_state(key)
+        data = await reader.get_data(key)
+
+        await writer.set_state(key, None)
+        await writer.set_data(key, {})
+        cleared = (await reader.get_state(key), await reader.get_data(key))
+        async with session_factory() as session:
+            rows = await session.scalar(select(func.count()).select_from(FsmRecord))
+        await engine.dispose()
+        return state, data, cleared, rows
+
+    state, data, cleared, rows = asyncio.run(scenario())
+    assert state == AdminStates.waiting_for_broadcast_text.state
+    assert data == {"segment": {"has_active_sparring_profile": True}}
+    assert cleared == (None, {})
+    assert rows == 0
+
+
+def test_memory_storage_in_supervisor_mode_warns():
+    messages = []
+    handler_id = logger.add(lambda message: messages.append(message.record["message"]), level="WARNING")
+    try:
+        storage = fsm_storage.create_fsm_storage("memory", mode="supervisor")
+        fsm_storage.create_fsm_storage("memory", mode="polling")
+    finally:
+        logger.remove(handler_id)
+
+    assert isinstance(storage, MemoryStorage)
+    assert len(messages) == 1 and "supervisor" in messages[0]
@@ -0,0 +1,67 @@
+import io
+import json
+import logging
+import sys
+import threading
+
+from loguru import logger
+
+from bot.utils import logs
+
+
+def test_sampled_logger_drops_hot_records_before_loguru():
+    values = iter([0.5, 0.001])
+    sampled = logs.SampledLogger({"DEBUG": 0.01, "INFO": 1.0}, rand=lambda: next(values))
+    messages = []
+    handler_id = logger.add(lambda message: messages.append(message.record["message"]), level="DEBUG")
+    try:
+        sampled.info("always {}", 1)
+        sampled.debug("dropped")
+        sampled.debug("kept")
+        sampled.warning("never sampled")
+    finally:
+        logger.remove(handler_id)
+
+    assert messages == ["always 1", "kept", "never sampled"]
+
+
+def test_setup_logging_writes_json_lines_through_the_queue(tmp_path):
+    stream = io.StringIO()
+    log_file = tmp_path / "bot.log"
+    root_handlers = logging.root.handlers[:]
+    try:
+        logs.setup_logging(stream=stream, log_file=str(log_file), fmt="json", sample_rates="DEBUG=0")
+        logger.bind(update_id=7).info("handled {}", "start")
+        logs.hot_logger.debug("sampled out")
+        logging.getLogger("aiogram.event").info("Update id=%s is handled", 7)
+        logs.flush_logs_sync()
+    finally:
+        logs.stop_logging()
+        logger.add(sys.stderr)
+        logging.root.handlers = root_handlers
+
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [line["msg"] for line in lines] == ["handled start", "Update id=7 is handled"]
+    assert lines[0]["update_id"] == 7
+    assert lines[0]["level"] == "INFO"
+    file_lines = [json.loads(line) for line in log_file.read_text(encoding="utf-8").splitlines()]
+    assert [line["msg"] for line in file_lines] == ["handled start", "Update id=7 is handled"]
+
+
+def test_background_writer_drops_records_when_queue_is_full():
+    release = threading.Event()
+    written = []
+
+    def slow_write(line):
+        release.wait(5)  # Синк «завис»: очередь не разбирается
+        written.append(line)
+
+    writer = logs.BackgroundWriter(slow_write, lambda: None, name="slow", max_queue=2)
+    try:
+        for i in range(10):
+            writer(f"line {i}\n")  # event loop не блокируется, лишнее отбрасывается
+        assert writer.dropped >= 7
+    finally:
+        release.set()
+        writer.close()
+    assert len(written) + writer.dropped == 10
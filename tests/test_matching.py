@@ -0,0 +1,71 @@
+import asyncio
+import random
+from dataclasses import replace
+from math import isinf
+
+from bot.services.matching import MatchingService, ProfileMatrix, pair_penalty
+from bot.services.nearby import PartnerLocation
+
+
+def _profile(rng: random.Random, telegram_id: int, lat: float = 55.75, lon: float = 37.62) -> PartnerLocation:
+    return PartnerLocation(
+        telegram_id=telegram_id,
+        first_name=f"P{telegram_id}",
+        latitude=lat + rng.uniform(-0.5, 0.5),
+        longitude=lon + rng.uniform(-0.5, 0.5),
+        hand=rng.choice(("left", "right", "both", None)),
+        style=rng.choice(("outside", "inside", "both")),
+        weight_kg=rng.choice((None, rng.randint(55, 120))),
+        experience_years=rng.choice((None, rng.randint(0, 10))),
+    )
+
+
+def test_vectorized_top_k_matches_pairwise_scoring():
+    rng = random.Random(3)
+    matrix = ProfileMatrix(capacity=4)  # Несколько раз вырастет
+    profiles = {i: _profile(rng, i) for i in range(600)}
+    for profile in profiles.values():
+        matrix.upsert(profile)
+    for telegram_id in range(0, 600, 7):
+        matrix.remove(telegram_id)
+        del profiles[telegram_id]
+    matrix.upsert(replace(profiles[1], latitude=56.5))  # Переезд
+    profiles[1] = matrix.get(1)
+
+    me = profiles[2]
+    expected = sorted(
+        (penalty, other.telegram_id)
+        for other in profiles.values()
+        if other.telegram_id != me.telegram_id and not isinf(penalty := pair_penalty(me, other, 50))
+    )[:10]
+    result = matrix.top_k(me, 10, max_km=50)
+
+    assert [match.partner.telegram_id for match in result.matches] == [telegram_id for _, telegram_id in expected]
+    assert [round(match.penalty, 9) for match in result.matches] == [round(penalty, 9) for penalty, _ in expected]
+    assert result.threshold == result.matches[-1].penalty
+
+
+def test_profile_change_invalidates_only_affected_cached_results():
+    rng = random.Random(5)
+    service = MatchingService(limit=3, max_km=50, refresh_interval=3600, clock=lambda: 0.0)
+    service._refreshed_at = 0.0  # Индекс заполняем вручную, без БД
+    for telegram_id in range(1, 30):
+        service.index.upsert(_profile(rng, telegram_id))
+    far = PartnerLocation(telegram_id=100, first_name="Far", latitude=59.9, longitude=30.3, hand="both")
+    service.index.upsert(far)
+
+    async def scenario():
+        near_result = await service.matches(1)
+        await service.matches(2)
+        await service.matches(100)
+
+        # Новый профиль в той же точке и с теми же параметрами, что у пользователя 1
+        me = service.index.get(1)
+        service.index.upsert(replace(me, telegram_id=200, first_name="New"))
+        service._on_changed([200])
+        return near_result
+
+    near_result = asyncio.run(scenario())
+    assert near_result.matches
+    assert 1 not in service._cache  # Новый профиль лучше худшего из top-3
+    assert 100 in service._cache  # Далеко: его список не меняется
@@ -0,0 +1,74 @@
+import asyncio
+
+from aiogram import Bot, Dispatcher, Router
+from aiogram.types import Message, Update
+from aiohttp.test_utils import TestClient, TestServer
+
+from bot.middlewares.metrics import setup_metrics
+from bot.middlewares.spam_protection import SpamProtectionMiddleware
+from bot.services.rate_limit import MemoryRateLimiter
+from bot.utils.metrics import UPDATE_LATENCY, Counter, Histogram, MetricsServer, Registry
+
+
+def test_histogram_and_counter_render_prometheus_text():
+    registry = Registry()
+    latency = registry.register(Histogram("demo_seconds", "Demo latency", ("handler",), buckets=(0.1, 1.0)))
+    errors = registry.register(Counter("demo_errors_total", "Demo errors", ("error",)))
+    latency.observe(0.05, handler="start")
+    latency.observe(0.5, handler="start")
+    latency.observe(3, handler="start")
+    errors.inc(error='Bad "quote"')
+
+    text = registry.render()
+
+    assert "# TYPE demo_seconds histogram" in text
+    assert 'demo_seconds_bucket{handler="start",le="0.1"} 1' in text
+    assert 'demo_seconds_bucket{handler="start",le="1"} 2' in text
+    assert 'demo_seconds_bucket{handler="start",le="+Inf"} 3' in text
+    assert 'demo_seconds_count{handler="start"} 3' in text
+    assert 'demo_errors_total{error="Bad \\"quote\\""} 1' in text
+
+
+def test_update_latency_is_labelled_with_router_and_handler():
+    router = Router(name="demo")
+
+    @router.message()
+    async def on_demo_message(message: Message) -> None:
+        pass
+
+    dp = Dispatcher()
+    setup_metrics(dp, SpamProtectionMiddleware(limiter=MemoryRateLimiter(max_keys=10)))
+    dp.include_router(router)
+    update = Update.model_validate({
+        "update_id": 1,
+        "message": {
+            "message_id": 1,
+            "date": 1700000000,
+            "chat": {"id": 1, "type": "private"},
+            "from": {"id": 1, "is_bot": False, "first_name": "Test"},
+            "text": "hi",
+        },
+    })
+    labels = {"event_type": "message", "router": "demo", "handler": "on_demo_message"}
+    before = UPDATE_LATENCY.count(**labels)
+
+    async def scenario():
+        bot = Bot(token="42:TEST")
+        await dp.feed_update(bot, update)
+        client = TestClient(TestServer(MetricsServer(port=0).create_app()))
+        await client.start_server()
+        try:
+            response = await client.get("/metrics")
+            return response.status, await response.text()
+        finally:
+            await client.close()
+            await bot.session.close()
+
+    status, text = asyncio.run(scenario())
+    assert UPDATE_LATENCY.count(**labels) == before + 1
+    assert status == 200
+    assert 'bot_update_duration_seconds_count{event_type="message",router="demo",handler="on_demo_message"}' in text
+    assert "bot_cache_hits_total" in text
+    assert "bot_rate_limit_tracked_keys 0" in text
+    assert "bot_rate_limit_evictions_total 0" in text
+    assert "bot_rate_limit_memory_bytes" in text
@@ -0,0 +1,96 @@
+import asyncio
+import random
+from datetime import datetime
+
+from sqlalchemy import delete, update
+
+from bot.db.models import SparringProfile
+from bot.services import nearby
+from bot.services.nearby import GeoGridIndex, NearbyFilters, PartnerLocation, haversine_km, parse_filters
+
+
+def test_grid_index_matches_brute_force_with_filters():
+    rng = random.Random(7)
+    index = GeoGridIndex(cell_degrees=0.5)
+    partners = [
+        PartnerLocation(
+            telegram_id=i,
+            first_name=f"P{i}",
+            # Кластер у Москвы и точки у линии смены дат
+            latitude=rng.uniform(54, 57) if i % 2 else rng.uniform(-10, 10),
+            longitude=rng.uniform(35, 40) if i % 2 else rng.choice((-1, 1)) * rng.uniform(178, 180),
+            hand=rng.choice(("left", "right", "both")),
+            weight_kg=rng.randint(60, 110),
+        )
+        for i in range(2000)
+    ]
+    for partner in partners:
+        index.upsert(partner)
+    index.remove(1)
+    filters = NearbyFilters(hand="left", weight_class=nearby.weight_class(80))
+
+    for lat, lon in ((55.75, 37.62), (0.0, 179.9), (0.0, -179.9)):
+        expected = sorted(
+            (haversine_km(lat, lon, p.latitude, p.longitude), p.telegram_id)
+            for p in partners
+            if p.telegram_id != 1 and filters.matches(p)
+        )
+        expected = [pair for pair in expected if pair[0] <= 500][:5]
+        found = index.nearest(lat, lon, 5, max_km=500, predicate=filters.matches)
+        assert [p.telegram_id for _, p in found] == [telegram_id for _, telegram_id in expected]
+
+
+def test_parse_filters_defaults_to_own_hand_and_weight_class():
+    me = PartnerLocation(telegram_id=1, first_name="Me", latitude=0, longitude=0, hand="right", weight_kg=78)
+
+    assert parse_filters(None, me) == NearbyFilters(hand="right", weight_class=nearby.weight_class(80))
+    assert parse_filters("левая инсайд 95", me) == NearbyFilters(
+        hand="left", style="inside", weight_class=nearby.weight_class(100),
+    )
+    assert parse_filters("all", me) == NearbyFilters()
+
+
+def test_service_refreshes_incrementally_from_updated_at(sqlite_db):
+    async def scenario():
+        engine, session_factory = await sqlite_db(nearby)
+
+        def profile(telegram_id: int, lat: float, updated_at: datetime, **kwargs) -> SparringProfile:
+            return SparringProfile(
+                id=str(telegram_id), telegram_user_id=str(telegram_id), first_name=f"P{telegram_id}",
+                latitude=lat, longitude=37.6, hand="right", updated_at=updated_at, **kwargs,
+            )
+
+        async with session_factory() as session:
+            session.add_all([
+                profile(1, 55.70, datetime(2024, 1, 1)),
+                profile(2, 55.80, datetime(2024, 1, 1)),
+                profile(3, 55.90, datetime(2024, 1, 1), is_active=False),
+            ])
+            await session.commit()
+
+        service = nearby.NearbyService(backend="memory", refresh_interval=3600)
+        me = await service.locate(1)
+        first = [p.telegram_id for _, p in await service.find(me, NearbyFilters())]
+
+        async with session_factory() as session:
+            await session.execute(update(SparringProfile).where(SparringProfile.id == "2").values(
+                is_active=False, updated_at=datetime(2024, 1, 2)))
+            await session.execute(update(SparringProfile).where(SparringProfile.id == "3").values(
+                is_active=True, updated_at=datetime(2024, 1, 2)))
+            session.add(profile(4, 55.71, datetime(2024, 1, 2)))
+            await session.commit()
+        await service.refresh(force=True)
+        second = [p.telegram_id for _, p in await service.find(me, NearbyFilters())]
+
+        async with session_factory() as session:
+            await session.execute(delete(SparringProfile).where(SparringProfile.id == "4"))
+            await session.commit()
+        await service.on_profiles_changed([4])
+        third = [p.telegram_id for _, p in await service.find(me, NearbyFilters())]
+        await engine.dispose()
+        return first, second, third
+
+    first, second, third = asyncio.run(scenario())
+    assert first == [2]
+    assert second == [4, 3]
+    assert third == [3]
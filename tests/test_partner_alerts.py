@@ -0,0 +1,149 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select
+
+from bot.db.models import JobWatermark, PartnerAlert, SparringProfile
+from bot.services import nearby, partner_alerts
+from bot.services.matching import MatchingService
+
+
+class FakeBot:
+    def __init__(self) -> None:
+        self.sent = []
+
+    async def send_message(self, chat_id: int, text: str, **kwargs) -> None:
+        self.sent.append((chat_id, text))
+
+
+def test_new_profiles_alert_compatible_neighbours_once(sqlite_db):
+    async def scenario():
+        engine, session_factory = await sqlite_db(nearby, partner_alerts)
+
+        def profile(telegram_id: int, lat: float, lon: float, updated_at: datetime, hand: str = "right"):
+            return SparringProfile(
+                id=str(telegram_id), telegram_user_id=str(telegram_id), first_name=f"P{telegram_id}",
+                latitude=lat, longitude=lon, hand=hand, weight_kg=80, experience_years=3, updated_at=updated_at,
+            )
+
+        async with session_factory() as session:
+            session.add_all([
+                profile(1, 55.75, 37.62, datetime(2024, 1, 1)),  # Москва, правша
+                profile(2, 55.76, 37.60, datetime(2024, 1, 1), hand="left"),  # Рядом, но левша
+                profile(3, 59.94, 30.31, datetime(2024, 1, 1)),  # Петербург — далеко
+            ])
+            await session.commit()
+
+        now = [datetime(2024, 1, 2, 12, tzinfo=timezone.utc)]  # 15:00 в Москве
+        job = partner_alerts.PartnerAlertJob(
+            matcher=MatchingService(refresh_interval=3600), max_km=30, clock=lambda: now[0],
+        )
+        bot = FakeBot()
+        first_run = await job.run_once(bot)  # Только ставит метку: старые профили не разбираем
+
+        async with session_factory() as session:
+            session.add(profile(4, 55.74, 37.63, datetime(2024, 1, 2, 13)))
+            await session.commit()
+
+        now[0] = datetime(2024, 1, 2, 21, tzinfo=timezone.utc)  # Полночь в Москве — тихие часы
+        queued = await job.collect()
+        requeued = await job.collect()  # Повторный проход по той же метке дублей не даёт
+        quiet_sent = await job.deliver(bot)
+
+        now[0] = datetime(2024, 1, 3, 9, tzinfo=timezone.utc)
+        sent = await job.deliver(bot)
+        async with session_factory() as session:
+            alerts = (await session.execute(select(PartnerAlert.recipient_id, PartnerAlert.sent_at))).all()
+        await engine.dispose()
+        return first_run, queued, requeued, quiet_sent, sent, alerts, bot.sent
+
+    first_run, queued, requeued, quiet_sent, sent, alerts, messages = asyncio.run(scenario())
+    assert first_run == (0, 0)
+    assert (queued, requeued) == (1, 0)
+    assert quiet_sent == 0
+    assert sent == 1
+    assert [recipient for recipient, _ in alerts] == [1]
+    assert alerts[0][1] is not None
+    assert messages[0][0] == 1 and "P4" in messages[0][1]
+
+
+def test_deliver_skips_recipients_on_cooldown_and_marks_only_sent_pairs(sqlite_db, monkeypatch):
+    async def scenario():
+        engine, session_factory = await sqlite_db(nearby, partner_alerts)
+        monkeypatch.setattr(partner_alerts, "PARTNER_ALERTS_SEND_BATCH", 2)
+
+        now = datetime(2024, 1, 2, 12, tzinfo=timezone.utc)
+        async with session_factory() as session:
+            session.add_all([
+                SparringProfile(
+                    id=str(telegram_id), telegram_user_id=str(telegram_id), first_name=f"P{telegram_id}",
+                    latitude=55.75, longitude=37.62, hand="right", weight_kg=80, experience_years=3,
+                    updated_at=datetime(2024, 1, 1),
+                )
+                for telegram_id in (1, 2, 4, 5, 6)
+            ])
+            session.add_all([
+                # Получатель 1 уже получил уведомление час назад: его старые строки не должны занимать пачку
+                PartnerAlert(recipient_id=1, partner_id=6, created_at=datetime(2024, 1, 1), sent_at=datetime(2024, 1, 2, 11)),
+                PartnerAlert(recipient_id=1, partner_id=4, created_at=datetime(2024, 1, 1, 1)),
+                PartnerAlert(recipient_id=1, partner_id=5, created_at=datetime(2024, 1, 1, 2)),
+                PartnerAlert(recipient_id=2, partner_id=4, created_at=datetime(2024, 1, 2, 1)),
+                PartnerAlert(recipient_id=2, partner_id=5, created_at=datetime(2024, 1, 2, 2)),
+                PartnerAlert(recipient_id=2, partner_id=6, created_at=datetime(2024, 1, 2, 3)),  # Вне пачки
+            ])
+            await session.commit()
+
+        job = partner_alerts.PartnerAlertJob(matcher=MatchingService(refresh_interval=3600), clock=lambda: now)
+        await job.matcher.refresh()
+        bot = FakeBot()
+        sent = await job.deliver(bot)
+        async with session_factory() as session:
+            unsent = (await session.execute(
+                select(PartnerAlert.recipient_id, PartnerAlert.partner_id)
+                .where(PartnerAlert.sent_at.is_(None))
+                .order_by(PartnerAlert.recipient_id, PartnerAlert.partner_id)
+            )).all()
+        await engine.dispose()
+        return sent, bot.sent, [tuple(row) for row in unsent]
+
+    sent, messages, unsent = asyncio.run(scenario())
+    assert sent == 1
+    assert messages[0][0] == 2 and "P4" in messages[0][1] and "P5" in messages[0][1]
+    assert unsent == [(1, 4), (1, 5), (2, 6)]  # Партнёр 6 придёт получателю 2 следующим сообщением
+
+
+def test_collect_rereads_profiles_committed_after_the_watermark_with_older_timestamp(sqlite_db):
+    async def scenario():
+        engine, session_factory = await sqlite_db(nearby, partner_alerts)
+
+        def profile(telegram_id: int, updated_at: datetime):
+            return SparringProfile(
+                id=str(telegram_id), telegram_user_id=str(telegram_id), first_name=f"P{telegram_id}",
+                latitude=55.75, longitude=37.62, hand="right", weight_kg=80, experience_years=3,
+                updated_at=updated_at,
+            )
+
+        async with session_factory() as session:
+            session.add_all([profile(1, datetime(2024, 1, 1)), profile(2, datetime(2024, 1, 2, 13))])
+            await session.commit()
+            session.add(JobWatermark(name=partner_alerts.WATERMARK_NAME, watermark=datetime(2024, 1, 2, 12)))
+            await session.commit()
+
+        job = partner_alerts.PartnerAlertJob(
+            matcher=MatchingService(refresh_interval=3600), max_km=30, lag=timedelta(seconds=60),
+        )
+        first = await job.collect()  # Метка сдвигается на 13:00
+
+        # Транзакция началась в 12:59:30 (now() триггера), а закоммитилась после прогона
+        async with session_factory() as session:
+            session.add(profile(3, datetime(2024, 1, 2, 12, 59, 30)))
+            await session.commit()
+        late = await job.collect()
+        again = await job.collect()
+        await engine.dispose()
+        return first, late, again
+
+    first, late, again = asyncio.run(scenario())
+    assert first == 1  # 1 узнаёт о 2
+    assert late == 2  # 1 и 2 узнают о 3
+    assert again == 0  # Перечитанное окно дублей не даёт
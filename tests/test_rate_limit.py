@@ -0,0 +1,177 @@
+import asyncio
+
+import pytest
+
+from sqlalchemy import func, select
+
+from bot.db.models import RateLimitBucket
+from bot.services import rate_limit
+from bot.services.rate_limit import RateLimit
+
+MESSAGE_LIMIT = RateLimit(5, 60)
+
+
+class FakeClock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_limit_is_decided_locally_and_shared_after_sync(sqlite_db):
+    async def scenario():
+        engine, _ = await sqlite_db(rate_limit)
+        clock = FakeClock()
+        first = rate_limit.WriteBehindRateLimiter(instance_id="a", clock=clock)
+        second = rate_limit.WriteBehindRateLimiter(instance_id="b", clock=clock)
+
+        local = [await first.hit("message", 42, MESSAGE_LIMIT) for _ in range(3)]
+        await first.flush()
+        await first.flush()  # повторный сброс без новых запросов ничего не дублирует
+        await second.sync()
+        shared = [await second.hit("message", 42, MESSAGE_LIMIT) for _ in range(3)]
+        other_scope = await second.hit("callback_query", 42, MESSAGE_LIMIT)
+
+        await first.close()
+        await second.close()
+
+        await engine.dispose()
+        return local, shared, other_scope
+
+    local, shared, other_scope = asyncio.run(scenario())
+    assert local == [True, True, True]
+    assert shared == [True, True, False]
+    assert other_scope is True
+
+
+def test_flush_aggregates_and_prune_drops_expired_buckets(sqlite_db):
+    async def scenario():
+        engine, _ = await sqlite_db(rate_limit)
+        clock = FakeClock()
+        limiter = rate_limit.WriteBehindRateLimiter(instance_id="a", clock=clock)
+        limit = RateLimit(100, 60)
+
+        for _ in range(10):
+            await limiter.hit("message", 7, limit)
+        await limiter.flush()
+        await limiter.hit("message", 7, limit)
+        await limiter.flush()
+
+        async with rate_limit.AsyncSessionLocal() as session:
+            rows = await session.scalar(select(func.count()).select_from(RateLimitBucket))
+            hits = await session.scalar(select(func.sum(RateLimitBucket.hits)))
+
+        clock.now += 600
+        await limiter.prune()
+        async with rate_limit.AsyncSessionLocal() as session:
+            left = await session.scalar(select(func.count()).select_from(RateLimitBucket))
+
+        await limiter.close()
+        await engine.dispose()
+        return rows, hits, left, limiter._local
+
+    rows, hits, left, local = asyncio.run(scenario())
+    assert rows == 1
+    assert hits == 11
+    assert left == 0
+    assert local == {}
+
+
+def test_flush_splits_large_batches_and_requeues_only_unsent_chunks(sqlite_db, monkeypatch):
+    inserts = []
+    real_insert = rate_limit.dialect_insert
+
+    def counting_insert(session, table):
+        inserts.append(table)
+        if len(inserts) == 2:
+            raise OSError("connection lost")  # Вторая часть не дошла до БД
+        return real_insert(session, table)
+
+    monkeypatch.setattr(rate_limit, "dialect_insert", counting_insert)
+
+    async def scenario():
+        engine, _ = await sqlite_db(rate_limit)
+        limiter = rate_limit.WriteBehindRateLimiter(instance_id="a", clock=FakeClock(), flush_chunk=3)
+        for telegram_id in range(7):
+            await limiter.hit("message", telegram_id, MESSAGE_LIMIT)
+        await limiter.flush()
+        requeued = len(limiter._pending)
+        await limiter.flush()
+
+        async with rate_limit.AsyncSessionLocal() as session:
+            rows = await session.scalar(select(func.count()).select_from(RateLimitBucket))
+            hits = await session.scalar(select(func.sum(RateLimitBucket.hits)))
+
+        await limiter.close()
+        await engine.dispose()
+        return requeued, rows, hits
+
+    requeued, rows, hits = asyncio.run(scenario())
+    assert requeued == 4  # Первая часть из трёх строк уже записана
+    assert len(inserts) == 4  # 3 + ошибка, затем 3 + 1
+    assert rows == hits == 7
+
+
+def test_redis_limiter_is_shared_between_workers():
+    fakeredis = pytest.importorskip("fakeredis")
+
+    async def scenario():
+        server = fakeredis.FakeServer()
+        first = rate_limit.RedisRateLimiter(fakeredis.FakeAsyncRedis(server=server))
+        second = rate_limit.RedisRateLimiter(fakeredis.FakeAsyncRedis(server=server))
+
+        results = [await first.hit("message", 1, MESSAGE_LIMIT) for _ in range(3)]
+        results += [await second.hit("message", 1, MESSAGE_LIMIT) for _ in range(3)]
+        other_user = await second.hit("message", 2, MESSAGE_LIMIT)
+        return results, other_user
+
+    results, other_user = asyncio.run(scenario())
+    assert results == [True, True, True, True, True, False]
+    assert other_user is True
+
+
+def test_redis_limiter_falls_back_to_local_when_unreachable():
+    redis_exceptions = pytest.importorskip("redis.exceptions")
+
+    class BrokenScript:
+        calls = 0
+
+        async def __call__(self, keys, args):
+            BrokenScript.calls += 1
+            raise redis_exceptions.ConnectionError("connection refused")
+
+    class BrokenClient:
+        def register_script(self, script):
+            return BrokenScript()
+
+    async def scenario():
+        limiter = rate_limit.RedisRateLimiter(BrokenClient())
+        return [await limiter.hit("message", 1, RateLimit(2, 60)) for _ in range(3)]
+
+    assert asyncio.run(scenario()) == [True, True, False]
+    # После первой ошибки Redis не дёргаем, пока не истечёт пауза
+    assert BrokenScript.calls == 1
+
+
+def test_memory_limiter_evicts_idle_keys_and_respects_cap():
+    clock = FakeClock(now=0.0)
+    limiter = rate_limit.MemoryRateLimiter(max_keys=3, clock=clock)
+    limit = RateLimit(2, 10)
+
+    async def scenario():
+        burst = [await limiter.hit("message", 1, limit) for _ in range(3)]
+        for user_id in range(2, 6):
+            await limiter.hit("message", user_id, limit)
+        capped = limiter.memory_stats()
+
+        clock.now += 60  # все ключи полностью "остыли"
+        await limiter.hit("message", 99, limit)
+        return burst, capped, limiter.memory_stats()
+
+    burst, capped, idle = asyncio.run(scenario())
+    assert burst == [True, True, False]
+    assert capped.tracked_keys == 3
+    assert capped.evicted == 2
+    assert idle.tracked_keys == 1
+    assert idle.approx_bytes > 0
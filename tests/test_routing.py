@@ -0,0 +1,122 @@
+import asyncio
+
+from aiogram import Bot, Dispatcher, Router
+from aiogram.dispatcher.event.bases import SkipHandler
+from aiogram.filters import Command, CommandObject
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.types import Update
+
+from bot.middlewares.routing import setup_exact_routing
+from bot.utils.routing import ExactRouteIndex, ExactText
+
+
+class Waiting(StatesGroup):
+    text = State()
+
+
+TEXTS = (
+    "/profile", "/profile extra args", "👤 Профиль", "⚙️ Админка", "/admin", "/unknown", "hello", "/other",
+    "/skip", "/skip me",
+)
+
+
+def _dispatcher(calls: list, exact: bool) -> Dispatcher:
+    menu, admin, tail = Router(name="menu"), Router(name="admin"), Router(name="tail")
+
+    @menu.message(Command("profile"))
+    async def profile(message, command: CommandObject):
+        calls.append(("profile", command.args))
+
+    @menu.message(ExactText("👤 Профиль"))
+    async def profile_button(message):
+        calls.append(("profile_button", None))
+
+    @menu.message(Command("skip"))
+    async def skip_first(message):
+        calls.append(("skip_first", None))
+        raise SkipHandler()
+
+    @admin.message(Command("admin"))
+    @admin.message(ExactText("⚙️ Админка"))
+    async def panel(message):
+        calls.append(("panel", None))
+
+    @admin.message(Command("skip"))
+    async def skip_second(message, command: CommandObject):
+        calls.append(("skip_second", command.args))
+        if command.args is None:
+            raise SkipHandler()
+
+    @admin.message(Waiting.text)
+    async def waiting(message):
+        calls.append(("waiting", None))
+
+    @tail.message(Command("other"))  # После хендлера состояния — только через обычную цепочку
+    async def other(message):
+        calls.append(("other", None))
+
+    @tail.message()
+    async def fallback(message):
+        calls.append(("fallback", message.text))
+
+    dp = Dispatcher()
+    dp.include_routers(menu, admin, tail)
+    if exact:
+        index = setup_exact_routing(dp)
+        assert index.indexed == 6
+        assert index.stopped_at == "admin:waiting"
+    return dp
+
+
+def _update(bot: Bot, update_id: int, text: str) -> Update:
+    return Update.model_validate({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 1700000000,
+            "chat": {"id": 1, "type": "private"},
+            "from": {"id": 1, "is_bot": False, "first_name": "T"},
+            "text": text,
+        },
+    }, context={"bot": bot})
+
+
+def test_exact_routing_picks_the_same_handler_as_filter_chain():
+    async def scenario(exact: bool) -> list:
+        calls: list = []
+        dp = _dispatcher(calls, exact)
+        bot = Bot(token="42:TEST")
+        for update_id, text in enumerate(TEXTS, 1):
+            await dp.feed_update(bot, _update(bot, update_id, text))
+        await bot.session.close()
+        return calls
+
+    assert asyncio.run(scenario(exact=True)) == asyncio.run(scenario(exact=False)) == [
+        ("profile", None),
+        ("profile", "extra args"),
+        ("profile_button", None),
+        ("panel", None),
+        ("panel", None),
+        ("fallback", "/unknown"),
+        ("fallback", "hello"),
+        ("other", None),
+        # Отказавшийся хендлер не вызывается повторно, следующие кандидаты и цепочка — по порядку
+        ("skip_first", None),
+        ("skip_second", None),
+        ("fallback", "/skip"),
+        ("skip_first", None),
+        ("skip_second", "me"),
+    ]
+
+
+def test_index_is_disabled_when_aiogram_internals_change(monkeypatch):
+    router = Router(name="menu")
+
+    @router.message(ExactText("Профиль"))
+    async def profile(message):
+        pass
+
+    monkeypatch.delattr(router.observers["message"], "_handler")
+    index = ExactRouteIndex.build(router)
+    assert len(index) == 0
+    assert index.stopped_at == "menu (unsupported aiogram version)"
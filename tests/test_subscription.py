@@ -0,0 +1,113 @@
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+from aiogram.enums import ChatMemberStatus
+from aiogram.types import Chat, ChatMemberLeft, ChatMemberMember, ChatMemberUpdated
+from aiogram.types import User as TgUser
+from sqlalchemy import select
+
+from bot.db.models import User
+from bot.services import subscription, user_service
+
+
+class FakeBot:
+    def __init__(self, status=ChatMemberStatus.MEMBER):
+        self.status = status
+        self.calls = 0
+
+    async def get_chat_member(self, chat_id, user_id):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return SimpleNamespace(status=self.status)
+
+
+async def _setup_db(sqlite_db, monkeypatch):
+    engine, session_factory = await sqlite_db(user_service)
+    monkeypatch.setattr(subscription, "CHANNEL_ID", "@testchannel")
+    monkeypatch.setattr(subscription, "PRIVILEGED_IDS", [])
+    user_service._user_cache.clear()
+    subscription._subscription_cache.clear()
+    async with session_factory() as session:
+        session.add(User(telegram_id=7, first_name="Seven"))
+        await session.commit()
+    return engine, session_factory
+
+
+async def _stored_status(session_factory, telegram_id):
+    async with session_factory() as session:
+        return await session.scalar(select(User.subscription_status).where(User.telegram_id == telegram_id))
+
+
+def test_check_subscription_is_cached_and_persisted(sqlite_db, monkeypatch):
+    async def scenario():
+        engine, session_factory = await _setup_db(sqlite_db, monkeypatch)
+        bot = FakeBot()
+        results = await asyncio.gather(*(subscription.check_subscription(bot, 7) for _ in range(5)))
+        again = await subscription.check_subscription(bot, 7)
+        stored = await _stored_status(session_factory, 7)
+        await engine.dispose()
+        return results, again, stored, bot.calls
+
+    results, again, stored, calls = asyncio.run(scenario())
+    assert results == [True] * 5
+    assert again is True
+    assert stored is True
+    assert calls == 1
+
+
+def test_recheck_skips_cached_negative(sqlite_db, monkeypatch):
+    async def scenario():
+        engine, _ = await _setup_db(sqlite_db, monkeypatch)
+        bot = FakeBot(status=ChatMemberStatus.LEFT)
+        first = await subscription.check_subscription(bot, 7)
+        bot.status = ChatMemberStatus.MEMBER
+        cached = await subscription.check_subscription(bot, 7)
+        rechecked = await subscription.check_subscription(bot, 7, recheck=True)
+        await engine.dispose()
+        return first, cached, rechecked, bot.calls
+
+    assert asyncio.run(scenario()) == (False, False, True, 2)
+
+
+def test_persisted_status_answers_without_waiting_for_telegram(sqlite_db, monkeypatch):
+    async def scenario():
+        engine, session_factory = await _setup_db(sqlite_db, monkeypatch)
+        await user_service.set_subscription_status(7, True)
+        user_service._user_cache.clear()
+        bot = FakeBot(status=ChatMemberStatus.LEFT)
+        first = await subscription.check_subscription(bot, 7)
+        await asyncio.sleep(0.05)  # фоновая перепроверка
+        second = await subscription.check_subscription(bot, 7)
+        stored = await _stored_status(session_factory, 7)
+        await engine.dispose()
+        return first, second, stored, bot.calls
+
+    assert asyncio.run(scenario()) == (True, False, False, 1)
+
+
+def test_chat_member_update_refreshes_cache(sqlite_db, monkeypatch):
+    def member_update(new_member):
+        return ChatMemberUpdated(
+            chat=Chat(id=-100, type="channel", username="TestChannel"),
+            from_user=TgUser(id=7, is_bot=False, first_name="Seven"),
+            date=datetime(2026, 1, 1),
+            old_chat_member=ChatMemberLeft(user=TgUser(id=7, is_bot=False, first_name="Seven")),
+            new_chat_member=new_member,
+        )
+
+    async def scenario():
+        engine, session_factory = await _setup_db(sqlite_db, monkeypatch)
+        bot = FakeBot()
+        tg_user = TgUser(id=7, is_bot=False, first_name="Seven")
+        update = member_update(ChatMemberMember(user=tg_user))
+        assert subscription.is_channel_chat(update.chat)
+        await subscription.apply_chat_member_update(update)
+        joined = await subscription.check_subscription(bot, 7)
+        await subscription.apply_chat_member_update(member_update(ChatMemberLeft(user=tg_user)))
+        left = await subscription.check_subscription(bot, 7)
+        stored = await _stored_status(session_factory, 7)
+        await engine.dispose()
+        return joined, left, stored, bot.calls
+
+    assert asyncio.run(scenario()) == (True, False, False, 0)
@@ -0,0 +1,69 @@
+import asyncio
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from bot.supervisor import SECRET_HEADER, create_receiver_app, shard_index, shard_key
+
+
+def test_shard_key_uses_user_then_chat():
+    message = {"update_id": 1, "message": {"from": {"id": 42}, "chat": {"id": 42}}}
+    callback = {"update_id": 2, "callback_query": {"id": "x", "from": {"id": 43}}}
+    channel_post = {"update_id": 3, "channel_post": {"chat": {"id": -100}}}
+    poll = {"update_id": 4, "poll": {"id": "p"}}
+
+    assert shard_key(message) == 42
+    assert shard_key(callback) == 43
+    assert shard_key(channel_post) == -100
+    assert shard_key(poll) == 4
+    assert shard_index(message, 4) == shard_index({"update_id": 9, "edited_message": {"from": {"id": 42}}}, 4)
+
+
+def test_receiver_routes_users_to_the_same_worker():
+    received = {0: [], 1: []}
+
+    def worker_app(index):
+        async def handle(request):
+            assert request.headers[SECRET_HEADER] == "internal"
+            received[index].append((await request.json())["update_id"])
+            return web.json_response({})
+
+        app = web.Application()
+        app.router.add_post("/update", handle)
+        return app
+
+    async def scenario():
+        workers = [TestServer(worker_app(index)) for index in (0, 1)]
+        for server in workers:
+            await server.start_server()
+        app = create_receiver_app(
+            [str(server.make_url("/update")) for server in workers],
+            path="/webhook",
+            secret="public",
+            worker_secret="internal",
+        )
+        async with TestClient(TestServer(app)) as client:
+            rejected = await client.post("/webhook", json={"update_id": 0})
+            statuses = []
+            for update_id, user_id in enumerate((10, 11, 10, 11, 10), start=1):
+                response = await client.post(
+                    "/webhook",
+                    json={"update_id": update_id, "message": {"from": {"id": user_id}}},
+                    headers={SECRET_HEADER: "public"},
+                )
+                statuses.append(response.status)
+            await workers[1].close()
+            down = await client.post(
+                "/webhook",
+                json={"update_id": 9, "message": {"from": {"id": 11}}},
+                headers={SECRET_HEADER: "public"},
+            )
+        await workers[0].close()
+        return rejected.status, statuses, down.status
+
+    rejected, statuses, down = asyncio.run(scenario())
+    assert rejected == 401
+    assert statuses == [200] * 5
+    assert received == {0: [1, 3, 5], 1: [2, 4]}
+    # Воркер недоступен — 503, Telegram пришлёт апдейт повторно
+    assert down == 503
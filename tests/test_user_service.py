@@ -1,40 +1,10 @@
 import asyncio
-from dataclasses import dataclass
 from datetime import datetime
-from time import time
 
-from bot.services import user_service
+from sqlalchemy import event, select, update
 
-
-@dataclass
-class FakeUser:
-    telegram_id: int
-    username: str | None
-    first_name: str | None
-    created_at: datetime
-    subscription_status: bool
-
-
-@dataclass
-class FakeSparringProfile:
-    telegram_user_id: str
-    style: str
-    weight_kg: float | None
-    experience_years: float | None
-    is_active: bool
-
-
-class DummySession:
-    async def __aenter__(self):
-        return self
-
-    async def __aexit__(self, exc_type, exc, tb):
-        return None
-
-
-class DummySessionFactory:
-    def __call__(self):
-        return DummySession()
+from bot.db.models import SparringProfile, User
+from bot.services import profile_feed, user_service
 
 
 def test_get_user_snapshot_cached(monkeypatch):
@@ -47,45 +17,229 @@ def test_get_user_snapshot_cached(monkeypatch):
         subscription_status=False,
         sparring_stats=None
     )
-    user_service._user_cache[1] = (time(), cached_snapshot)
+    user_service._user_cache.set(1, cached_snapshot)
 
-    async def fail_fetch_user(*args, **kwargs):
+    async def fail_fetch_rows(*args, **kwargs):
         raise AssertionError("DB should not be called when cache is valid")
 
-    monkeypatch.setattr(user_service, "_fetch_user", fail_fetch_user)
+    monkeypatch.setattr(user_service, "_fetch_snapshot_rows", fail_fetch_rows)
 
     result = asyncio.run(user_service.get_user_snapshot(1))
     assert result == cached_snapshot
 
 
-def test_get_user_snapshot_fetches_and_caches(monkeypatch):
+def test_get_user_snapshot_fetches_and_caches(sqlite_db):
+    user_service._user_cache.clear()
+
+    async def scenario():
+        engine, session_factory = await sqlite_db(user_service)
+        async with session_factory() as session:
+            session.add(User(telegram_id=99, username="tester", first_name="Test", created_at=datetime(2024, 1, 1)))
+            session.add(SparringProfile(
+                id="p",
+                telegram_user_id="99",
+                first_name="Test",
+                style="both",
+                weight_kg=70,
+                experience_years=3,
+                is_active=True,
+            ))
+            await session.commit()
+        result = await user_service.get_user_snapshot(99)
+        await engine.dispose()
+        return result
+
+    result = asyncio.run(scenario())
+
+    assert result is not None
+    assert result.telegram_id == 99
+    assert result.sparring_stats == "Универсал, 70кг, стаж 3г"
+    assert 99 in user_service._user_cache
+
+
+def test_get_user_snapshots_uses_cache_and_one_query(sqlite_db, monkeypatch):
+    user_service._user_cache.clear()
+    queries = []
+
+    async def scenario():
+        engine, session_factory = await sqlite_db(user_service)
+        async with session_factory() as session:
+            session.add_all(User(telegram_id=telegram_id, first_name=str(telegram_id)) for telegram_id in (1, 2, 3))
+            await session.commit()
+
+        original = user_service._fetch_snapshot_rows
+
+        async def counting_fetch(session, telegram_ids):
+            queries.append(list(telegram_ids))
+            return await original(session, telegram_ids)
+
+        monkeypatch.setattr(user_service, "_fetch_snapshot_rows", counting_fetch)
+        await user_service.get_user_snapshot(1)
+        result = await user_service.get_user_snapshots([1, 2, 3, 4])
+        again = await user_service.get_user_snapshots([2, 4])
+        await engine.dispose()
+        return result, again
+
+    result, again = asyncio.run(scenario())
+    assert sorted(result) == [1, 2, 3]
+    assert result[2].first_name == "2"
+    assert result[1].sparring_stats is None
+    assert sorted(again) == [2]
+    assert queries == [[1], [2, 3, 4]]
+
+
+def test_get_user_snapshots_splits_misses_into_chunks(sqlite_db, monkeypatch):
+    user_service._user_cache.clear()
+    monkeypatch.setattr(user_service, "USER_SNAPSHOT_CHUNK", 2)
+    queries = []
+
+    async def scenario():
+        engine, session_factory = await sqlite_db(user_service)
+        async with session_factory() as session:
+            session.add_all(User(telegram_id=telegram_id, first_name=str(telegram_id)) for telegram_id in (1, 2, 3, 4, 5))
+            await session.commit()
+
+        original = user_service._fetch_snapshot_rows
+
+        async def counting_fetch(session, telegram_ids):
+            queries.append(list(telegram_ids))
+            return await original(session, telegram_ids)
+
+        monkeypatch.setattr(user_service, "_fetch_snapshot_rows", counting_fetch)
+        result = await user_service.get_user_snapshots([1, 2, 3, 4, 5, 6])
+        await engine.dispose()
+        return result
+
+    result = asyncio.run(scenario())
+    assert sorted(result) == [1, 2, 3, 4, 5]
+    assert queries == [[1, 2], [3, 4], [5, 6]]
+    assert user_service._user_cache.peek(6) == (True, None)
+
+
+def test_get_or_create_user_writes_through_cache(sqlite_db):
     user_service._user_cache.clear()
-    monkeypatch.setattr(user_service, "AsyncSessionLocal", DummySessionFactory())
 
-    async def fake_fetch_user(session, telegram_id):
-        return FakeUser(
-            telegram_id=telegram_id,
-            username="tester",
-            first_name="Test",
+    async def scenario():
+        engine, session_factory = await sqlite_db(user_service)
+        async with session_factory() as session:
+            session.add(User(telegram_id=5, username="old", first_name="Old"))
+            await session.commit()
+
+        user_service._user_cache.set(5, user_service.UserSnapshot(
+            telegram_id=5,
+            username="old",
+            first_name="Old",
             created_at=datetime(2024, 1, 1),
-            subscription_status=False
-        )
+            subscription_status=False,
+            sparring_stats="Инсайд, 80кг, стаж 2г",
+        ))
+        user_service._user_cache.set(6, None)  # закэшированное "не найден"
 
-    async def fake_fetch_sparring_profile(session, telegram_id):
-        return FakeSparringProfile(
-            telegram_user_id=str(telegram_id),
-            style="both",
-            weight_kg=70.0,
-            experience_years=3.5,
-            is_active=True
-        )
+        await user_service.get_or_create_user(5, username="new", first_name="New")
+        await user_service.get_or_create_user(6, username="fresh", first_name="Fresh")
+        await engine.dispose()
 
-    monkeypatch.setattr(user_service, "_fetch_user", fake_fetch_user)
-    monkeypatch.setattr(user_service, "_fetch_sparring_profile", fake_fetch_sparring_profile)
+    asyncio.run(scenario())
+    cached = user_service._user_cache.get(5)
+    assert cached.username == "new"
+    assert cached.first_name == "New"
+    assert cached.sparring_stats == "Инсайд, 80кг, стаж 2г"
+    assert 6 not in user_service._user_cache
 
-    result = asyncio.run(user_service.get_user_snapshot(99))
 
-    assert result is not None
-    assert result.telegram_id == 99
-    assert result.sparring_stats == "Универсал, 70.0кг, стаж 3.5г"
-    assert 99 in user_service._user_cache
+def test_profile_feed_poll_invalidates_changed_profiles(sqlite_db):
+    user_service._user_cache.clear()
+
+    async def scenario():
+        engine, session_factory = await sqlite_db(profile_feed)
+        feed = profile_feed.SparringProfileFeed(mode="poll")
+        feed._watermark = datetime(2024, 1, 1)
+        async with session_factory() as session:
+            session.add_all([
+                SparringProfile(id="a", telegram_user_id="7", first_name="A", updated_at=datetime(2023, 12, 31)),
+                SparringProfile(id="b", telegram_user_id="8", first_name="B", updated_at=datetime(2024, 1, 2)),
+            ])
+            await session.commit()
+
+        for telegram_id in (7, 8):
+            user_service._user_cache.set(telegram_id, user_service.UserSnapshot(
+                telegram_id=telegram_id,
+                username=None,
+                first_name=None,
+                created_at=datetime(2024, 1, 1),
+                subscription_status=False,
+            ))
+
+        changed = await feed.poll_once()
+        # Транзакция началась раньше (now() триггера), а закоммитилась после опроса
+        async with session_factory() as session:
+            session.add(SparringProfile(
+                id="c", telegram_user_id="9", first_name="C", updated_at=datetime(2024, 1, 1, 23, 59, 30),
+            ))
+            await session.commit()
+        late = await feed.poll_once()
+        await engine.dispose()
+        return changed, late
+
+    changed, late = asyncio.run(scenario())
+    assert changed == [8]
+    assert late == [9, 8]  # Окно назад: поздняя строка не потеряна, повторный сброс 8 безвреден
+    assert 7 in user_service._user_cache
+    assert 8 not in user_service._user_cache
+
+
+def test_get_or_create_user_is_one_upsert_and_skips_recently_seen(sqlite_db):
+    user_service._user_cache.clear()
+    user_service._recently_seen.clear()
+    statements = []
+
+    async def scenario():
+        engine, session_factory = await sqlite_db(user_service)
+        async with session_factory() as session:
+            session.add(User(telegram_id=8, username="same", first_name="Same", is_blocked=True))
+            await session.commit()
+        event.listen(engine.sync_engine, "before_cursor_execute",
+                     lambda conn, cursor, statement, *args: statements.append(statement.split()[0].upper()))
+
+        # Одновременные /start нового пользователя не падают на уникальном индексе
+        created = await asyncio.gather(*(user_service.get_or_create_user(7, "new", "New") for _ in range(3)))
+        statements.clear()
+        await user_service.get_or_create_user(7, "new", "New")  # Недавно видели — без БД
+        skipped = list(statements)
+        await user_service.get_or_create_user(8, "same", "Same")
+        await user_service.mark_users_blocked([7])
+        await user_service.get_or_create_user(7, "new", "New")  # Снова пишет — снимаем флаг
+        writes = list(statements)
+        async with session_factory() as session:
+            users = (await session.execute(
+                select(User.telegram_id, User.is_blocked).order_by(User.telegram_id)
+            )).all()
+        await engine.dispose()
+        return created, skipped, writes, users
+
+    created, skipped, writes, users = asyncio.run(scenario())
+    assert created == [True, True, True]
+    assert skipped == []
+    assert [tuple(user) for user in users] == [(7, False), (8, False)]
+    assert writes == ["INSERT", "UPDATE", "INSERT"]  # upsert, mark_users_blocked, upsert — без SELECT
+
+
+def test_supervisor_mode_start_clears_block_set_by_another_worker(sqlite_db, monkeypatch):
+    user_service._user_cache.clear()
+    user_service._recently_seen.clear()
+    monkeypatch.setattr(user_service, "SKIP_RECENTLY_SEEN", False)
+
+    async def scenario():
+        engine, session_factory = await sqlite_db(user_service)
+        await user_service.get_or_create_user(9, "w", "Worker")
+        # Рассылка другого воркера: его _recently_seen этот процесс не видит
+        async with session_factory() as session:
+            await session.execute(update(User).where(User.telegram_id == 9).values(is_blocked=True))
+            await session.commit()
+        await user_service.get_or_create_user(9, "w", "Worker")
+        async with session_factory() as session:
+            blocked = await session.scalar(select(User.is_blocked).where(User.telegram_id == 9))
+        await engine.dispose()
+        return blocked
+
+    assert asyncio.run(scenario()) is False
@@ -0,0 +1,88 @@
+import asyncio
+
+from aiogram import Bot, Dispatcher, Router
+from aiogram.types import Message
+from aiohttp.test_utils import TestClient, TestServer
+
+from bot.webhook import WEBHOOK_HANDLER_KEY, create_webhook_app, resolve_allowed_updates
+
+SECRET = "test-secret"
+
+
+def _update(update_id: int, text: str) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 1700000000,
+            "chat": {"id": 1, "type": "private"},
+            "from": {"id": 1, "is_bot": False, "first_name": "Test"},
+            "text": text,
+        },
+    }
+
+
+def _dispatcher(handled: list, delay: float = 0.0) -> Dispatcher:
+    router = Router()
+
+    @router.message()
+    async def on_message(message: Message) -> None:
+        await asyncio.sleep(delay)
+        handled.append(message.text)
+
+    dp = Dispatcher()
+    dp.include_router(router)
+    return dp
+
+
+def test_webhook_accepts_updates_with_secret_only():
+    handled = []
+
+    async def scenario():
+        bot = Bot(token="42:TEST")
+        app = create_webhook_app(bot, _dispatcher(handled), path="/webhook", secret=SECRET)
+        async with TestClient(TestServer(app)) as client:
+            rejected = await client.post("/webhook", json=_update(1, "no secret"))
+            accepted = await client.post(
+                "/webhook",
+                json=_update(2, "hello"),
+                headers={"X-Telegram-Bot-Api-Secret-Token": SECRET},
+            )
+            health = await client.get("/health")
+            health_body = await health.json()
+            await asyncio.sleep(0.05)
+        return rejected.status, accepted.status, health.status, health_body
+
+    rejected, accepted, health, health_body = asyncio.run(scenario())
+    assert rejected == 401
+    assert accepted == 200
+    assert health == 200
+    assert health_body["status"] == "ok"
+    assert handled == ["hello"]
+
+
+def test_webhook_shutdown_drains_in_flight_updates():
+    handled = []
+
+    async def scenario():
+        bot = Bot(token="42:TEST")
+        app = create_webhook_app(bot, _dispatcher(handled, delay=0.1), path="/webhook", secret="", drain_timeout=5)
+        client = TestClient(TestServer(app))
+        await client.start_server()
+        for update_id in range(3):
+            response = await client.post("/webhook", json=_update(update_id, f"m{update_id}"))
+            assert response.status == 200
+        assert app[WEBHOOK_HANDLER_KEY].in_flight == 3
+        await client.close()
+        return app[WEBHOOK_HANDLER_KEY]
+
+    handler = asyncio.run(scenario())
+    assert sorted(handled) == ["m0", "m1", "m2"]
+    assert handler.draining
+    assert handler.in_flight == 0
+
+
+def test_allowed_updates_from_env_or_handlers():
+    dp = _dispatcher([])
+    assert resolve_allowed_updates(dp, "message, chat_member") == ["message", "chat_member"]
+    assert resolve_allowed_updates(dp, "") == ["message"]